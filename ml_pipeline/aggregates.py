@@ -0,0 +1,84 @@
+import pandas as pd
+import numpy as np
+
+# Bet with (stake - payout) above this counts as a major loss (cooling-off feature)
+MAJOR_LOSS = 1000
+
+# Mergeable per-player partials: how each column combines across chunks
+MERGE_OPS = {
+    'dep_sum': 'sum', 'dep_count': 'sum', 'dep_max': 'max',
+    'wd_sum': 'sum', 'wd_count': 'sum',
+    'stake_sum': 'sum', 'payout_sum': 'sum',
+    'last_major_loss': 'max',
+}
+
+def _empty_state():
+    state = pd.DataFrame({c: pd.Series(dtype=float) for c in MERGE_OPS})
+    state['last_major_loss'] = pd.Series(dtype='datetime64[ns]')
+    state.index.name = 'player_id'
+    return state
+
+def partial_aggregates(events):
+    """Per-player partial aggregates for one chunk of events."""
+    is_dep = (events['event_type'] == 'deposit').values
+    is_wd = (events['event_type'] == 'withdrawal').values
+    is_bet = (events['event_type'] == 'bet').values
+    is_major_loss = is_bet & ((events['stake_amount'] - events['payout_amount']).values > MAJOR_LOSS)
+
+    # Mask out non-matching rows so one groupby pass covers every aggregate
+    dep = events['deposit_amount'].where(is_dep)
+    frame = pd.DataFrame({
+        'player_id': events['player_id'].values,
+        'dep_sum': dep.fillna(0).values,
+        'dep_count': is_dep.astype(np.int64),
+        'dep_max': dep.values,
+        'wd_sum': events['withdrawal_amount'].where(is_wd, 0).values,
+        'wd_count': is_wd.astype(np.int64),
+        'stake_sum': events['stake_amount'].where(is_bet, 0).values,
+        'payout_sum': events['payout_amount'].where(is_bet, 0).values,
+        'last_major_loss': events['event_timestamp'].where(is_major_loss).values,
+    })
+    return frame.groupby('player_id', sort=False).agg(MERGE_OPS)
+
+class PlayerAggregates:
+    """
+    Lifetime per-player aggregates that can be updated chunk by chunk and merged.
+    Memory is bounded by the number of players, not the number of events.
+    Means are kept as sum/count and only divided out in finalize().
+    """
+    def __init__(self, state=None):
+        self.state = _empty_state() if state is None else state
+
+    def update(self, events):
+        if len(events):
+            self.merge(PlayerAggregates(partial_aggregates(events)))
+        return self
+
+    def merge(self, other):
+        if self.state.empty:
+            self.state = other.state.copy()
+        elif not other.state.empty:
+            combined = pd.concat([self.state, other.state])
+            self.state = combined.groupby(level=0, sort=False).agg(MERGE_OPS)
+        return self
+
+    def financial_features(self, players):
+        """Same table as feature_engineering.compute_financial_features."""
+        st = self.state
+        fin = pd.DataFrame(index=st.index)
+        fin['total_deposits'] = st['dep_sum']
+        fin['num_deposits_lt'] = st['dep_count']
+        fin['avg_deposit_amount_lt'] = st['dep_sum'] / st['dep_count'].replace(0, np.nan)
+        fin['max_deposit'] = st['dep_max']
+        fin['total_withdrawals'] = st['wd_sum']
+        fin['num_withdrawals'] = st['wd_count']
+        fin['avg_withdrawal'] = st['wd_sum'] / st['wd_count'].replace(0, np.nan)
+        fin['total_stakes'] = st['stake_sum']
+        fin['ggr'] = st['stake_sum'] - st['payout_sum']
+
+        df = players[['player_id']].merge(fin, left_on='player_id', right_index=True, how='left').fillna(0)
+        df['net_deposits'] = df['total_deposits'] - df['total_withdrawals']
+        return df.reset_index(drop=True)
+
+    def last_major_loss(self):
+        return self.state['last_major_loss'].dropna()
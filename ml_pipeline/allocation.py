@@ -0,0 +1,213 @@
+import time
+import numpy as np
+from .utils import get_logger
+
+logger = get_logger("allocation")
+
+# Budget-constrained promo allocation over the full player x promo matrix.
+#
+#   maximize   sum_ij x_ij v_ij          v: expected engagements (after CRG)
+#   subject to sum_i x_ij c_ij <= B_j    per-promo budget on expected cost
+#              sum_j x_ij <= K_i         per-player offer limit, x binary
+#
+# Lagrangian relaxation of the budgets: with one price lambda_j per promo,
+# players decouple - each takes its K_i best offers by v - lambda c, if
+# positive. Prices are set one promo at a time (exactly: sort the players
+# by how much lambda_j they would tolerate and cut at the budget), sweeping
+# until they settle, on a sample of players with pro-rated budgets - prices
+# are aggregate quantities, so a hundred thousand players pin them
+# down. All players are then assigned at those prices, promos still over
+# budget are trimmed, and leftover budget is filled greedily.
+
+# Expected reward cost (EUR) of one claimed offer, by promo type
+PROMO_COSTS = {
+    "AccaInsurance": 10.0, "Mission": 5.0, "Activation": 8.0, "Cashback": 12.0,
+    "ReloadBonus": 15.0, "DepositAndGet": 20.0, "ReAcquisition": 10.0,
+}
+
+def expected_costs(probs, promo_types, promo_costs=PROMO_COSTS):
+    """(n, k) expected cost of each offer: reward cost x engagement probability."""
+    return probs * np.array([promo_costs[p] for p in promo_types])[None, :]
+
+def _sorted_desc(r):
+    """Rows sorted descending, padded with a -inf column (so index K is always valid)."""
+    out = np.full((r.shape[0], r.shape[1] + 1), -np.inf)
+    out[:, :-1] = -np.sort(-r, axis=1)
+    return out
+
+def _bar(r, s, limit, j):
+    """
+    What offer j has to beat for each player to be picked: the limit-th best
+    of the player's other reduced values, floored at 0 (inf when limit is 0).
+    """
+    rows = np.arange(len(r))
+    kth = s[rows, np.maximum(limit - 1, 0)]
+    bar = np.where(r[:, j] >= kth, s[rows, limit], kth)
+    return np.where(limit > 0, np.maximum(bar, 0), np.inf)
+
+def _price(v, c, bar, budget):
+    """Smallest lambda >= 0 at which the players picking this promo fit its budget."""
+    want = v > bar
+    if c[want].sum() <= budget:
+        return 0.0
+    with np.errstate(divide='ignore'):
+        tolerance = (v[want] - bar[want]) / c[want] # inf for free offers
+    order = np.argsort(-tolerance)
+    fits = np.searchsorted(np.cumsum(c[want][order]), budget, side='right')
+    return float(tolerance[order[fits]])
+
+def _top_picks(r, limit, width):
+    """(n, width) promo indices by descending r, -1 past the player's limit or r <= 0."""
+    order = np.argsort(-r, axis=1, kind='stable')[:, :width]
+    keep = (np.take_along_axis(r, order, axis=1) > 0) & (np.arange(width)[None, :] < limit[:, None])
+    return np.where(keep, order, -1)
+
+def _prices(values, costs, budgets, limit, max_sweeps, tol):
+    """Coordinate-wise Lagrange prices for the capped promos, and the sweeps it took."""
+    lam = np.zeros(values.shape[1])
+    capped = np.flatnonzero(np.isfinite(budgets))
+    if not len(capped):
+        return lam, 0
+    for sweep in range(1, max_sweeps + 1):
+        prev = lam.copy()
+        for j in capped:
+            r = values - lam * costs
+            lam[j] = _price(values[:, j], costs[:, j], _bar(r, _sorted_desc(r), limit, j), budgets[j])
+        if np.allclose(lam, prev, rtol=tol, atol=tol * max(1.0, lam.max())):
+            break
+    return lam, sweep
+
+def _spend(picks, costs, k):
+    rows = np.arange(len(picks))[:, None]
+    taken = picks >= 0
+    return np.bincount(picks[taken], weights=costs[rows, np.maximum(picks, 0)][taken], minlength=k)
+
+def _fill(picks, values, costs, budgets, limit):
+    """Leftover budget to the best remaining offers by value per cost, one per player per round."""
+    n, k = values.shape
+    rows = np.arange(n)
+    for _ in range(k):
+        left = budgets - _spend(picks, costs, k)
+        n_taken = (picks >= 0).sum(axis=1)
+        held = np.zeros((n, k), dtype=bool)
+        held[np.nonzero(picks >= 0)[0], picks[picks >= 0]] = True
+        open_ = (values > 0) & ~held & (n_taken < limit)[:, None] & (costs <= left[None, :])
+        best = np.argmax(np.where(open_, values, -np.inf), axis=1)
+        who = np.flatnonzero(open_[rows, best])
+        if not len(who):
+            break
+        j, c = best[who], costs[who, best[who]]
+        with np.errstate(divide='ignore'):
+            order = np.lexsort((-(values[who, j] / c), j)) # by promo, best value per cost first
+        j_sorted, c_sorted = j[order], c[order]
+        cum = np.cumsum(c_sorted)
+        group_start = np.searchsorted(j_sorted, j_sorted, side='left')
+        within = cum - np.concatenate([[0], cum])[group_start] # spend up to here within the promo
+        accept = order[within <= left[j_sorted]]
+        if not len(accept):
+            break
+        slot = np.argmax(picks[who[accept]] < 0, axis=1)
+        picks[who[accept], slot] = j[accept]
+    return picks
+
+def allocate(values, costs, budgets, max_per_player=3, max_sweeps=20, tol=1e-4, sample=100000,
+             seed=0, promo_types=None):
+    """
+    values, costs: (n, k) arrays; budgets: (k,) (np.inf = uncapped);
+    max_per_player: int or (n,) array. Prices are fitted on `sample` players.
+    Returns (picks, report): picks is (n, max limit) promo indices ordered
+    by value, -1 padded.
+    """
+    start = time.perf_counter()
+    values = np.asarray(values, dtype=np.float64)
+    costs = np.asarray(costs, dtype=np.float64)
+    budgets = np.asarray(budgets, dtype=np.float64)
+    n, k = values.shape
+    limit = np.minimum(np.broadcast_to(np.asarray(max_per_player, dtype=np.int64), (n,)), k)
+    width = int(limit.max()) if n else 0
+    capped = np.flatnonzero(np.isfinite(budgets))
+
+    sub = np.arange(n)
+    if n > sample:
+        sub = np.sort(np.random.default_rng(seed).choice(n, sample, replace=False))
+    lam, sweeps = _prices(values[sub], costs[sub], budgets * len(sub) / max(n, 1), limit[sub], max_sweeps, tol)
+
+    r = values - lam * costs
+    picks = _top_picks(r, limit, width)
+    # Dual bound: no allocation within the budgets can beat this
+    bound = float(np.where(picks >= 0, np.take_along_axis(r, np.maximum(picks, 0), axis=1), 0).sum()
+                  + (lam[capped] * budgets[capped]).sum())
+
+    # Ties and price steps can leave a promo slightly over: drop its
+    # least valuable offers per unit cost until it fits
+    rows = np.arange(n)[:, None]
+    for j in capped:
+        held = np.flatnonzero((picks == j).any(axis=1))
+        spend = costs[held, j]
+        if spend.sum() <= budgets[j]:
+            continue
+        with np.errstate(divide='ignore'):
+            order = np.argsort(-(values[held, j] / spend), kind='stable')
+        over = np.cumsum(spend[order]) > budgets[j]
+        drop = held[order[over]]
+        picks[drop] = np.where(picks[drop] == j, -1, picks[drop])
+    picks = _fill(picks, values, costs, budgets, limit)
+
+    # Order each player's offers by value (best first, empty slots last)
+    picked_values = np.where(picks >= 0, values[rows, np.maximum(picks, 0)], -np.inf)
+    picks = np.take_along_axis(picks, np.argsort(-picked_values, axis=1, kind='stable'), axis=1)
+
+    taken = picks >= 0
+    picked = picks[taken]
+    picked_values = values[rows, np.maximum(picks, 0)][taken]
+    engagements = np.bincount(picked, weights=picked_values, minlength=k)
+    spend = _spend(picks, costs, k)
+    offers = np.bincount(picked, minlength=k)
+    plan = float(picked_values.sum())
+    top = _sorted_desc(np.maximum(values, 0))[:, :k]
+    unconstrained = float(np.where(np.arange(k)[None, :] < limit[:, None], top, 0).sum())
+    names = list(promo_types) if promo_types is not None else [str(j) for j in range(k)]
+    per_promo = {}
+    for j, name in enumerate(names):
+        per_promo[name] = {
+            'offers': int(offers[j]),
+            'expected_engagements': float(engagements[j]),
+            'expected_spend': float(spend[j]),
+            'budget': float(budgets[j]) if np.isfinite(budgets[j]) else None,
+            'shadow_price': float(lam[j]),
+        }
+    report = {
+        'players': n,
+        'offers': int(taken.sum()),
+        'players_reached': int(taken.any(axis=1).sum()),
+        'expected_engagements': plan,
+        'unconstrained_engagements': unconstrained,
+        'engagements_given_up': unconstrained - plan,
+        'given_up_pct': (unconstrained - plan) / unconstrained if unconstrained > 0 else 0.0,
+        'dual_bound': bound,
+        'optimality_gap': (bound - plan) / bound if bound > 0 else 0.0,
+        'sweeps': sweeps,
+        'price_sample': len(sub),
+        'seconds': time.perf_counter() - start,
+        'promos': per_promo,
+    }
+    return picks, report
+
+def parse_budgets(specs, promo_types):
+    """["Cashback=5000", ...] -> (k,) budget vector, np.inf where none is given."""
+    budgets = np.full(len(promo_types), np.inf)
+    for spec in specs or []:
+        name, _, amount = spec.partition("=")
+        if name not in promo_types:
+            raise ValueError(f"Unknown promo type in budget: {name}")
+        budgets[promo_types.index(name)] = float(amount)
+    return budgets
+
+def log_report(report):
+    logger.info(f"Allocated {report['offers']} offers to {report['players_reached']} of {report['players']} players "
+                f"in {report['seconds']:.2f}s ({report['sweeps']} sweeps)")
+    logger.info(f"Expected engagements {report['expected_engagements']:,.1f} vs {report['unconstrained_engagements']:,.1f} "
+                f"unconstrained top-k (-{report['given_up_pct']:.1%}), within {report['optimality_gap']:.2%} of the bound")
+    for name, p in report['promos'].items():
+        budget = f"{p['budget']:,.0f}" if p['budget'] is not None else "uncapped"
+        logger.info(f"  {name:<14} {p['offers']:>9} offers  spend {p['expected_spend']:>12,.0f} / {budget}")
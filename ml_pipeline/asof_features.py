@@ -0,0 +1,152 @@
+import pandas as pd
+import numpy as np
+from datetime import timedelta
+from .utils import get_logger
+from .aggregates import MAJOR_LOSS
+from .feature_engineering import BURST_WINDOW, SESSION_GAP
+from . import risk_kernels as rk
+from .compact import BET, DEPOSIT, WITHDRAWAL, PlayerIndex, ensure_compact
+
+logger = get_logger("asof_features")
+
+# Longest lookback any as-of query subtracts from a promo timestamp
+_MAX_WINDOW = timedelta(days=30)
+
+FINANCIAL_COLUMNS = [
+    'total_deposits', 'num_deposits_lt', 'avg_deposit_amount_lt', 'max_deposit',
+    'total_withdrawals', 'num_withdrawals', 'avg_withdrawal', 'total_stakes', 'ggr', 'net_deposits',
+]
+RISK_COLUMNS = ['loss_ratio_7d', 'deposit_burst_flag', 'hours_since_major_loss', 'avg_session_duration_30d']
+
+def _ns(ts):
+    return ts.values.astype('datetime64[ns]').astype(np.int64)
+
+def _window_sum(prefix, lo, hi):
+    """Sum of the underlying values over [lo, hi) from a 0-prefixed cumsum."""
+    return prefix[hi] - prefix[lo]
+
+def compute_asof_features(players, events, promos, index=None):
+    """
+    Financial and risk features for every promo row, as of its promo_timestamp
+    (events at or before it only), so training rows never see the future.
+    Features match compute_financial_features / compute_risk_features
+    evaluated at that time, up to ms timestamp resolution.
+
+    Events are sorted once by (player, time); each promo is located with a
+    searchsorted on the shared composite key and windows are differences of
+    cumulative sums, so cost is O((events + promos) log events).
+    """
+    logger.info(f"Computing as-of features for {len(promos)} promos...")
+    if index is None:
+        index = PlayerIndex.from_players(players)
+    events, index = ensure_compact(events, index)
+    e_codes = events['player_idx'].values
+    p_codes = index.encode(promos['player_id'])
+    e_ts, p_ts = _ns(events['event_timestamp']), _ns(promos['promo_timestamp'])
+
+    order = rk.sort_order(e_codes, e_ts)
+    e_codes, e_ts = e_codes[order], e_ts[order]
+    etype = events['event_code'].values[order]
+    dep = events['deposit_amount'].values[order]
+    wd = events['withdrawal_amount'].values[order]
+    stake = events['stake_amount'].values[order]
+    payout = events['payout_amount'].values[order]
+    is_dep, is_wd, is_bet = etype == DEPOSIT, etype == WITHDRAWAL, etype == BET
+
+    space = rk.key_space([e_ts, p_ts], len(index), pad_ms=_MAX_WINDOW // timedelta(milliseconds=1))
+    e_key = rk.composite_key(e_codes, e_ts, space=space)
+    p_key = rk.composite_key(p_codes, p_ts, space=space)
+    player_start = (p_codes.astype(np.int64) << space[1])
+    ms = lambda td: td // timedelta(milliseconds=1)
+
+    def locate(keys, query, side='right'):
+        return np.searchsorted(keys, query, side=side)
+
+    # Events of the promo's player at or before the promo: [first, upto)
+    first = locate(e_key, player_start, 'left')
+    upto = locate(e_key, p_key)
+
+    def prefix(values):
+        return np.concatenate([[0], np.cumsum(values)])
+
+    # --- Financial (lifetime up to the promo) ---
+    dep_n = _window_sum(prefix(is_dep), first, upto)
+    wd_n = _window_sum(prefix(is_wd), first, upto)
+    dep_sum = _window_sum(prefix(np.where(is_dep, dep, 0)), first, upto)
+    wd_sum = _window_sum(prefix(np.where(is_wd, wd, 0)), first, upto)
+    stake_sum = _window_sum(prefix(np.where(is_bet, stake, 0)), first, upto)
+    payout_sum = _window_sum(prefix(np.where(is_bet, payout, 0)), first, upto)
+    running_max = pd.Series(np.where(is_dep, dep, 0)).groupby(e_codes).cummax().values
+    has_events = upto > first
+    max_dep = np.where(has_events, running_max[np.maximum(upto - 1, 0)], 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        feats = {
+            'total_deposits': dep_sum,
+            'num_deposits_lt': dep_n.astype(float),
+            'avg_deposit_amount_lt': np.where(dep_n > 0, dep_sum / dep_n, 0),
+            'max_deposit': max_dep,
+            'total_withdrawals': wd_sum,
+            'num_withdrawals': wd_n.astype(float),
+            'avg_withdrawal': np.where(wd_n > 0, wd_sum / wd_n, 0),
+            'total_stakes': stake_sum,
+            'ggr': stake_sum - payout_sum,
+            'net_deposits': dep_sum - wd_sum,
+        }
+
+    # --- Loss ratio over (t - 7d, t] ---
+    lo_7d = locate(e_key, p_key - ms(timedelta(days=7)))
+    bets_7d = _window_sum(prefix(is_bet), lo_7d, upto)
+    stakes_7d = _window_sum(prefix(np.where(is_bet, stake, 0)), lo_7d, upto)
+    payouts_7d = _window_sum(prefix(np.where(is_bet, payout, 0)), lo_7d, upto)
+    loss_ratio = (stakes_7d - payouts_7d) / (stakes_7d + 1e-6)
+
+    # --- Deposit burst: max deposits in a trailing 24h window ending in (t - 7d, t] ---
+    d_key, d_codes, d_ts = e_key[is_dep], e_codes[is_dep], e_ts[is_dep]
+    trailing = rk.trailing_window_counts(d_codes, d_ts, BURST_WINDOW.value).astype(np.int32)
+    table = rk.sparse_table(trailing)
+    d_upto = locate(d_key, p_key)
+    d_lo_7d = locate(d_key, p_key - ms(timedelta(days=7)))
+    d_lo_6d = locate(d_key, p_key - ms(timedelta(days=6)))
+    # Windows ending in the first day are clipped at t - 7d, and grow with their end
+    first_day = np.minimum(d_lo_6d, d_upto) - d_lo_7d
+    later = rk.range_max(table, np.maximum(d_lo_6d, d_lo_7d), d_upto)
+    burst = np.maximum(first_day, later)
+
+    # --- Hours since the last major loss at or before t ---
+    major = is_bet & ((stake - payout) > MAJOR_LOSS)
+    m_key, m_ts = e_key[major], e_ts[major]
+    m_idx = locate(m_key, p_key) - 1
+    m_first = locate(m_key, player_start, 'left')
+    has_loss = m_idx >= m_first
+    hours = np.where(has_loss, (p_ts - m_ts[np.maximum(m_idx, 0)]) / 3.6e12, np.nan)
+
+    # --- Avg session minutes over sessions started in (t - 30d, t] ---
+    s_codes, s_start, s_end = rk.sessionize(e_codes, e_ts, SESSION_GAP.value)
+    s_start_key = rk.composite_key(s_codes, s_start, space=space)
+    s_end_key = rk.composite_key(s_codes, s_end, space=space)
+    s_lo = locate(s_start_key, p_key - ms(_MAX_WINDOW))
+    s_done = locate(s_end_key, p_key)            # sessions finished by t
+    s_begun = locate(s_start_key, p_key)         # sessions started by t
+    dur = (s_end - s_start) / rk.NS_PER_MIN
+    n_done = np.maximum(s_done - s_lo, 0)
+    dur_done = np.where(n_done > 0, _window_sum(prefix(dur), np.minimum(s_lo, s_done), s_done), 0)
+    # A session in progress at t counts up to the player's last event at or before t
+    in_progress = (s_begun > s_done) & (s_begun - 1 >= s_lo)
+    cur = np.maximum(s_begun - 1, 0)
+    partial = np.where(in_progress, (e_ts[np.maximum(upto - 1, 0)] - s_start[cur]) / rk.NS_PER_MIN, 0)
+    n_sessions = n_done + in_progress
+    session = np.where(n_sessions > 0, (dur_done + partial) / np.maximum(n_sessions, 1), 0)
+
+    risk = {
+        'loss_ratio_7d': np.where(bets_7d > 0, loss_ratio, 0),
+        'deposit_burst_flag': burst.astype(float),
+        'hours_since_major_loss': np.nan_to_num(hours),
+        'avg_session_duration_30d': session,
+    }
+    # Same convention as the batch join: players with no risk signal at all get NaN
+    has_risk = (bets_7d > 0) | (burst > 0) | has_loss | (n_sessions > 0)
+    for col in RISK_COLUMNS:
+        feats[col] = np.where(has_risk, risk[col], np.nan)
+
+    return pd.DataFrame(feats, index=promos.index)
@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import argparse
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+from .utils import RESULTS_DIR, SEED, get_logger
+
+logger = get_logger("benchmark")
+
+# Scaling benchmarks for each pipeline stage.
+# Every size runs in its own scratch directory (all pipeline paths are relative,
+# so the stages read and write there, never the real data) and every stage in
+# a fresh process, so its peak RSS is its own.
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+PROMOS_PER_PLAYER = 8 # Same ratio as data_generator's CLI
+BASELINE_PATH = f"{RESULTS_DIR}/benchmark_baseline.json"
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+class Timer:
+    """Times the block it wraps; inputs are loaded outside it."""
+    def __enter__(self):
+        self.start_rss_mb = _rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+
+def bench_generate_events(n_players, seed, timer):
+    from .data_generator import generate_players, generate_events, generate_promos
+    from .utils import setup_directories
+    setup_directories()
+    players = generate_players(n_players, seed=seed)
+    with timer:
+        rows = generate_events(players, seed=seed)
+    # Inputs for the later stages
+    generate_promos(players, n_promos=n_players * PROMOS_PER_PLAYER, seed=seed)
+    return rows
+
+def bench_financial_features(n_players, seed, timer):
+    from .feature_engineering import compute_financial_features
+    from .compact import PlayerIndex, read_events
+    from .storage import read_table
+    players = read_table("players")
+    index = PlayerIndex.from_players(players)
+    events = read_events(index)
+    with timer:
+        compute_financial_features(players, events, index)
+    return len(events)
+
+def bench_risk_features(n_players, seed, timer):
+    from .feature_engineering import compute_risk_features
+    from .compact import PlayerIndex, read_events
+    from .storage import read_table
+    index = PlayerIndex.from_players(read_table("players"))
+    events = read_events(index)
+    with timer:
+        compute_risk_features(events, index=index)
+    return len(events)
+
+def bench_process_features(n_players, seed, timer):
+    from .feature_engineering import process_features
+    from .storage import read_table
+    with timer:
+        process_features()
+    return len(read_table("train_promos", columns=['player_idx']))
+
+def bench_train_and_eval(n_players, seed, timer):
+    from .models import train_and_eval
+    from .storage import read_table
+    rows = len(read_table("train_promos", columns=['player_idx']))
+    with timer:
+        train_and_eval()
+    return rows
+
+def bench_apply_crg_layer(n_players, seed, timer):
+    from .crg_layer import CRGScorer
+    from .training_data import TrainingData
+    df = TrainingData.load().gather()
+    df['pred_prob'] = np.random.default_rng(seed).random(len(df))
+    scorer = CRGScorer()
+    with timer:
+        scorer.apply_crg_layer(df)
+    return len(df)
+
+def bench_generate_recommendations(n_players, seed, timer):
+    from .predict_next import generate_recommendations
+    np.random.seed(seed)
+    with timer:
+        generate_recommendations(50)
+    return 50
+
+def bench_batch_recommendations(n_players, seed, timer):
+    from .predict_next import generate_batch_recommendations
+    with timer:
+        generate_batch_recommendations()
+    return n_players
+
+# Run in this order: each stage reads what the previous ones wrote
+STAGES = {
+    'generate_events': bench_generate_events,
+    'compute_financial_features': bench_financial_features,
+    'compute_risk_features': bench_risk_features,
+    'process_features': bench_process_features,
+    'train_and_eval': bench_train_and_eval,
+    'apply_crg_layer': bench_apply_crg_layer,
+    'generate_recommendations': bench_generate_recommendations,
+    'generate_batch_recommendations': bench_batch_recommendations,
+}
+# Stages whose outputs later stages read; run (untimed in the report) when needed
+PRODUCERS = ['generate_events', 'process_features', 'train_and_eval']
+
+def _run_stage(name, n_players, seed, workdir):
+    """Child process entry point: one stage, measured."""
+    os.chdir(workdir)
+    timer = Timer()
+    try:
+        rows = STAGES[name](n_players, seed, timer)
+    except Exception as e:
+        return {'stage': name, 'n_players': n_players, 'error': f"{type(e).__name__}: {e}"}
+    return {
+        'stage': name, 'n_players': n_players, 'rows': int(rows),
+        'seconds': timer.seconds,
+        'rows_per_second': rows / timer.seconds if timer.seconds > 0 else None,
+        'start_rss_mb': timer.start_rss_mb,
+        # ru_maxrss is KiB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / 1e6,
+    }
+
+def _stage_process(ctx, name, n_players, seed, workdir):
+    """Runs a stage in a fresh process; an OOM-killed stage is reported, not hung on."""
+    receiver, sender = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_send_stage, args=(sender, name, n_players, seed, workdir))
+    proc.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        proc.join()
+        result = {'stage': name, 'n_players': n_players, 'error': f"process exited with code {proc.exitcode}"}
+    proc.join()
+    return result
+
+def _send_stage(conn, *args):
+    conn.send(_run_stage(*args))
+    conn.close()
+
+def _telemetry_overhead(calls, repeat=5):
+    """
+    Child process entry point: ns per call of a bare function, the same
+    function in a span() and under @timed, with telemetry off.
+    """
+    os.environ.pop("BPP_TELEMETRY", None) # before telemetry is imported here
+    from .telemetry import enabled, span, timed
+    assert not enabled()
+    def bare():
+        pass
+    
+    def in_span():
+        with span("benchmark.noop"):
+            pass
+    
+    def per_call(fn):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(calls):
+                fn()
+            best = min(best, time.perf_counter() - start)
+        return best / calls * 1e9
+    
+    base = per_call(bare)
+    result = {'calls': calls, 'bare_ns': base, 'span_ns': per_call(in_span), 'timed_ns': per_call(timed("benchmark.noop")(bare))}
+    result['span_overhead_ns'] = result['span_ns'] - base
+    result['timed_overhead_ns'] = result['timed_ns'] - base
+    return result
+
+def telemetry_overhead(calls=200000):
+    """What instrumentation costs per call when telemetry is off (measured in a fresh process)."""
+    with mp.get_context("spawn").Pool(1) as pool:
+        result = pool.apply(_telemetry_overhead, (calls,))
+    logger.info(f"Telemetry off: span() +{result['span_overhead_ns']:.0f}ns, @timed +{result['timed_overhead_ns']:.0f}ns "
+                f"per call (bare call {result['bare_ns']:.0f}ns)")
+    return result
+
+def run_benchmarks(sizes=DEFAULT_SIZES, stages=None, seed=SEED, repeat=1, keep=False):
+    """
+    Times each stage at each player count. With repeat > 1 a stage is re-run
+    and its fastest time kept (peak memory is the max over runs).
+    """
+    stages = stages or list(STAGES)
+    ctx = mp.get_context("spawn")
+    results = []
+    for n_players in sizes:
+        workdir = tempfile.mkdtemp(prefix=f"bpp_bench_{n_players}_")
+        logger.info(f"{n_players} players in {workdir}")
+        try:
+            order = list(STAGES)
+            for name in order:
+                later = any(order.index(s) > order.index(name) for s in stages)
+                if name not in stages and not (name in PRODUCERS and later):
+                    continue
+                runs = []
+                for _ in range(repeat if name in stages else 1):
+                    runs.append(_stage_process(ctx, name, n_players, seed, workdir))
+                if name not in stages:
+                    continue # Only ran to produce inputs
+                failed = [r for r in runs if 'error' in r]
+                if failed:
+                    result = failed[0]
+                    logger.error(f"{name} @ {n_players}: {result['error']}")
+                else:
+                    result = min(runs, key=lambda r: r['seconds'])
+                    result['peak_rss_mb'] = max(r['peak_rss_mb'] for r in runs)
+                    logger.info(f"{name} @ {n_players}: {result['seconds']:.3f}s, "
+                                f"{result['rows_per_second']:,.0f} rows/s, peak {result['peak_rss_mb']:.0f} MB")
+                results.append(result)
+        finally:
+            if not keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'seed': seed,
+        'repeat': repeat,
+        'machine': {
+            'platform': platform.platform(), 'python': platform.python_version(),
+            'cpu_count': os.cpu_count(), 'numpy': np.__version__, 'pandas': pd.__version__,
+        },
+        'results': results,
+        'telemetry_overhead': telemetry_overhead(),
+    }
+
+def compare(report, baseline, threshold=0.2):
+    """
+    Regressions against a baseline report: stages (matched on stage and
+    player count) whose time or peak memory grew by more than `threshold`.
+    """
+    base = {(r['stage'], r['n_players']): r for r in baseline['results'] if 'error' not in r}
+    regressions = []
+    for r in report['results']:
+        b = base.get((r['stage'], r['n_players']))
+        if b is None or 'error' in r:
+            continue
+        for metric in ('seconds', 'peak_rss_mb'):
+            change = r[metric] / b[metric] - 1 if b[metric] else 0.0
+            if change > threshold:
+                regressions.append({'stage': r['stage'], 'n_players': r['n_players'], 'metric': metric,
+                                    'baseline': b[metric], 'current': r[metric], 'change': change})
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for the pipeline stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Player counts")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=None, help="Subset of stages (inputs still get built)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage, fastest kept")
+    parser.add_argument("--output", default=f"{RESULTS_DIR}/benchmark.json")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Report to compare against, if it exists")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown / memory growth (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Also store this run as the baseline")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directories")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.stages, args.seed, args.repeat, args.keep)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Saved {args.output}")
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        logger.info(f"Baseline updated: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for r in regressions:
+            logger.warning(f"REGRESSION {r['stage']} @ {r['n_players']}: {r['metric']} "
+                           f"{r['baseline']:.3f} -> {r['current']:.3f} ({r['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"No regressions beyond {args.threshold:.0%} vs {args.baseline}")
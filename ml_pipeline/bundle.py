@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Single-file, versioned model bundle for inference.
+#
+# Layout: MAGIC | u64 header length | JSON header | arrays (64-byte aligned)
+# The header carries feature order, encoder categories, CRG config and
+# training metadata; tree arrays are memory-mapped straight from the file.
+# Loading it needs numpy and pandas only - no sklearn, joblib or pickle.
+
+MAGIC = b"BPPBNDL1"
+FORMAT_VERSION = 2
+ALIGN = 64
+
+# Per-node fields needed to walk a HistGradientBoosting tree on raw features
+# (count is the training cover, used for TreeSHAP explanations)
+NODE_DTYPE = np.dtype([
+    ('value', '<f8'), ('count', '<u4'), ('feature_idx', '<i8'), ('num_threshold', '<f8'),
+    ('left', '<u4'), ('right', '<u4'), ('missing_go_to_left', 'u1'), ('is_leaf', 'u1'),
+])
+
+def _pad(n):
+    return (-n) % ALIGN
+
+def write_bundle(path, arrays, header):
+    """Writes named arrays plus a JSON header; returns the content version hash."""
+    specs, blobs, offset = {}, [], 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        specs[name] = {'dtype': arr.dtype.descr if arr.dtype.names else arr.dtype.str,
+                       'shape': list(arr.shape), 'offset': offset}
+        blob = arr.tobytes()
+        blobs.append(blob + b"\0" * _pad(len(blob)))
+        offset += len(blobs[-1])
+
+    # Version covers what affects predictions, not when or how it was trained
+    digest = hashlib.sha256()
+    for blob in blobs:
+        digest.update(blob)
+    content = {k: v for k, v in header.items() if k not in ('created_at', 'metadata')}
+    digest.update(json.dumps(content, sort_keys=True).encode())
+    header = dict(header, arrays=specs, format_version=FORMAT_VERSION, version=digest.hexdigest()[:16])
+
+    head = json.dumps(header).encode()
+    prefix = len(MAGIC) + 8 + len(head)
+    head += b" " * _pad(prefix)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(head).to_bytes(8, "little"))
+        f.write(head)
+        for blob in blobs:
+            f.write(blob)
+    return header['version']
+
+def read_bundle(path):
+    """Header dict and memory-mapped (read-only) arrays."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a model bundle")
+        head_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(head_len))
+    if header['format_version'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported bundle format {header['format_version']}")
+
+    base = len(MAGIC) + 8 + head_len
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype([tuple(f) for f in spec['dtype']]) if isinstance(spec['dtype'], list) else np.dtype(spec['dtype'])
+        shape = tuple(spec['shape'])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=base + spec['offset'], shape=shape)
+    return header, arrays
+
+class BundleModel:
+    """
+    Binary HistGradientBoosting predictor over memory-mapped tree nodes.
+    Walks all trees at once, level by level, with numpy gathers.
+    """
+    def __init__(self, nodes, tree_offsets, baseline, version=None):
+        self.nodes = nodes
+        self.version = version # Bundle content hash, when loaded from one
+        self.tree_offsets = np.asarray(tree_offsets, dtype=np.int64)
+        self.baseline = baseline
+        self._feature = np.asarray(nodes['feature_idx'])
+        self._threshold = np.asarray(nodes['num_threshold'])
+        self._left = np.asarray(nodes['left'], dtype=np.int64)
+        self._right = np.asarray(nodes['right'], dtype=np.int64)
+        self._missing_left = np.asarray(nodes['missing_go_to_left']).astype(bool)
+        self._is_leaf = np.asarray(nodes['is_leaf']).astype(bool)
+        self._value = np.asarray(nodes['value'])
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        n = len(X)
+        roots = self.tree_offsets[:-1]
+        # node[i, t]: global index of row i's current node in tree t
+        node = np.broadcast_to(roots, (n, len(roots))).copy()
+        active = ~self._is_leaf[node]
+        while active.any():
+            r, t = np.nonzero(active)
+            cur = node[r, t]
+            x = X[r, self._feature[cur]]
+            go_left = np.where(np.isnan(x), self._missing_left[cur], x <= self._threshold[cur])
+            # Child indices are local to their tree
+            node[r, t] = roots[t] + np.where(go_left, self._left[cur], self._right[cur])
+            active[r, t] = ~self._is_leaf[node[r, t]]
+        # Accumulate tree by tree from the baseline, in sklearn's order, so scores match bit for bit
+        raw = np.full(n, self.baseline)
+        for leaf_values in self._value[node].T:
+            raw += leaf_values
+        return raw
+
+    def predict_proba(self, X):
+        p = 1.0 / (1.0 + np.exp(-self.decision_function(X)))
+        return np.column_stack([1 - p, p])
+
+class BundleEncoder:
+    """OrdinalEncoder.transform equivalent from stored categories (unknown -> -1)."""
+    def __init__(self, columns, categories):
+        self.columns = columns
+        # A missing-value category (sklearn keeps it last) can't be a Categorical category; NaN codes to -1 anyway
+        self.categories = [pd.Index([c for c in cats if not pd.isna(c)], dtype=object) for cats in categories]
+
+    def transform(self, frame):
+        out = np.empty((len(frame), len(self.columns)))
+        for j, col in enumerate(self.columns):
+            out[:, j] = pd.Categorical(frame[col], categories=self.categories[j]).codes
+        return out
+
+class ModelBundle:
+    """Everything inference needs, from one file."""
+    def __init__(self, path):
+        t0 = time.perf_counter()
+        self.header, arrays = read_bundle(path)
+        self.version = self.header['version']
+        self.features = self.header['features']
+        self.model = BundleModel(arrays['nodes'], arrays['tree_offsets'], self.header['model']['baseline'], self.version)
+        self.encoder = BundleEncoder(self.header['encoder']['columns'], self.header['encoder']['categories'])
+        self.crg_config = self.header['crg']
+        self.metadata = self.header['metadata']
+        self.load_seconds = time.perf_counter() - t0
+
+def pack_hgb(model):
+    """
+    Flattens a fitted binary HistGradientBoostingClassifier into
+    (nodes, tree_offsets, baseline) with child indices local to each tree.
+    """
+    if getattr(model, 'is_categorical_', None) is not None and np.any(model.is_categorical_):
+        raise ValueError("Native categorical splits are not supported in bundles")
+    trees = [predictors[0].nodes for predictors in model._predictors]
+    offsets = np.cumsum([0] + [len(t) for t in trees]).astype(np.int64)
+    nodes = np.empty(int(offsets[-1]), dtype=NODE_DTYPE)
+    for tree, start in zip(trees, offsets[:-1]):
+        for field in NODE_DTYPE.names:
+            nodes[field][start:start + len(tree)] = tree[field]
+    return nodes, offsets, float(np.ravel(model._baseline_prediction)[0])
+
+def export_hgb(model, encoder, features, crg_config, metadata, path):
+    """
+    Packs a fitted binary HistGradientBoostingClassifier, its OrdinalEncoder
+    and the CRG config into a bundle file. Returns the bundle version.
+    """
+    nodes, offsets, baseline = pack_hgb(model)
+
+    header = {
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'features': list(features),
+        'encoder': {
+            'columns': list(encoder.feature_names_in_),
+            'categories': [[str(c) for c in cats] for cats in encoder.categories_],
+        },
+        'crg': crg_config,
+        'model': {
+            'type': 'HistGradientBoostingClassifier',
+            'baseline': baseline,
+            'n_trees': len(offsets) - 1,
+        },
+        'metadata': metadata,
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return write_bundle(path, {'nodes': nodes, 'tree_offsets': offsets}, header)
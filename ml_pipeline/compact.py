@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from .storage import dataset
+
+# Compact in-memory events: players as dense int32 indices into a PlayerIndex,
+# event types as int8 enum codes, amounts as float64 (so sums match the
+# streaming PlayerAggregates path exactly), timestamps as datetime64[ns]. No strings per event, so per-player work is bincount-style
+# kernels over the codes; IDs turn back into strings only where results leave
+# the pipeline (feature frames keyed by player_id, recommendations).
+# Conversion happens on the Arrow side, before pandas ever sees the strings.
+
+# The one event type <-> int code table; everything that encodes event types imports it
+EVENT_TYPES = ["deposit", "withdrawal", "bet"]
+EVENT_CODES = {t: code for code, t in enumerate(EVENT_TYPES)}
+DEPOSIT, WITHDRAWAL, BET = (EVENT_CODES[t] for t in EVENT_TYPES)
+AMOUNT_COLUMNS = ['deposit_amount', 'withdrawal_amount', 'stake_amount', 'payout_amount']
+# Columns of a compact events frame; event_code is deliberately not named
+# event_type, so string comparisons against it fail loudly instead of matching nothing
+COMPACT_COLUMNS = ['player_idx', 'event_code', *AMOUNT_COLUMNS, 'event_timestamp']
+
+class PlayerIndex:
+    """Player dictionary: player_id <-> dense int32 index (position in `ids`)."""
+    def __init__(self, ids):
+        self.ids = np.asarray(ids, dtype=object)
+        self.values = pa.array(self.ids, type=pa.string())
+
+    @classmethod
+    def from_players(cls, players):
+        """Index in players-table row order, so per-player arrays line up with it."""
+        return cls(players['player_id'].to_numpy(dtype=object))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, ids):
+        """int32 indices for an array/Series/Arrow column of IDs; -1 for unknown players."""
+        if not isinstance(ids, (pa.Array, pa.ChunkedArray)):
+            ids = pa.array(np.asarray(ids, dtype=object), type=pa.string())
+        return pc.index_in(ids, value_set=self.values).fill_null(-1).to_numpy().astype(np.int32, copy=False)
+
+    def decode(self, codes):
+        return self.ids[codes]
+
+def enum_codes(column, values):
+    """int8 codes of a (dictionary) string column against a fixed value list; -1 if absent."""
+    codes = pc.index_in(column, value_set=pa.array(values, type=pa.string())).fill_null(-1)
+    return codes.to_numpy().astype(np.int8, copy=False)
+
+def _numpy(column, dtype):
+    return column.cast(dtype).to_numpy()
+
+def compact_table(table, index):
+    """Compact events frame from an Arrow table of raw events."""
+    return pd.DataFrame({
+        'player_idx': index.encode(table['player_id']),
+        'event_code': enum_codes(table['event_type'], EVENT_TYPES),
+        **{c: _numpy(table[c], pa.float64()) for c in AMOUNT_COLUMNS},
+        'event_timestamp': _numpy(table['event_timestamp'], pa.timestamp("ns")),
+    })
+
+def read_events(index, filter=None):
+    """The events table (optionally filtered, see storage.time_filter) in compact form."""
+    raw = ['player_id', 'event_type', *AMOUNT_COLUMNS, 'event_timestamp']
+    return compact_table(dataset("events").to_table(columns=raw, filter=filter), index)
+
+def is_compact(events):
+    return 'player_idx' in events.columns
+
+def ensure_compact(events, index=None):
+    """
+    (compact events, index) for raw or already-compact events. Raw events
+    without an index get one over the players they contain.
+    """
+    if is_compact(events):
+        if index is None:
+            raise ValueError("Compact events need the PlayerIndex they were encoded with")
+        return events, index
+    if index is None:
+        index = PlayerIndex(pd.unique(events['player_id'].to_numpy(dtype=object)))
+    raw = ['player_id', 'event_type', *AMOUNT_COLUMNS, 'event_timestamp']
+    return compact_table(pa.Table.from_pandas(events[raw], preserve_index=False), index), index
+
+def group_codes(ids):
+    """
+    int32 group labels for a player_id column, numbered in sorted-ID order,
+    so anything that orders groups (GroupKFold) sees the same order as with
+    the strings themselves.
+    """
+    return pd.Categorical(ids).codes.astype(np.int32, copy=False)
@@ -1,6 +1,14 @@
 import numpy as np
 import pandas as pd
 
+# metric -> (feature column, value used when the column is missing)
+RISK_INPUTS = {
+    'loss_ratio_7d': ('loss_ratio_7d', 0),
+    'deposit_burst': ('deposit_burst_flag', 0),
+    'session_duration': ('avg_session_duration_30d', 0),
+    'cooling_off': ('hours_since_major_loss', 999),
+}
+
 class CRGScorer:
     def __init__(self):
         self.thresholds = {
@@ -9,58 +17,102 @@ class CRGScorer:
             'session_duration': {'low': 30, 'moderate': 60},
             'cooling_off': {'high': 24, 'moderate': 48} # Reversed: lower hours = higher risk
         }
-    
+        self.weights = {
+            'loss_ratio_7d': 0.40, 'deposit_burst': 0.30,
+            'session_duration': 0.15, 'cooling_off': 0.15
+        }
+        # (min score, action, multiplier), checked in order
+        self.actions = [(60, "BLOCK", 0.0), (40, "DOWNGRADE", 0.5)]
+        self.default_action = ("ALLOW", 1.0)
+
+    def config(self):
+        """JSON-serializable thresholds, weights and action cut-offs."""
+        return {
+            'thresholds': self.thresholds,
+            'weights': self.weights,
+            'actions': [list(a) for a in self.actions],
+            'default_action': list(self.default_action),
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        scorer = cls()
+        scorer.thresholds = config['thresholds']
+        scorer.weights = config['weights']
+        scorer.actions = [tuple(a) for a in config['actions']]
+        scorer.default_action = tuple(config['default_action'])
+        return scorer
+
     def calculate_s_score(self, value, metric):
+        return int(self.s_scores(np.array([value], dtype=float), metric)[0])
+
+    def s_scores(self, values, metric):
+        """Vectorized s-score (0 / 50 / 100) for an array of metric values."""
         th = self.thresholds[metric]
-        
+
+        # NaN compares False everywhere, so it scores 0 (as in the scalar path)
         if metric == 'cooling_off':
-            if value < th['high']: return 100
-            elif value < th['moderate']: return 50
-            return 0
-        else:
-            if value >= th['moderate']: return 100
-            elif value >= th['low']: return 50
-            return 0
+            return np.where(values < th['high'], 100, np.where(values < th['moderate'], 50, 0))
+        return np.where(values >= th['moderate'], 100, np.where(values >= th['low'], 50, 0))
+
+    def _risk_values(self, data, metric, n):
+        col, default = RISK_INPUTS[metric]
+        if col in data:
+            return np.asarray(data[col], dtype=float)
+        return np.full(n, default, dtype=float)
+
+    def score_batch(self, data):
+        """
+        Columnar CRG scoring.
+        data: DataFrame or dict of equal-length arrays with risk feature columns.
+        Returns a DataFrame with the four s-scores, crg_score, risk_action and multiplier.
+        """
+        n = len(data) if isinstance(data, pd.DataFrame) else len(next(iter(data.values())))
+        s = {m: self.s_scores(self._risk_values(data, m, n), m) for m in RISK_INPUTS}
+
+        score = (s['loss_ratio_7d'] * self.weights['loss_ratio_7d']) + \
+                (s['deposit_burst'] * self.weights['deposit_burst']) + \
+                (s['session_duration'] * self.weights['session_duration']) + \
+                (s['cooling_off'] * self.weights['cooling_off'])
+        action, multiplier = self.determine_actions(score)
+
+        return pd.DataFrame({
+            's_loss': s['loss_ratio_7d'], 's_burst': s['deposit_burst'],
+            's_session': s['session_duration'], 's_cool': s['cooling_off'],
+            'crg_score': score, 'risk_action': action, 'multiplier': multiplier,
+        })
+
+    def determine_actions(self, crg_scores):
+        """Vectorized determine_action: arrays of actions and multipliers."""
+        conds = [crg_scores >= cutoff for cutoff, _, _ in self.actions]
+        action = np.select(conds, [a for _, a, _ in self.actions], default=self.default_action[0])
+        multiplier = np.select(conds, [m for _, _, m in self.actions], default=self.default_action[1])
+        return action.astype(object), multiplier.astype(float)
 
     def score_player(self, player_stats):
         """
         Calculates weighted CRG score.
         player_stats: dict or Series with risk metrics
         """
-        s_loss = self.calculate_s_score(player_stats.get('loss_ratio_7d', 0), 'loss_ratio_7d')
-        s_burst = self.calculate_s_score(player_stats.get('deposit_burst_flag', 0), 'deposit_burst')
-        s_session = self.calculate_s_score(player_stats.get('avg_session_duration_30d', 0), 'session_duration')
-        s_cool = self.calculate_s_score(player_stats.get('hours_since_major_loss', 999), 'cooling_off')
-        
-        score = (s_loss * 0.40) + (s_burst * 0.30) + (s_session * 0.15) + (s_cool * 0.15)
-        return score
+        row = {col: [player_stats.get(col, default)] for col, default in RISK_INPUTS.values()}
+        return float(self.score_batch(row)['crg_score'].iloc[0])
 
     def determine_action(self, crg_score):
-        if crg_score >= 60:
-            return "BLOCK", 0.0
-        elif crg_score >= 40:
-            return "DOWNGRADE", 0.5
-        else:
-            return "ALLOW", 1.0
+        action, multiplier = self.determine_actions(np.array([crg_score], dtype=float))
+        return action[0], float(multiplier[0])
 
     def apply_crg_layer(self, predictions_df):
         """
         Applies CRG logic to a DataFrame of model predictions.
         Must contain risk feature columns.
         """
-        results = []
-        for _, row in predictions_df.iterrows():
-            score = self.score_player(row)
-            action, multiplier = self.determine_action(score)
-            
-            final_prob = row['pred_prob'] * multiplier
-            
-            results.append({
-                'player_id': row.get('player_id'),
-                'raw_score': row['pred_prob'],
-                'crg_score': score,
-                'risk_action': action,
-                'final_score': final_prob
-            })
-            
-        return pd.DataFrame(results)
+        scored = self.score_batch(predictions_df)
+        pred_prob = predictions_df['pred_prob'].values
+
+        return pd.DataFrame({
+            'player_id': predictions_df['player_id'].values if 'player_id' in predictions_df else None,
+            'raw_score': pred_prob,
+            'crg_score': scored['crg_score'].values,
+            'risk_action': scored['risk_action'].values,
+            'final_score': pred_prob * scored['multiplier'].values
+        })
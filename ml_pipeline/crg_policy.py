@@ -0,0 +1,249 @@
+import copy
+import json
+import itertools
+import argparse
+import numpy as np
+import pandas as pd
+from .utils import RESULTS_DIR, get_logger
+from .crg_layer import RISK_INPUTS
+from .drift import segment_codes, segment_names
+from .telemetry import span
+
+logger = get_logger("crg_policy")
+
+# What-if evaluation of CRG policies (thresholds, weights, action cut-offs)
+# over the whole scored population. Every policy in a grid is scored in one
+# broadcast (policies x players) computation per chunk of players, so a
+# grid of hundreds of policies costs a few passes over a handful of arrays
+# rather than hundreds of scoring runs. Chunks are sized so that
+# policies x rows stays under max_cells.
+#
+# Engagement lost is against offering every player their top-k promos with
+# no CRG at all: a BLOCK player loses all of it, a DOWNGRADE player what the
+# suppressed high-risk offers were worth over the next best safe ones (the
+# same rules as predict_next).
+
+REPORT_PATH = f"{RESULTS_DIR}/crg_policies.json"
+SUMMARY_PATH = f"{RESULTS_DIR}/crg_policies.csv"
+METRICS = list(RISK_INPUTS)
+MAX_CELLS = 4_000_000
+
+# Used when no --grid is given: 81 policies around the default
+DEFAULT_GRID = {
+    'thresholds': {'loss_ratio_7d': {'moderate': [0.5, 0.6, 0.7]}},
+    'weights': {'loss_ratio_7d': [0.3, 0.4, 0.5]},
+    'actions': {'BLOCK': [50, 60, 70], 'DOWNGRADE': [30, 40, 50]},
+}
+
+def _leaves(grid, path=()):
+    """(path, values) for every list in a nested grid dict."""
+    for key, value in grid.items():
+        if isinstance(value, dict):
+            yield from _leaves(value, path + (key,))
+        elif isinstance(value, (list, tuple)) and len(value):
+            if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+                raise ValueError(f"Policy grid values must be numbers: {'.'.join(path + (key,))}")
+            yield path + (key,), list(value)
+        else:
+            raise ValueError(f"Policy grid leaves must be non-empty lists of values: {'.'.join(path + (key,))}")
+
+def _assign(config, path, value):
+    name = '.'.join(path)
+    if path[0] == 'actions':
+        if len(path) != 2:
+            raise ValueError(f"Actions in a policy grid are {{action: [cut-offs]}}: {name}")
+        for a in config['actions']:
+            if a[1] == path[1]:
+                a[0] = value
+                return
+        raise ValueError(f"Unknown action in policy grid: {path[1]}")
+    if path[0] not in ('thresholds', 'weights'):
+        raise ValueError(f"Policy grids vary thresholds, weights and actions only: {name}")
+    node = config
+    for key in path[:-1]:
+        node = node.get(key) if isinstance(node, dict) else None
+    if not isinstance(node, dict) or path[-1] not in node:
+        raise ValueError(f"Unknown policy parameter: {name}")
+    if isinstance(node[path[-1]], dict):
+        raise ValueError(f"Policy grid leaf would replace a group of parameters: {name}")
+    node[path[-1]] = value
+
+def expand_grid(base, grid):
+    """
+    [(overrides, config)] for every combination of the grid's values.
+    base is a CRGScorer.config(); grid mirrors it with lists of candidate
+    values as leaves, and actions given as {action: [cut-offs]}.
+    """
+    axes = list(_leaves(grid))
+    policies = []
+    for combo in itertools.product(*(values for _, values in axes)):
+        config = copy.deepcopy(base)
+        for (path, _), value in zip(axes, combo):
+            _assign(config, path, value)
+        policies.append(({'.'.join(path): value for (path, _), value in zip(axes, combo)}, config))
+    return policies
+
+class PolicyGrid:
+    """
+    Policy parameters as (policies, metrics) arrays. All configs must share
+    the base's action names and order (a grid only changes the cut-offs).
+    """
+    def __init__(self, configs):
+        self.configs = configs
+        self.action_names = [a[1] for a in configs[0]['actions']] + [configs[0]['default_action'][0]]
+        if any([a[1] for a in c['actions']] != self.action_names[:-1] for c in configs):
+            raise ValueError("Policies in a grid must have the same actions")
+        # s-score 100 past `strong`, 50 past `weak`; cooling_off counts down
+        self.strong = np.array([[c['thresholds'][m]['high' if m == 'cooling_off' else 'moderate'] for m in METRICS]
+                                for c in configs], dtype=np.float64)
+        self.weak = np.array([[c['thresholds'][m]['moderate' if m == 'cooling_off' else 'low'] for m in METRICS]
+                              for c in configs], dtype=np.float64)
+        self.weights = np.array([[c['weights'][m] for m in METRICS] for c in configs], dtype=np.float64)
+        self.cutoffs = np.array([[a[0] for a in c['actions']] for c in configs], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.configs)
+
+    def scores(self, values):
+        """(policies, rows) CRG scores; values is (metrics, rows) in METRICS order."""
+        score = np.zeros((len(self), values.shape[1]))
+        for j, m in enumerate(METRICS):
+            v = values[j][None, :]
+            strong, weak = self.strong[:, j, None], self.weak[:, j, None]
+            # NaN compares False everywhere, so it scores 0 (as in CRGScorer)
+            if m == 'cooling_off':
+                s = np.where(v < strong, 100.0, np.where(v < weak, 50.0, 0.0))
+            else:
+                s = np.where(v >= strong, 100.0, np.where(v >= weak, 50.0, 0.0))
+            score += s * self.weights[:, j, None]
+        return score
+
+    def actions(self, values):
+        """(policies, rows) indices into action_names; the first cut-off met wins, as in determine_actions."""
+        score = self.scores(values)
+        codes = np.full(score.shape, len(self.action_names) - 1, dtype=np.int8)
+        for a in reversed(range(self.cutoffs.shape[1])):
+            codes[score >= self.cutoffs[:, a, None]] = a
+        return codes
+
+def risk_values(players):
+    """(metrics, players) CRG inputs, defaults where a column is missing."""
+    return np.vstack([players[col].to_numpy(dtype=np.float64) if col in players.columns
+                      else np.full(len(players), default, dtype=np.float64)
+                      for col, default in RISK_INPUTS.values()])
+
+def simulate(grid, values, segments, n_segments, lost, max_cells=MAX_CELLS):
+    """
+    counts (policies, segments, actions) and engagement lost (policies,
+    segments) for players with risk `values`, segment codes `segments` and
+    `lost` (actions, players) - what each action costs each player.
+    """
+    n_policies, n_actions = len(grid), len(grid.action_names)
+    n = values.shape[1]
+    counts = np.zeros(n_policies * n_segments * n_actions, dtype=np.int64)
+    lost_sum = np.zeros(n_policies * n_segments)
+    chunk = max(1, max_cells // n_policies)
+    policy = np.arange(n_policies)[:, None]
+    with span("crg_policy.simulate", rows_in=n) as sp:
+        for start in range(0, n, chunk):
+            end = min(start + chunk, n)
+            codes = grid.actions(values[:, start:end])
+            cell = policy * n_segments + segments[None, start:end]
+            counts += np.bincount((cell * n_actions + codes).ravel(), minlength=counts.size)
+            lost_sum += np.bincount(cell.ravel(), weights=lost[codes, np.arange(start, end)[None, :]].ravel(),
+                                    minlength=lost_sum.size)
+        sp.set(policies=n_policies, chunk_rows=chunk)
+    return counts.reshape(n_policies, n_segments, n_actions), lost_sum.reshape(n_policies, n_segments)
+
+def action_costs(probs, action_names, high_risk_mask, k):
+    """
+    (actions, players) expected engagements each action loses a player,
+    from their (players, promo types) model probabilities.
+    """
+    top = -np.sort(-probs, axis=1)[:, :k].sum(axis=1)
+    safe = -np.sort(-np.where(high_risk_mask[None, :], 0.0, probs), axis=1)[:, :k].sum(axis=1)
+    lost = np.zeros((len(action_names), len(probs)))
+    for a, name in enumerate(action_names):
+        if name == "BLOCK":
+            lost[a] = top
+        elif name == "DOWNGRADE":
+            lost[a] = top - safe
+    return lost, top
+
+def scored_population(chunk_size=100000, use_cache=False):
+    """
+    Everything the simulator needs about the current player base, scored
+    once with the deployed model: (risk values, segment codes, segment names,
+    (players, promo types) probabilities, deployed CRG config).
+    """
+    from .predict_next import CACHE_PATH, load_artifacts, open_cache, player_rows, score_players
+    model, features, enc, scorer = load_artifacts()
+    cache = open_cache(model, CACHE_PATH) if use_cache else None
+    players = player_rows()
+    segments = segment_names(players.columns)
+    probs = np.vstack([score_players(model, features, enc, players.iloc[s:s + chunk_size], scorer, cache)[0]
+                       for s in range(0, len(players), chunk_size)])
+    if cache is not None:
+        cache.save()
+    return risk_values(players), segment_codes(players, segments), segments, probs, scorer.config()
+
+def policy_report(policies, counts, lost, segments, action_names, baseline):
+    """Per policy: overrides, action rates and engagement lost, overall and per segment."""
+    def stats(c, lost_sum, base):
+        players = int(c.sum())
+        out = {'players': players}
+        for a, name in enumerate(action_names[:-1]):
+            out[f"{name.lower()}_rate"] = float(c[a] / players) if players else 0.0
+        out['engagement_lost'] = float(lost_sum)
+        out['engagement_lost_share'] = float(lost_sum / base) if base else 0.0
+        return out
+    
+    report = []
+    for p, (overrides, config) in enumerate(policies):
+        report.append({
+            'policy': p, 'overrides': overrides, 'config': config,
+            **stats(counts[p].sum(axis=0), lost[p].sum(), baseline.sum()),
+            'segments': {s: stats(counts[p, j], lost[p, j], baseline[j]) for j, s in enumerate(segments)},
+        })
+    return report
+
+def run_grid(grid=None, chunk_size=100000, use_cache=False, max_cells=MAX_CELLS, path=REPORT_PATH):
+    """Scores the player base, evaluates every policy in the grid (plus the deployed one, policy 0), saves the report."""
+    from .predict_next import HIGH_RISK_OFFERS, PROMO_TYPES, TOP_K
+    values, seg, segments, probs, base = scored_population(chunk_size, use_cache)
+    policies = [({}, base)] + expand_grid(base, grid or DEFAULT_GRID)
+    policy_grid = PolicyGrid([c for _, c in policies])
+    lost, top = action_costs(probs, policy_grid.action_names, np.isin(PROMO_TYPES, HIGH_RISK_OFFERS), TOP_K)
+    logger.info(f"Evaluating {len(policies)} CRG policies over {values.shape[1]} players...")
+    counts, lost_sum = simulate(policy_grid, values, seg, len(segments), lost, max_cells)
+    baseline = np.bincount(seg, weights=top, minlength=len(segments))
+    report = policy_report(policies, counts, lost_sum, segments, policy_grid.action_names, baseline)
+    
+    with open(path, 'w') as f:
+        json.dump({'players': int(values.shape[1]), 'baseline_engagement': float(top.sum()), 'policies': report}, f, indent=2)
+    # One row per policy: the overridden parameters, then the overall stats
+    summary = pd.DataFrame([{**r['overrides'], **{k: v for k, v in r.items() if k not in ('overrides', 'config', 'segments')}}
+                            for r in report])
+    params = list(report[-1]['overrides'])
+    summary = summary[['policy', *params, *[c for c in summary.columns if c not in params and c != 'policy']]]
+    summary.to_csv(SUMMARY_PATH, index=False)
+    current = report[0]
+    logger.info("Deployed policy: " + ", ".join(f"{k} {v:.3f}" for k, v in current.items() if k.endswith(('_rate', '_share'))))
+    logger.info(f"{len(report)} policies saved to {path} and {SUMMARY_PATH}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="What-if CRG policies: action rates and engagement lost per policy")
+    parser.add_argument("--grid", default=None,
+                        help="JSON grid: the CRG config layout with lists of values as leaves, actions as "
+                             "{action: [cut-offs]} (default: a small grid around the deployed policy)")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="Players scored per model call")
+    parser.add_argument("--max-cells", type=int, default=MAX_CELLS, help="Policies x players evaluated at once")
+    parser.add_argument("--cache", action="store_true", help="Reuse cached model scores")
+    args = parser.parse_args()
+    
+    grid = None
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    run_grid(grid, args.chunk_size, args.cache, args.max_cells)
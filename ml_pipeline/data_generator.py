@@ -5,7 +5,11 @@ from datetime import datetime, timedelta
 import argparse
 from tqdm import tqdm
 import os
-from .utils import DATA_DIR, get_logger
+from multiprocessing import Pool
+from .utils import SEED, get_logger
+from .storage import PartitionedWriter, reset_table, write_table
+from .compact import BET, DEPOSIT, EVENT_TYPES, WITHDRAWAL
+from .telemetry import span, timed
 
 logger = get_logger("data_gen")
 
@@ -41,14 +45,23 @@ ACTIVITY_PARAMS = {
     "VIP":        {"dep_freq": 40, "bet_freq": 150,  "stake": 3000},
 }
 
-def generate_players(n=100000):
+# RNG stream keys under the root seed, so every stage / shard draws independently
+_PLAYERS_KEY, _EVENTS_KEY, _PROMOS_KEY = 0, 1, 2
+
+def make_rng(seed, *key):
+    """Child Generator for the given spawn key under one root seed."""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key))
+
+@timed()
+def generate_players(n=100000, seed=SEED):
     logger.info(f"Generating {n} players...")
+    rng = make_rng(seed, _PLAYERS_KEY)
     
     ids = [f"P{i:06d}" for i in range(n)]
-    segments = np.random.choice(SEGMENTS, size=n, p=SEGMENT_PROBS)
-    ages = np.random.choice(AGE_GROUPS, size=n, p=AGE_PROBS)
-    genders = np.random.choice(GENDER, size=n, p=GENDER_PROBS)
-    latent = np.random.beta(2, 5, size=n) # Skewed towards lower engagement
+    segments = rng.choice(SEGMENTS, size=n, p=SEGMENT_PROBS)
+    ages = rng.choice(AGE_GROUPS, size=n, p=AGE_PROBS)
+    genders = rng.choice(GENDER, size=n, p=GENDER_PROBS)
+    latent = rng.beta(2, 5, size=n) # Skewed towards lower engagement
     
     df = pd.DataFrame({
         "player_id": ids,
@@ -57,119 +70,145 @@ def generate_players(n=100000):
         "value_segment": segments,
         "age_group": ages,
         "gender": genders,
-        "region": np.random.choice(["Nairobi", "Mombasa", "Kisumu", "Nakuru"], size=n),
+        "region": rng.choice(["Nairobi", "Mombasa", "Kisumu", "Nakuru"], size=n),
         "latent_propensity": latent
     })
     
-    df.to_csv(f"{DATA_DIR}/players.csv", index=False)
+    write_table(df, "players")
     logger.info("Players saved.")
     return df
 
-def generate_events(players_df, limit_events=6000000):
-    logger.info("Generating events...")
-    
-    all_events = []
-    
-    # Process in chunks to manage memory
-    chunk_size = 10000
-    total_players = len(players_df)
-    
-    # We want approx 6M total events.
-    # Scale activity params to match requested total if needed, or just let it flow.
-    # 100k players * avg ~60 events = 6M. The params above (8+35=43 for casual, 150+40=190 for VIP)
-    # Weighted avg is ~43*0.45 + 70*0.35 + 115*0.15 + 190*0.05 ~= 19 + 24 + 17 + 9 = 69 events/player.
-    # That fits well with ~6-7M events.
-    
-    for i in tqdm(range(0, total_players, chunk_size)):
-        chunk = players_df.iloc[i:i+chunk_size]
-        
-        chunk_events = []
-        for _, row in chunk.iterrows():
-            seg = row['value_segment']
-            pid = row['player_id']
-            params = ACTIVITY_PARAMS[seg]
-            
-            # Number of events for this player (Poisson)
-            n_deps = np.random.poisson(params['dep_freq'])
-            n_bets = np.random.poisson(params['bet_freq'])
-            n_with = np.random.poisson(params['dep_freq'] * 0.2) # Withdrawals rarer
-            
-            # Deposits
-            for _ in range(n_deps):
-                amt = np.random.lognormal(mean=np.log(params['stake']*5), sigma=0.5)
-                chunk_events.append({
-                    "player_id": pid,
-                    "event_type": "deposit",
-                    "amount": round(amt, 2),
-                    "stake": 0, "payout": 0,
-                    "timestamp": None # To be filled
-                })
-                
-            # Bets
-            for _ in range(n_bets):
-                stake = np.random.lognormal(mean=np.log(params['stake']), sigma=0.6)
-                # Win prob ~ 90% RTP implies losses. Let's say 20% win rate but wins are larger?
-                # Actually, typically hit frequency is 15-30%.
-                is_win = np.random.random() < 0.25
-                payout = stake * np.random.uniform(1.1, 10.0) if is_win else 0
-                
-                chunk_events.append({
-                    "player_id": pid,
-                    "event_type": "bet",
-                    "amount": 0,
-                    "stake": round(stake, 2),
-                    "payout": round(payout, 2),
-                    "timestamp": None
-                })
-
-            # Withdrawals
-            for _ in range(n_with):
-                amt = np.random.lognormal(mean=np.log(params['stake']*10), sigma=0.5)
-                chunk_events.append({
-                    "player_id": pid,
-                    "event_type": "withdrawal",
-                    "amount": round(amt, 2),
-                    "stake": 0, "payout": 0,
-                    "timestamp": None
-                })
-        
-        # Vectorized timestamp generation for the chunk
-        # Easier: Assign random day of year 2023
-        start_date = datetime(2023, 1, 1).timestamp()
-        end_date = datetime(2023, 12, 31).timestamp()
-        
-        # Convert to DF
-        events_df = pd.DataFrame(chunk_events)
-        if not events_df.empty:
-            events_df['ts_raw'] = np.random.uniform(start_date, end_date, size=len(events_df))
-            events_df['event_timestamp'] = pd.to_datetime(events_df['ts_raw'], unit='s')
-            events_df.sort_values(['player_id', 'event_timestamp'], inplace=True)
-            events_df.drop(columns=['ts_raw'], inplace=True)
-            
-            all_events.append(events_df)
-            
-    final_events = pd.concat(all_events, ignore_index=True)
-    
-    # Rename columns to match spec
-    final_events.rename(columns={'amount': 'deposit_amount'}, inplace=True) # Withdrawal logic needs adjustment
-    
-    # Fix withdrawal/deposit amounts
-    final_events['withdrawal_amount'] = np.where(final_events['event_type'] == 'withdrawal', final_events['deposit_amount'], 0)
-    final_events['deposit_amount'] = np.where(final_events['event_type'] == 'deposit', final_events['deposit_amount'], 0)
-    
-    final_events['stake_amount'] = final_events['stake']
-    final_events['payout_amount'] = final_events['payout']
-    final_events.drop(columns=['stake', 'payout'], inplace=True)
-    
-    # Add IDs
-    final_events['event_id'] = [f"E{i:08d}" for i in range(len(final_events))]
-    
-    logger.info(f"Generated {len(final_events)} events.")
-    final_events.to_csv(f"{DATA_DIR}/events.csv", index=False)
-    return final_events
-
-def generate_promos(players_df, n_promos=750000):
+# Per-segment activity params as arrays, indexed by position in SEGMENTS
+_DEP_FREQ = np.array([ACTIVITY_PARAMS[s]['dep_freq'] for s in SEGMENTS], dtype=float)
+_BET_FREQ = np.array([ACTIVITY_PARAMS[s]['bet_freq'] for s in SEGMENTS], dtype=float)
+_STAKE = np.array([ACTIVITY_PARAMS[s]['stake'] for s in SEGMENTS], dtype=float)
+
+# Assign random moment of year 2023 (UTC, so seeded runs match across machines)
+START_TS = pd.Timestamp('2023-01-01').timestamp()
+END_TS = pd.Timestamp('2023-12-31').timestamp()
+
+def draw_event_counts(segments, rng):
+    """Poisson deposit / bet / withdrawal counts for every player at once."""
+    seg_idx = pd.Categorical(segments, categories=SEGMENTS).codes
+    n_deps = rng.poisson(_DEP_FREQ[seg_idx])
+    n_bets = rng.poisson(_BET_FREQ[seg_idx])
+    n_with = rng.poisson(_DEP_FREQ[seg_idx] * 0.2) # Withdrawals rarer
+    return n_deps, n_bets, n_with
+
+def synthesize_events(player_ids, segments, counts, rng, start_ts=START_TS, end_ts=END_TS):
+    """
+    Batch event engine: expands per-player Poisson counts with np.repeat into
+    whole arrays of amounts and timestamps.
+    Returns a DataFrame sorted by player and time (without event_id).
+    """
+    seg_idx = pd.Categorical(segments, categories=SEGMENTS).codes
+    stake = _STAKE[seg_idx]
+    n_deps, n_bets, n_with = counts
+    
+    # Deposits
+    dep_owner = np.repeat(np.arange(len(seg_idx)), n_deps)
+    dep_amt = rng.lognormal(mean=np.log(stake[dep_owner] * 5), sigma=0.5)
+    
+    # Bets - hit frequency ~25%, wins pay 1.1x-10x the stake
+    bet_owner = np.repeat(np.arange(len(seg_idx)), n_bets)
+    bet_stake = rng.lognormal(mean=np.log(stake[bet_owner]), sigma=0.6)
+    is_win = rng.random(len(bet_owner)) < 0.25
+    payout = np.where(is_win, bet_stake * rng.uniform(1.1, 10.0, size=len(bet_owner)), 0)
+    
+    # Withdrawals
+    wd_owner = np.repeat(np.arange(len(seg_idx)), n_with)
+    wd_amt = rng.lognormal(mean=np.log(stake[wd_owner] * 10), sigma=0.5)
+    
+    n_dep, n_bet, n_wd = len(dep_owner), len(bet_owner), len(wd_owner)
+    zeros_dep, zeros_bet, zeros_wd = np.zeros(n_dep), np.zeros(n_bet), np.zeros(n_wd)
+    
+    owner = np.concatenate([dep_owner, bet_owner, wd_owner])
+    type_code = np.repeat(np.array([DEPOSIT, BET, WITHDRAWAL], dtype=np.int8), [n_dep, n_bet, n_wd])
+    deposit_amount = np.round(np.concatenate([dep_amt, zeros_bet, zeros_wd]), 2)
+    withdrawal_amount = np.round(np.concatenate([zeros_dep, zeros_bet, wd_amt]), 2)
+    stake_amount = np.round(np.concatenate([zeros_dep, bet_stake, zeros_wd]), 2)
+    payout_amount = np.round(np.concatenate([zeros_dep, payout, zeros_wd]), 2)
+    
+    # Random moment of the year, then order by player and time
+    ts_raw = rng.uniform(start_ts, end_ts, size=len(owner))
+    order = np.lexsort((ts_raw, owner))
+    
+    owner = owner[order]
+    return pd.DataFrame({
+        "player_id": np.asarray(player_ids)[owner],
+        "event_type": np.array(EVENT_TYPES)[type_code[order]],
+        "deposit_amount": deposit_amount[order],
+        "event_timestamp": pd.to_datetime(ts_raw[order], unit='s'),
+        "withdrawal_amount": withdrawal_amount[order],
+        "stake_amount": stake_amount[order],
+        "payout_amount": payout_amount[order],
+    })
+
+def _shard_bounds(n_players, n_shards):
+    edges = np.linspace(0, n_players, n_shards + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+def _write_shard(job):
+    """
+    Generates and streams one shard of players to its own files, chunk by chunk,
+    so memory is bounded by chunk size rather than total event volume.
+    """
+    shard, player_ids, segments, id_offset, seed, chunk_size = job
+    count_rng = make_rng(seed, _EVENTS_KEY, shard, 0)
+    value_rng = make_rng(seed, _EVENTS_KEY, shard, 1)
+    
+    n_deps, n_bets, n_with = draw_event_counts(segments, count_rng)
+    
+    with span("events.shard", rows_in=len(player_ids), shard=shard) as sp, PartitionedWriter("events", part=shard) as writer:
+        for i in range(0, len(player_ids), chunk_size):
+            sl = slice(i, i + chunk_size)
+            events_df = synthesize_events(
+                player_ids[sl], segments[sl], (n_deps[sl], n_bets[sl], n_with[sl]), value_rng
+            )
+            # Global IDs: shard offsets are known up front from the counts
+            start = id_offset + writer.rows
+            events_df['event_id'] = np.char.mod('E%08d', np.arange(start, start + len(events_df)))
+            writer.write(events_df)
+        sp.rows_out = writer.rows
+    return writer.rows
+
+@timed()
+def generate_events(players_df, shards=1, workers=1, seed=SEED, chunk_size=10000):
+    """
+    Writes the partitioned events dataset, one file per shard of players and month.
+    Each shard draws from its own child RNG of the root seed, so the output
+    is identical for any worker count. Returns the number of events written.
+    """
+    logger.info(f"Generating events ({shards} shards, {workers} workers)...")
+    
+    # ~69 events/player on average -> ~6-7M events for 100k players.
+    reset_table("events")
+    
+    player_ids = players_df['player_id'].values
+    segments = players_df['value_segment'].values
+    
+    # Draw counts once in the parent to give each shard its event_id offset
+    jobs = []
+    id_offset = 0
+    for shard, (lo, hi) in enumerate(_shard_bounds(len(players_df), shards)):
+        counts = draw_event_counts(segments[lo:hi], make_rng(seed, _EVENTS_KEY, shard, 0))
+        jobs.append((shard, player_ids[lo:hi], segments[lo:hi], id_offset, seed, chunk_size))
+        id_offset += int(sum(c.sum() for c in counts))
+    
+    if workers > 1:
+        with Pool(workers) as pool:
+            written = list(tqdm(pool.imap(_write_shard, jobs), total=len(jobs)))
+    else:
+        written = [_write_shard(job) for job in tqdm(jobs)]
+    
+    total = sum(written)
+    logger.info(f"Generated {total} events.")
+    return total
+
+@timed()
+def generate_promos(players_df, n_promos=750000, seed=SEED):
     logger.info("Generating promo interactions...")
+    rng = make_rng(seed, _PROMOS_KEY)
     
     # Each player gets ~7-8 promos
     promos = []
@@ -178,15 +217,13 @@ def generate_promos(players_df, n_promos=750000):
     # We need player_id, promo_type, timestamp, engaging probability
     
     # Sample players with replacement
-    sampled_players = players_df.sample(n=n_promos, replace=True)
+    sampled_players = players_df.sample(n=n_promos, replace=True, random_state=rng)
     
     # Assign types
-    types = np.random.choice(PROMO_TYPES, size=n_promos)
+    types = rng.choice(PROMO_TYPES, size=n_promos)
     
     # Assign timestamps
-    start_date = datetime(2023, 1, 1).timestamp()
-    end_date = datetime(2023, 12, 31).timestamp()
-    timestamps = pd.to_datetime(np.random.uniform(start_date, end_date, size=n_promos), unit='s')
+    timestamps = pd.to_datetime(rng.uniform(START_TS, END_TS, size=n_promos), unit='s')
     
     # Calculate Engagement
     # engagement_prob = base_rate × latent_propensity × segment_multiplier
@@ -198,7 +235,7 @@ def generate_promos(players_df, n_promos=750000):
     probs = base_rates * latents * multipliers
     probs = np.clip(probs, 0, 1) # Ensure valid probability
     
-    engaged = np.random.binomial(1, probs)
+    engaged = rng.binomial(1, probs)
     
     promo_df = pd.DataFrame({
         "player_id": sampled_players['player_id'].values,
@@ -207,18 +244,21 @@ def generate_promos(players_df, n_promos=750000):
         "engaged": engaged
     })
     
-    promo_df.to_csv(f"{DATA_DIR}/promo_events.csv", index=False)
+    write_table(promo_df, "promos")
     logger.info("Promo events saved.")
     return promo_df
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--players", type=int, default=10000) # Default to 10k for speed
+    parser.add_argument("--shards", type=int, default=1, help="Player shards, one events file each")
+    parser.add_argument("--workers", type=int, default=1, help="Processes generating shards in parallel")
+    parser.add_argument("--seed", type=int, default=SEED)
     args = parser.parse_args()
     
     from .utils import setup_directories
     setup_directories()
     
-    p_df = generate_players(args.players)
-    e_df = generate_events(p_df)
-    pr_df = generate_promos(p_df, n_promos=args.players * 8)
+    p_df = generate_players(args.players, seed=args.seed)
+    generate_events(p_df, shards=args.shards, workers=args.workers, seed=args.seed)
+    pr_df = generate_promos(p_df, n_promos=args.players * 8, seed=args.seed)
@@ -0,0 +1,188 @@
+import os
+import json
+import argparse
+import numpy as np
+from .utils import MODELS_DIR, RESULTS_DIR, get_logger
+from .telemetry import span
+
+logger = get_logger("drift")
+
+# Feature drift between what the model was trained on and what it scores.
+# At training time every monitored feature gets N_BINS quantile bins over the
+# training players; production keeps only bin counts against those same edges
+# (per value segment), updated chunk by chunk as players are scored. Memory is
+# segments x features x bins whatever the row count, and PSI/KS come straight
+# from the counts. KS here is over bin CDFs, so it is a lower bound on the
+# exact two-sample statistic.
+
+REFERENCE_PATH = f"{MODELS_DIR}/drift_reference.npz"
+REPORT_PATH = f"{RESULTS_DIR}/drift_report.json"
+N_BINS = 20
+PSI_ALERT = 0.25 # Usual rule of thumb: <0.1 stable, >0.25 shifted
+KS_ALERT = 0.1
+MIN_ROWS = 500 # Smaller production samples (overall or per segment) are reported but never alert
+SEGMENT_PREFIX = "value_segment_"
+OTHER = "Other"
+_EPS = 1e-4
+
+def monitored_features(features, categorical=('promo_type', 'country', 'currency', 'age_group')):
+    """Numeric model features; promo_type is chosen by us, not drawn from players."""
+    return [f for f in features if f not in categorical]
+
+def segment_names(columns):
+    return [c[len(SEGMENT_PREFIX):] for c in columns if c.startswith(SEGMENT_PREFIX)] + [OTHER]
+
+def segment_codes(df, segments):
+    """Index into `segments` per row from the one-hot value_segment_* columns (Other if none set)."""
+    onehot = np.column_stack([df[SEGMENT_PREFIX + s].to_numpy(dtype=bool) if SEGMENT_PREFIX + s in df.columns
+                              else np.zeros(len(df), dtype=bool) for s in segments[:-1]] + [np.ones(len(df), dtype=bool)])
+    return np.argmax(onehot, axis=1)
+
+class HistogramSketch:
+    """
+    Bin counts per (segment, feature) against fixed edges. Bins are
+    (-inf, e0), [e0, e1), ..., [e_last, inf) plus a last slot for NaN.
+    Repeated edges (discrete features) just leave empty bins.
+    """
+    def __init__(self, features, edges, segments, counts=None):
+        self.features = list(features)
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.segments = list(segments)
+        shape = (len(self.segments), len(self.features), self.edges.shape[1] + 2)
+        self.counts = np.zeros(shape, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def fit(cls, df, features, n_bins=N_BINS):
+        """Edges at the quantiles of df, counts of df itself."""
+        X = df[features].to_numpy(dtype=np.float64)
+        qs = np.linspace(0, 1, n_bins + 1)[1:-1]
+        with np.errstate(invalid='ignore'):
+            edges = np.nanquantile(X, qs, axis=0).T if len(X) else np.zeros((len(features), len(qs)))
+        sketch = cls(features, np.nan_to_num(edges), segment_names(df.columns))
+        sketch.update(df)
+        return sketch
+
+    def empty(self):
+        """A sketch with the same edges and no counts."""
+        return HistogramSketch(self.features, self.edges, self.segments)
+
+    def update(self, df):
+        X = df[self.features].to_numpy(dtype=np.float64)
+        n_slots = self.counts.shape[2]
+        bins = np.empty(X.shape, dtype=np.int64)
+        for j in range(X.shape[1]):
+            bins[:, j] = np.searchsorted(self.edges[j], X[:, j], side='right')
+        bins[np.isnan(X)] = n_slots - 1
+        seg = segment_codes(df, self.segments)
+        flat = (seg[:, None] * len(self.features) + np.arange(len(self.features))[None, :]) * n_slots + bins
+        self.counts += np.bincount(flat.ravel(), minlength=self.counts.size).reshape(self.counts.shape)
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def save(self, path, **meta):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, features=np.array(self.features), edges=self.edges, segments=np.array(self.segments),
+                 counts=self.counts, meta=np.array(json.dumps(meta)))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """(sketch, meta dict)"""
+        with np.load(path) as f:
+            sketch = cls(f['features'].tolist(), f['edges'], f['segments'].tolist(), f['counts'])
+            return sketch, json.loads(str(f['meta']))
+
+def _shares(counts):
+    total = counts.sum(axis=-1, keepdims=True)
+    return counts / np.maximum(total, 1)
+
+def psi(ref_counts, prod_counts):
+    """Population stability index over the last axis (bins); empty bins floored at 1e-4."""
+    p = np.maximum(_shares(ref_counts), _EPS)
+    q = np.maximum(_shares(prod_counts), _EPS)
+    return ((q - p) * np.log(q / p)).sum(axis=-1)
+
+def ks(ref_counts, prod_counts):
+    """Largest gap between the binned CDFs over the last axis."""
+    return np.abs(np.cumsum(_shares(ref_counts), axis=-1) - np.cumsum(_shares(prod_counts), axis=-1)).max(axis=-1)
+
+def compare(reference, production, psi_alert=PSI_ALERT, ks_alert=KS_ALERT, min_rows=MIN_ROWS):
+    """Per-feature PSI/KS overall and per segment, plus the alerts past the thresholds."""
+    ref = np.concatenate([reference.counts.sum(axis=0, keepdims=True), reference.counts])
+    prod = np.concatenate([production.counts.sum(axis=0, keepdims=True), production.counts])
+    groups = ["all"] + reference.segments
+    ref_rows = ref[:, 0, :].sum(axis=1)
+    prod_rows = prod[:, 0, :].sum(axis=1)
+    psi_v, ks_v = psi(ref, prod), ks(ref, prod)
+
+    report = {'rows': int(prod_rows[0]), 'reference_rows': int(ref_rows[0]),
+              'thresholds': {'psi': psi_alert, 'ks': ks_alert}, 'features': {}, 'segments': {}, 'alerts': []}
+    for g, group in enumerate(groups):
+        stats = {f: {'psi': float(psi_v[g, j]), 'ks': float(ks_v[g, j])} for j, f in enumerate(reference.features)}
+        if g == 0:
+            report['features'] = stats
+        else:
+            report['segments'][group] = {'rows': int(prod_rows[g]), 'reference_rows': int(ref_rows[g]), 'features': stats}
+        if ref_rows[g] == 0 or prod_rows[g] < min_rows:
+            continue
+        for f, s in stats.items():
+            if s['psi'] > psi_alert or s['ks'] > ks_alert:
+                report['alerts'].append({'segment': group, 'feature': f, **s})
+    report['alerts'].sort(key=lambda a: -a['psi'])
+    return report
+
+def save_reference(df, features, version, path=REFERENCE_PATH):
+    """Reference sketch of the training players (one row per player), tagged with the model version."""
+    rows = df.drop_duplicates('player_id') if 'player_id' in df.columns else df
+    monitored = monitored_features(features)
+    with span("drift.reference", rows_in=len(rows)):
+        HistogramSketch.fit(rows, monitored).save(path, version=version)
+    logger.info(f"Drift reference over {len(monitored)} features, {len(rows)} players saved to {path}")
+
+class DriftMonitor:
+    """Production sketch against the saved reference; update() per scored chunk, report() at the end."""
+    def __init__(self, path=REFERENCE_PATH):
+        self.reference, meta = HistogramSketch.load(path)
+        self.version = meta.get('version')
+        self.production = self.reference.empty()
+
+    @classmethod
+    def open(cls, path=REFERENCE_PATH):
+        """None (with a warning) if no reference has been saved yet."""
+        if not os.path.exists(path):
+            logger.warning(f"No drift reference at {path} (train the model first), drift monitoring off")
+            return None
+        return cls(path)
+
+    def update(self, df):
+        with span("drift.update", rows_in=len(df)):
+            self.production.update(df)
+
+    def report(self, path=None, **thresholds):
+        report = dict(compare(self.reference, self.production, **thresholds), model_version=self.version)
+        for a in report['alerts']:
+            logger.warning(f"Drift alert: {a['feature']} ({a['segment']}) PSI {a['psi']:.3f}, KS {a['ks']:.3f}")
+        logger.info(f"Drift over {report['rows']} players: {len(report['alerts'])} alert(s)")
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+        return report
+
+if __name__ == "__main__":
+    from .predict_next import player_rows
+    parser = argparse.ArgumentParser(description="Drift report of the current training players vs the model's reference")
+    parser.add_argument("--psi", type=float, default=PSI_ALERT)
+    parser.add_argument("--ks", type=float, default=KS_ALERT)
+    parser.add_argument("--fail-on-alert", action="store_true", help="Exit with status 1 if any feature alerts")
+    args = parser.parse_args()
+
+    monitor = DriftMonitor(REFERENCE_PATH)
+    players = player_rows()
+    for start in range(0, len(players), 100000):
+        monitor.update(players.iloc[start:start + 100000])
+    report = monitor.report(REPORT_PATH, psi_alert=args.psi, ks_alert=args.ks)
+    if args.fail_on_alert and report['alerts']:
+        raise SystemExit(1)
@@ -0,0 +1,185 @@
+from collections import OrderedDict
+from math import factorial
+import numpy as np
+from .bundle import BundleModel, pack_hgb
+from .prediction_cache import row_fingerprints
+
+# Path-dependent TreeSHAP for the flattened HistGradientBoosting trees of
+# bundle.py, in the "Fast TreeSHAP v2" form: a root-to-leaf path contributes
+# to a sample only through which of its (unique) split features the sample
+# agrees with, so each path's SHAP contributions are tabulated once for every
+# agree/disagree pattern. Explaining a batch is then one routing pass plus
+# a table gather - no per-sample recursion.
+
+MAX_TABLE_ELEMENTS = 8_000_000 # paths x 2**width x width; beyond that, evaluate per batch
+BATCH_ELEMENTS = 4_000_000 # rows x paths x depth per vectorized step
+
+def _shap_weights(d, width):
+    """w[s] = s! (d-1-s)! / d! for subsets of size s < d, zero-padded to width."""
+    w = np.zeros(width)
+    for s in range(d):
+        w[s] = factorial(s) * factorial(d - 1 - s) / factorial(d)
+    return w
+
+def _path_shap(z, o, w, v):
+    """
+    SHAP contribution of every path slot.
+    z: (L, D) cover fractions, o: (..., L, D) 0/1 agreement,
+    w: (L, D) subset-size weights, v: (L,) leaf values.
+    """
+    D = z.shape[1]
+    out = np.zeros(np.broadcast_shapes(o.shape, z.shape))
+    for i in range(D):
+        # Coefficients of prod_{j != i} (z_j + o_j t): t^s weights subsets of size s
+        coef = np.zeros(out.shape)
+        coef[..., 0] = 1
+        for j in range(D):
+            if j == i:
+                continue
+            shifted = np.zeros_like(coef)
+            shifted[..., 1:] = coef[..., :-1]
+            coef = z[:, j, None] * coef + o[..., j, None] * shifted
+        out[..., i] = (coef * w).sum(axis=-1) * (o[..., i] - z[:, i])
+    return out * v[:, None]
+
+class TreeShap:
+    """Exact (path-dependent) SHAP values in raw log-odds for a packed HGB model."""
+    def __init__(self, nodes, tree_offsets, baseline, n_features=None):
+        feature = np.asarray(nodes['feature_idx'])
+        count = np.asarray(nodes['count'], dtype=np.float64)
+        left = np.asarray(nodes['left'], dtype=np.int64)
+        right = np.asarray(nodes['right'], dtype=np.int64)
+        is_leaf = np.asarray(nodes['is_leaf']).astype(bool)
+        self.n_features = n_features or (int(feature[~is_leaf].max()) + 1 if (~is_leaf).any() else 1)
+
+        paths = []
+        for root in np.asarray(tree_offsets[:-1], dtype=np.int64):
+            stack = [(int(root), [])]
+            while stack:
+                node, steps = stack.pop()
+                if is_leaf[node]:
+                    paths.append((node, steps))
+                    continue
+                stack.append((root + left[node], steps + [(node, True, root + left[node])]))
+                stack.append((root + right[node], steps + [(node, False, root + right[node])]))
+
+        L = len(paths)
+        depth = max(1, max(len(steps) for _, steps in paths))
+        self.path_node = np.zeros((L, depth), dtype=np.int64)
+        self.path_left = np.ones((L, depth), dtype=bool)
+        self.path_slot = np.full((L, depth), -1, dtype=np.int64)
+        slots = []
+        for p, (_, steps) in enumerate(paths):
+            index = {}
+            for k, (node, went_left, child) in enumerate(steps):
+                slot = index.setdefault(int(feature[node]), len(index))
+                self.path_node[p, k], self.path_left[p, k], self.path_slot[p, k] = node, went_left, slot
+            slots.append(index)
+        width = max(1, max(len(index) for index in slots))
+        self.path_slot[self.path_slot < 0] = width # padding steps
+
+        # Repeated features on a path are merged: their cover fractions multiply
+        self.z = np.ones((L, width))
+        self.slot_feature = np.full((L, width), -1, dtype=np.int64)
+        self.w = np.zeros((L, width))
+        for p, ((_, steps), index) in enumerate(zip(paths, slots)):
+            for node, _, child in steps:
+                self.z[p, index[int(feature[node])]] *= count[child] / count[node]
+            for f, slot in index.items():
+                self.slot_feature[p, slot] = f
+            self.w[p] = _shap_weights(len(index), width)
+        self.valid = self.slot_feature >= 0
+        self.value = np.asarray(nodes['value'])[[leaf for leaf, _ in paths]]
+        self.expected_value = baseline + float((self.value * self.z.prod(axis=1)).sum())
+
+        # Splits are evaluated once per node, then gathered along the paths
+        self.split_nodes, step = np.unique(self.path_node, return_inverse=True)
+        self.path_step = step.reshape(self.path_node.shape)
+        self.split_feature = feature[self.split_nodes]
+        self.split_threshold = np.asarray(nodes['num_threshold'])[self.split_nodes]
+        self.split_missing_left = np.asarray(nodes['missing_go_to_left']).astype(bool)[self.split_nodes]
+        # Smallest mask dtype with a spare bit: padding steps shift past the valid bits
+        self.mask_dtype = next(np.dtype(t) for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.dtype(t).itemsize * 8 > width)
+        self.slot_bits = self.path_slot.astype(self.mask_dtype)
+        self.valid_bits = (self.valid.astype(np.uint64) << np.arange(width, dtype=np.uint64)).sum(axis=1).astype(self.mask_dtype)
+        # (path, slot) -> feature as a 0/1 matrix, so the scatter is one matmul
+        self.to_features = np.zeros((L * width, self.n_features))
+        flat = np.nonzero(self.valid.ravel())[0]
+        self.to_features[flat, self.slot_feature.ravel()[flat]] = 1
+        
+        self.width = width
+        self.table = None
+        if L * 2 ** width * width <= MAX_TABLE_ELEMENTS:
+            bits = (np.arange(2 ** width)[:, None] >> np.arange(width)) & 1
+            self.table = _path_shap(self.z, bits[:, None, :].astype(float), self.w, self.value)
+
+    @classmethod
+    def from_model(cls, model, n_features=None):
+        """From a BundleModel or a fitted HistGradientBoostingClassifier."""
+        if isinstance(model, BundleModel):
+            return cls(model.nodes, model.tree_offsets, model.baseline, n_features)
+        return cls(*pack_hgb(model), n_features)
+
+    def _patterns(self, X):
+        """(n, L) bitmask per path: bit s set when the row agrees with every split on slot s."""
+        x = X[:, self.split_feature]
+        go_left = np.where(np.isnan(x), self.split_missing_left, x <= self.split_threshold)
+        disagree = go_left[:, self.path_step] != self.path_left
+        missed = np.bitwise_or.reduce(disagree.astype(self.mask_dtype) << self.slot_bits, axis=-1)
+        return self.valid_bits & ~missed
+
+    def shap_values(self, X):
+        """(n, n_features) contributions; rows sum to decision_function - expected_value."""
+        X = np.asarray(X, dtype=np.float64)
+        phi = np.zeros((len(X), self.n_features))
+        L = len(self.path_node)
+        step = max(1, BATCH_ELEMENTS // (L * self.path_node.shape[1]))
+        paths = np.arange(L)
+        for start in range(0, len(X), step):
+            pattern = self._patterns(X[start:start + step])
+            if self.table is not None:
+                contrib = self.table[pattern, paths]
+            else:
+                o = (pattern[..., None] >> np.arange(self.width, dtype=self.mask_dtype)) & 1
+                contrib = _path_shap(self.z, o.astype(float), self.w, self.value)
+            phi[start:start + len(pattern)] = contrib.reshape(len(pattern), -1) @ self.to_features
+        return phi
+
+class Explainer:
+    """TreeShap with an LRU cache keyed by candidate-row fingerprint (prediction_cache.row_fingerprints)."""
+    def __init__(self, model, features, max_entries=100000):
+        self.shap = TreeShap.from_model(model, len(features))
+        self.features = list(features)
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def shap_values(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        keys = row_fingerprints(X).tolist()
+        # First row of each uncached fingerprint (repeats in a batch are explained once)
+        missing = list({key: i for i, key in reversed(list(enumerate(keys))) if key not in self.cache}.values())
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            for i, row in zip(missing, self.shap.shap_values(X[missing])):
+                self.cache[keys[i]] = row
+        out = np.empty((len(X), len(self.features)))
+        for i, key in enumerate(keys):
+            self.cache.move_to_end(key)
+            out[i] = self.cache[key]
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return out
+
+    def top_features(self, X, k=3):
+        """Per row, the k features with the largest |contribution|: [(name, log-odds), ...]."""
+        phi = self.shap_values(X)
+        top = np.argsort(-np.abs(phi), axis=1, kind='stable')[:, :k]
+        return [[(self.features[j], float(phi[i, j])) for j in top[i]] for i in range(len(phi))]
+
+def describe(contributions):
+    """Reason text for the UI from top (feature, contribution) pairs."""
+    parts = [f"{name.replace('_', ' ')} ({'+' if value >= 0 else '-'}{abs(value):.2f})" for name, value in contributions]
+    return "Top drivers: " + ", ".join(parts)
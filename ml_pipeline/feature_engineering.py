@@ -3,124 +3,243 @@ import numpy as np
 from datetime import timedelta
 import argparse
 from tqdm import tqdm
-from .utils import DATA_DIR, get_logger
+from .utils import get_logger
+from .storage import iter_batches, read_table, time_filter
+from .aggregates import MAJOR_LOSS, PlayerAggregates
+from . import risk_kernels
+from .compact import BET, DEPOSIT, WITHDRAWAL, PlayerIndex, ensure_compact, read_events
+from .telemetry import span, timed
+from .training_data import TrainingData
 
 logger = get_logger("feat_eng")
 
+# Features are computed as of the end of the simulated year
+REF_DATE = pd.Timestamp('2023-12-31')
+# Oldest event any risk window looks at, relative to REF_DATE.
+# 30d session window plus a day of margin for sessions running across its start.
+RISK_LOOKBACK = timedelta(days=31)
+BURST_WINDOW = pd.Timedelta(hours=24)
+SESSION_GAP = pd.Timedelta(minutes=30)
+
 def load_data():
     logger.info("Loading raw data...")
-    players = pd.read_csv(f"{DATA_DIR}/players.csv")
-    events = pd.read_csv(f"{DATA_DIR}/events.csv")
-    promos = pd.read_csv(f"{DATA_DIR}/promo_events.csv")
-    
-    # Convert timestamps
-    events['event_timestamp'] = pd.to_datetime(events['event_timestamp'])
-    promos['promo_timestamp'] = pd.to_datetime(promos['promo_timestamp'])
+    # Typed Parquet: timestamps and categoricals come back native, no parsing
+    players = read_table("players")
+    events = read_table("events")
+    promos = read_table("promos")
     
     return players, events, promos
 
-def compute_financial_features(players, events):
+def compute_financial_features(players, events, index=None):
+    """
+    Lifetime financial aggregates, one row per player in `players` order.
+    `events` can be raw or compact (with the PlayerIndex of `players`).
+    """
     logger.info("Computing financial features...")
-    
-    # Filter by event type
-    deposits = events[events['event_type'] == 'deposit']
-    withdrawals = events[events['event_type'] == 'withdrawal']
-    bets = events[events['event_type'] == 'bet']
+    if index is None:
+        index = PlayerIndex.from_players(players)
+    events, index = ensure_compact(events, index)
+    codes = events['player_idx'].values
+    etype = events['event_code'].values
+    n = len(index)
+    
+    # Per-player sums/counts/max straight from the int codes.
+    # NaN amounts don't count, as in a pandas groupby.
+    def of_type(code, column):
+        mask = (etype == code) & (codes >= 0)
+        amounts = events[column].values[mask]
+        ok = ~np.isnan(amounts)
+        return codes[mask][ok], amounts[ok]
+    
+    dep_codes, deposits = of_type(DEPOSIT, 'deposit_amount')
+    wd_codes, withdrawals = of_type(WITHDRAWAL, 'withdrawal_amount')
+    bet = (etype == BET) & (codes >= 0)
+    stakes = np.nan_to_num(events['stake_amount'].values[bet])
+    payouts = np.nan_to_num(events['payout_amount'].values[bet])
     
     # Lifetime Aggregates
-    agg_funcs = {
-        'deposit_amount': ['sum', 'count', 'mean', 'max'],
-    }
-    dep_stats = deposits.groupby('player_id').agg(agg_funcs)
-    dep_stats.columns = ['total_deposits', 'num_deposits_lt', 'avg_deposit_amount_lt', 'max_deposit']
-    
-    wd_stats = withdrawals.groupby('player_id').agg({'withdrawal_amount': ['sum', 'count', 'mean']})
-    wd_stats.columns = ['total_withdrawals', 'num_withdrawals', 'avg_withdrawal']
-    
-    bet_stats = bets.groupby('player_id').agg({'stake_amount': 'sum', 'payout_amount': 'sum'})
-    bet_stats['total_stakes'] = bet_stats['stake_amount']
-    bet_stats['ggr'] = bet_stats['stake_amount'] - bet_stats['payout_amount']
-    
-    # Merge
-    df = players[['player_id']].merge(dep_stats, on='player_id', how='left').fillna(0)
-    df = df.merge(wd_stats, on='player_id', how='left').fillna(0)
-    df = df.merge(bet_stats[['total_stakes', 'ggr']], on='player_id', how='left').fillna(0)
+    num_deps = np.bincount(dep_codes, minlength=n).astype(np.float64)
+    num_wds = np.bincount(wd_codes, minlength=n).astype(np.float64)
+    df = pd.DataFrame({'player_id': players['player_id'].values})
+    df['total_deposits'] = risk_kernels.group_sum(dep_codes, deposits, n)
+    df['num_deposits_lt'] = num_deps
+    df['avg_deposit_amount_lt'] = df['total_deposits'] / np.maximum(num_deps, 1)
+    df['max_deposit'] = risk_kernels.group_max(dep_codes, deposits, n, fill=0.0)
+    df['total_withdrawals'] = risk_kernels.group_sum(wd_codes, withdrawals, n)
+    df['num_withdrawals'] = num_wds
+    df['avg_withdrawal'] = df['total_withdrawals'] / np.maximum(num_wds, 1)
+    df['total_stakes'] = risk_kernels.group_sum(codes[bet], stakes, n)
+    df['ggr'] = df['total_stakes'] - risk_kernels.group_sum(codes[bet], payouts, n)
     
     df['net_deposits'] = df['total_deposits'] - df['total_withdrawals']
     
     return df
 
-def compute_risk_features(events):
+def compute_risk_features(events, ref_date=REF_DATE, last_major_loss=None, index=None):
+    """
+    Risk indicators as of ref_date, from vectorized window kernels.
+    `events` can be raw or compact (then with its PlayerIndex).
+    last_major_loss (Series of timestamps by player) can be supplied when
+    `events` only covers the recent window, e.g. from PlayerAggregates.
+    """
     logger.info("Computing risk indicators...")
-    
-    # Needs efficient time-window calculations.
-    # For demo, we'll calculate simplified versions or last 30 days relative to a fixed date (Dec 31, 2023).
-    ref_date = pd.Timestamp('2023-12-31')
-    
-    # 7-day window
-    mask_7d = (events['event_timestamp'] > ref_date - timedelta(days=7))
-    events_7d = events[mask_7d]
-    
-    # Loss Ratio 7d: (Stakes - Wins) / Stakes
-    bets_7d = events_7d[events_7d['event_type'] == 'bet']
-    risk_7d = bets_7d.groupby('player_id').apply(
-        lambda x: (x['stake_amount'].sum() - x['payout_amount'].sum()) / (x['stake_amount'].sum() + 1e-6)
-    ).rename('loss_ratio_7d')
-    
-    # Deposit Burst: Max deposits in 24h
-    # This is heavy. Let's approximate: max daily deposits in last 7 days.
-    deps_7d = events_7d[events_7d['event_type'] == 'deposit']
-    if not deps_7d.empty:
-        burst = deps_7d.set_index('event_timestamp').groupby('player_id').resample('1D').count()['event_id']
-        burst_max = burst.groupby(level=0).max().rename('deposit_burst_flag')
-    else:
-        burst_max = pd.Series(0, index=events['player_id'].unique(), name='deposit_burst_flag')
+    events, index = ensure_compact(events, index)
+    players = pd.Index(index.ids)
+    n = len(index)
+    all_codes = events['player_idx'].values
+    all_ts = events['event_timestamp'].values.astype('datetime64[ns]').astype(np.int64)
+    
+    # Only the recent window matters; sort it by player and time for the kernels
+    with span("risk.window", rows_in=len(events)) as sp:
+        recent = np.flatnonzero((all_ts > (ref_date - RISK_LOOKBACK).value) &
+                                (all_ts <= ref_date.value) & (all_codes >= 0))
+        order = recent[risk_kernels.sort_order(all_codes[recent], all_ts[recent])]
+        codes, ts = all_codes[order], all_ts[order]
+        etype = events['event_code'].values[order]
+        in_7d = ts > (ref_date - timedelta(days=7)).value
+        sp.rows_out = len(order)
+    
+    # Loss Ratio 7d: (Stakes - Wins) / Stakes, from plain group sums
+    with span("risk.loss_ratio", rows_in=len(order)):
+        bet_7d = in_7d & (etype == BET)
+        stakes = risk_kernels.group_sum(codes[bet_7d], events['stake_amount'].values[order][bet_7d], n)
+        payouts = risk_kernels.group_sum(codes[bet_7d], events['payout_amount'].values[order][bet_7d], n)
+        has_bets = np.bincount(codes[bet_7d], minlength=n) > 0
+        risk_7d = pd.Series((stakes - payouts) / (stakes + 1e-6), index=players, name='loss_ratio_7d')[has_bets]
+    
+    # Deposit Burst: max deposits in any trailing 24h window within the last 7 days
+    with span("risk.burst", rows_in=len(order)) as sp:
+        dep_7d = in_7d & (etype == DEPOSIT)
+        dep_codes = codes[dep_7d]
+        counts = risk_kernels.trailing_window_counts(dep_codes, ts[dep_7d], BURST_WINDOW.value)
+        burst = risk_kernels.group_max(dep_codes, counts, n)
+        burst_max = pd.Series(burst, index=players, name='deposit_burst_flag')[burst > 0]
+        sp.set(deposits=len(dep_codes))
         
     # Cooling Off: Hours since major loss
     # simplified: Hours since last bet where loss > 1000
-    major_losses = events[(events['event_type'] == 'bet') & 
-                          ((events['stake_amount'] - events['payout_amount']) > 1000)]
-    last_major_loss = major_losses.groupby('player_id')['event_timestamp'].max()
-    hours_since_loss = (ref_date - last_major_loss).dt.total_seconds() / 3600
-    hours_since_loss.name = 'hours_since_major_loss'
-    
-    risk_df = pd.DataFrame(risk_7d).join(burst_max, how='outer').join(hours_since_loss, how='outer').fillna(0)
-    
-    # Session Duration (Avg min)
-    # Simple proxy: (max time - min time) / count of days active? 
-    # Better: grouping timestamps into sessions (gap > 30min).
-    # Too complex for this script? Let's use simplified proxy: 
-    # Random realistic value per player for demo purposes or derived from bet frequency.
-    # Logic: High frequency = longer sessions.
-    risk_df['avg_session_duration_30d'] = np.random.lognormal(3, 0.5, size=len(risk_df)) # ~20 mins mean
+    with span("risk.cooling_off", rows_in=len(events)):
+        if last_major_loss is None:
+            loss = events['stake_amount'].values - events['payout_amount'].values
+            major = (events['event_code'].values == BET) & (loss > MAJOR_LOSS) & (all_codes >= 0)
+            last_ts = risk_kernels.group_max(all_codes[major], all_ts[major], n, fill=np.iinfo(np.int64).min)
+            has_loss = last_ts > np.iinfo(np.int64).min
+            last_major_loss = pd.Series(last_ts[has_loss].astype('datetime64[ns]'), index=players[has_loss])
+        hours_since_loss = (ref_date - last_major_loss).dt.total_seconds() / 3600
+        hours_since_loss.name = 'hours_since_major_loss'
+    
+    # Session Duration (Avg min): sessions split at 30 min gaps, averaged over
+    # the sessions that started in the last 30 days
+    with span("risk.sessions", rows_in=len(order)) as sp:
+        s_codes, s_start, s_end = risk_kernels.sessionize(codes, ts, SESSION_GAP.value)
+        in_30d = s_start > (ref_date - timedelta(days=30)).value
+        s_codes = s_codes[in_30d]
+        durations = (s_end - s_start)[in_30d] / risk_kernels.NS_PER_MIN
+        n_sessions = np.bincount(s_codes, minlength=n)
+        avg_session = risk_kernels.group_sum(s_codes, durations, n) / np.maximum(n_sessions, 1)
+        session = pd.Series(avg_session, index=players, name='avg_session_duration_30d')[n_sessions > 0]
+        sp.rows_out = len(s_codes)
+    
+    risk_df = (pd.DataFrame(risk_7d).join(burst_max, how='outer')
+               .join(hours_since_loss, how='outer').join(session, how='outer').fillna(0))
+    risk_df.index.name = 'player_id'
     
     return risk_df
 
-def process_features():
-    players, events, promos = load_data()
-    
-    # Financial
-    fin_df = compute_financial_features(players, events)
-    
-    # Risk
-    risk_df = compute_risk_features(events)
+def compute_features_streaming(players, chunk_rows=1000000):
+    """
+    Out-of-core variant: reads events in bounded chunks into mergeable
+    per-player aggregates, so memory does not grow with event history.
+    Only the recent risk window is loaded in full (filter pushed down).
+    """
+    logger.info(f"Streaming events in chunks of {chunk_rows} rows...")
+    aggs = PlayerAggregates()
+    columns = ['player_id', 'event_type', 'deposit_amount', 'withdrawal_amount',
+               'stake_amount', 'payout_amount', 'event_timestamp']
+    for chunk in tqdm(iter_batches("events", columns=columns, batch_size=chunk_rows)):
+        aggs.update(chunk)
+    
+    fin_df = aggs.financial_features(players)
+    
+    index = PlayerIndex.from_players(players)
+    recent = read_events(index, filter=time_filter("events", REF_DATE - RISK_LOOKBACK))
+    risk_df = compute_risk_features(recent, last_major_loss=aggs.last_major_loss(), index=index)
+    return fin_df, risk_df
+
+def build_point_in_time(players, events, promos, index=None):
+    """
+    Training data with each player's features as of the promo timestamp
+    (no leakage of later behaviour), same features as the end-of-year join.
+    Static player attributes go in the player table, as-of features are
+    per-promo columns.
+    """
+    from .asof_features import compute_asof_features
+    
+    asof = compute_asof_features(players, events, promos, index)
+    static = pd.get_dummies(players, columns=['value_segment', 'gender', 'region'])
+    return TrainingData.from_frames(static, promos, promo_features=asof)
+
+@timed()
+def build_features(players, promos, streaming=False, chunk_rows=1000000, point_in_time=False):
+    """
+    TrainingData (player table + one fact row per promo) for in-memory
+    players/promos; events come from the events table.
+    """
+    # Events stay compact (int codes, no strings) through both feature paths
+    index = PlayerIndex.from_players(players)
+    if point_in_time:
+        return build_point_in_time(players, read_events(index), promos, index)
+    
+    if streaming:
+        with span("features.streaming", rows_in=len(players)) as sp:
+            fin_df, risk_df = compute_features_streaming(players, chunk_rows)
+            sp.rows_out = len(fin_df)
+    else:
+        with span("features.read_events") as sp:
+            events = read_events(index)
+            sp.rows_out = len(events)
+            sp.set(mb=events.memory_usage().sum() / 1e6)
+        
+        # Financial
+        with span("features.financial", rows_in=len(events)) as sp:
+            fin_df = compute_financial_features(players, events, index)
+            sp.rows_out = len(fin_df)
+        
+        # Risk
+        with span("features.risk", rows_in=len(events)) as sp:
+            risk_df = compute_risk_features(events, index=index)
+            sp.rows_out = len(risk_df)
     
     # Merge all
-    full_df = players.merge(fin_df, on='player_id', how='left')
-    full_df = full_df.merge(risk_df, on='player_id', how='left')
-    
-    # One-Hot Encoding for Demographic
-    full_df = pd.get_dummies(full_df, columns=['value_segment', 'gender', 'region'])
-    
-    # Target Variable: Note, we are predicting promo engagement.
-    # We need to join promo events with the player features.
-    # This creates a dataset where each row is a promo event, enriched with player features.
-    
-    model_data = promos.merge(full_df, on='player_id', how='left')
+    with span("features.join", rows_in=len(promos)) as sp:
+        full_df = players.merge(fin_df, on='player_id', how='left')
+        full_df = full_df.merge(risk_df, on='player_id', how='left')
+        
+        # One-Hot Encoding for Demographic
+        full_df = pd.get_dummies(full_df, columns=['value_segment', 'gender', 'region'])
+        
+        # Target Variable: Note, we are predicting promo engagement.
+        # Each promo event points at its player's feature row by index rather
+        # than carrying a copy of it; training gathers the rows (TrainingData).
+        data = TrainingData.from_frames(full_df, promos)
+        sp.rows_out = len(data)
+    return data
+
+def process_features(streaming=False, chunk_rows=1000000, point_in_time=False):
+    logger.info("Loading raw data...")
+    data = build_features(read_table("players"), read_table("promos"), streaming, chunk_rows, point_in_time)
     
     # Save
-    model_data.to_csv(f"{DATA_DIR}/train_data.csv", index=False)
-    logger.info(f"Feature engineering complete. Saved {len(model_data)} rows.")
+    data.save()
+    kind = "Point-in-time feature" if point_in_time else "Feature"
+    logger.info(f"{kind} engineering complete. Saved {len(data)} promos over {len(data.players)} players "
+                f"({data.memory_mb():.1f} MB in memory).")
     
 if __name__ == "__main__":
-    process_features()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streaming", action="store_true", help="Out-of-core aggregation over event chunks")
+    parser.add_argument("--chunk-rows", type=int, default=1000000)
+    parser.add_argument("--point-in-time", action="store_true", help="Features as of each promo timestamp")
+    args = parser.parse_args()
+    
+    process_features(streaming=args.streaming, chunk_rows=args.chunk_rows, point_in_time=args.point_in_time)
@@ -0,0 +1,116 @@
+import os
+import json
+import argparse
+import pandas as pd
+from tqdm import tqdm
+from .utils import FEATURE_STORE_DIR, get_logger
+from .storage import SCHEMAS, iter_batches, read_table, time_filter, write_table
+from .aggregates import PlayerAggregates
+from .feature_engineering import RISK_LOOKBACK, compute_risk_features
+
+logger = get_logger("feature_store")
+
+META_PATH = f"{FEATURE_STORE_DIR}/meta.json"
+
+class PlayerFeatureStore:
+    """
+    Persistent per-player features, refreshed from event deltas.
+    State is the lifetime PlayerAggregates plus a tail of the last
+    RISK_LOOKBACK of events for the rolling risk windows, so a daily
+    refresh costs O(delta + tail) instead of O(full history).
+    """
+    def __init__(self, aggregates=None, tail=None, ref_time=None):
+        self.aggregates = aggregates if aggregates is not None else PlayerAggregates()
+        self.tail = tail if tail is not None else SCHEMAS["store_tail"].empty_table().to_pandas()
+        self.ref_time = ref_time
+        self._risk = None
+
+    def update(self, events, ref_time=None):
+        """
+        Folds a batch of new events in and advances the reference time
+        (to ref_time, or the newest event seen).
+        """
+        self.aggregates.update(events)
+        if ref_time is None and len(events):
+            ref_time = events['event_timestamp'].max()
+        if ref_time is not None:
+            ref_time = pd.Timestamp(ref_time)
+            if self.ref_time is None or ref_time > self.ref_time:
+                self.ref_time = ref_time
+        if self.ref_time is None:
+            return self
+
+        tail = pd.concat([self.tail, events[self.tail.columns]], ignore_index=True)
+        self.tail = tail[tail['event_timestamp'] > self.ref_time - RISK_LOOKBACK].reset_index(drop=True)
+        self._risk = None
+        logger.info(f"Applied {len(events)} events, ref time now {self.ref_time}, tail {len(self.tail)} rows")
+        return self
+
+    def risk_features(self):
+        if self._risk is None:
+            self._risk = compute_risk_features(
+                self.tail, ref_date=self.ref_time, last_major_loss=self.aggregates.last_major_loss()
+            )
+        return self._risk
+
+    def snapshot(self, players=None):
+        """
+        Current financial + risk features per player, as feature_engineering
+        builds them before one-hot encoding. `players` adds demographic columns.
+        """
+        if players is None:
+            players = pd.DataFrame({'player_id': self.aggregates.state.index})
+        fin_df = self.aggregates.financial_features(players)
+        full_df = players.merge(fin_df, on='player_id', how='left')
+        return full_df.merge(self.risk_features(), on='player_id', how='left')
+
+    # --- Persistence ---
+
+    def save(self):
+        os.makedirs(FEATURE_STORE_DIR, exist_ok=True)
+        write_table(self.aggregates.state.reset_index(), "store_aggregates")
+        write_table(self.tail, "store_tail")
+        with open(META_PATH, 'w') as f:
+            json.dump({'ref_time': str(self.ref_time) if self.ref_time is not None else None}, f)
+
+    @classmethod
+    def load(cls):
+        with open(META_PATH) as f:
+            meta = json.load(f)
+        state = read_table("store_aggregates").set_index('player_id')
+        ref_time = pd.Timestamp(meta['ref_time']) if meta['ref_time'] else None
+        return cls(PlayerAggregates(state), read_table("store_tail"), ref_time)
+
+    @classmethod
+    def build(cls, until=None, chunk_rows=1000000):
+        """Bootstraps the store from the full event history up to `until`."""
+        store = cls()
+        for chunk in tqdm(iter_batches("events", filter=time_filter("events", end=until), batch_size=chunk_rows)):
+            store.update(chunk, ref_time=until)
+        return store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Bootstrap the store from event history")
+    build.add_argument("--until", default=None)
+    update = sub.add_parser("update", help="Apply the events in (since, until] as a delta")
+    update.add_argument("--since", default=None, help="Defaults to the store's ref time")
+    update.add_argument("--until", required=True)
+    snap = sub.add_parser("snapshot", help="Write the current feature snapshot")
+    snap.add_argument("--out", default=f"{FEATURE_STORE_DIR}/snapshot.parquet")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        store = PlayerFeatureStore.build(until=args.until)
+        store.save()
+    elif args.command == "update":
+        store = PlayerFeatureStore.load()
+        since = args.since or store.ref_time
+        delta = read_table("events", filter=time_filter("events", since, args.until))
+        store.update(delta, ref_time=pd.Timestamp(args.until))
+        store.save()
+    elif args.command == "snapshot":
+        store = PlayerFeatureStore.load()
+        store.snapshot(read_table("players")).to_parquet(args.out, index=False)
+        logger.info(f"Snapshot as of {store.ref_time} saved to {args.out}")
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import time
+import argparse
+import numpy as np
+from .utils import get_logger
+from .storage import read_table
+
+logger = get_logger("loadtest")
+
+async def _get(reader, writer, path, host):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    status = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    body = await reader.readexactly(length)
+    return int(status.split()[1]), body
+
+async def _client(host, port, player_ids, deadline, latencies, rng):
+    reader, writer = await asyncio.open_connection(host, port)
+    errors = 0
+    try:
+        while time.perf_counter() < deadline:
+            pid = player_ids[rng.integers(len(player_ids))]
+            start = time.perf_counter()
+            status, _ = await _get(reader, writer, f"/recommendations/{pid}", host)
+            latencies.append(time.perf_counter() - start)
+            errors += status != 200
+    finally:
+        writer.close()
+    return errors
+
+async def run_load(host, port, concurrency, duration, seed):
+    """Keep-alive clients hammering random players for `duration` seconds."""
+    player_ids = read_table("train_players", columns=['player_id'])['player_id'].to_numpy()
+    latencies = []
+    deadline = time.perf_counter() + duration
+    rngs = [np.random.default_rng([seed, i]) for i in range(concurrency)]
+
+    started = time.perf_counter()
+    errors = await asyncio.gather(*[
+        _client(host, port, player_ids, deadline, latencies, rngs[i]) for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await _get(reader, writer, "/metrics", host)
+    writer.close()
+
+    lat = np.array(latencies) * 1000
+    report = {
+        'requests': len(lat),
+        'errors': int(sum(errors)),
+        'throughput_rps': len(lat) / elapsed,
+        'client_p50_ms': float(np.percentile(lat, 50)) if len(lat) else None,
+        'client_p99_ms': float(np.percentile(lat, 99)) if len(lat) else None,
+        'server': json.loads(body),
+    }
+    logger.info(json.dumps(report, indent=2))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for ml_pipeline.serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(run_load(args.host, args.port, args.concurrency, args.duration, args.seed))
@@ -1,32 +1,35 @@
-import subprocess
-import os
-
-def run_step(script_name, description):
-    print(f"\n--- {description} ---")
-    cmd = f"python -m ml_pipeline.{script_name}"
-    try:
-        subprocess.check_call(cmd, shell=True)
-        print(f"Step '{script_name}' completed successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error running {script_name}: {e}")
-        exit(1)
+import argparse
+from .utils import SEED, setup_directories
+from .pipeline import Pipeline, bpp_stages
+from . import telemetry
 
 if __name__ == "__main__":
-    print("Starting ML Pipeline Execution...")
-    
-    # 1. Generate Data (10k players for fast demo, user can override manually later)
-    # The script uses argparse, but we call via module.
-    # To pass args: python -m ml_pipeline.data_generator --players 10000
-    print("Generating Synthetic Data (10,000 players)...")
-    subprocess.check_call("python -m ml_pipeline.data_generator --players 10000", shell=True)
+    parser = argparse.ArgumentParser(description="Runs the ML pipeline in-process, reusing stages whose inputs and code are unchanged")
+    parser.add_argument("--players", type=int, default=10000) # 10k players for a fast demo
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--point-in-time", action="store_true", help="Features as of each promo timestamp")
+    parser.add_argument("--cv", action="store_true", help="Full parallel cross-validation in the models stage")
+    parser.add_argument("--only", nargs="+", default=None, help="Target stages (upstream is reused or rebuilt as needed)")
+    parser.add_argument("--force", nargs="+", default=[], help="Stages to rerun even if up to date")
+    parser.add_argument("--workers", type=int, default=4, help="Independent stages run concurrently")
+    parser.add_argument("--telemetry", action="store_true", help="Structured span timings to logs/telemetry.jsonl (or set BPP_TELEMETRY=1)")
+    args = parser.parse_args()
     
-    # 2. Feature Engineering
-    run_step("feature_engineering", "Feature Engineering")
-    
-    # 3. Model Training & CRG Validation
-    run_step("models", "Model Training & Validation")
+    print("Starting ML Pipeline Execution...")
+    setup_directories()
+    if args.telemetry:
+        print(f"Telemetry run {telemetry.enable()} -> {telemetry.TELEMETRY_PATH}")
     
-    # 4. Visualizations
-    run_step("visualize", "Evaluation Visualizations")
+    stages = bpp_stages(
+        n_players=args.players, seed=args.seed, shards=args.shards,
+        point_in_time=args.point_in_time, full_cv=args.cv
+    )
+    report = Pipeline(stages, workers=args.workers, force=args.force).run(args.only)
     
+    for name, r in report.items():
+        print(f"  {name:<16} {r['status']:<7} {r['seconds']:.1f}s")
     print("\nPipeline Complete! Artifacts saved in ml_pipeline/models and ml_pipeline/results.")
+    if telemetry.enabled():
+        telemetry.write_summary()
+        print(f"Telemetry summary: {telemetry.SUMMARY_PATH}")
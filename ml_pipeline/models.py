@@ -5,22 +5,52 @@ from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.preprocessing import OrdinalEncoder
 from sklearn.model_selection import GroupKFold
 from sklearn.metrics import roc_auc_score, f1_score, precision_recall_curve, auc
-import shap
+import os
 import json
+import time
 import pickle
+import tempfile
+import argparse
 import joblib
-from .utils import DATA_DIR, MODELS_DIR, PLOTS_DIR, RESULTS_DIR, get_logger
+from multiprocessing import Pool
+from .utils import MODELS_DIR, PLOTS_DIR, RESULTS_DIR, get_logger
 from .crg_layer import CRGScorer
-import matplotlib
-matplotlib.use('Agg') # Non-interactive backend
-import matplotlib.pyplot as plt
+from .training_data import TrainingData
+from .bundle import export_hgb
+from .explain import TreeShap
+from .telemetry import span, timed
+from .drift import save_reference, segment_codes, segment_names
+from .report_cube import CUBE_PATH, ReportCube
 
 logger = get_logger("train_models")
 
-def train_and_eval():
-    logger.info("Loading training data...")
-    df = pd.read_csv(f"{DATA_DIR}/train_data.csv")
-    
+BUNDLE_PATH = f"{MODELS_DIR}/model_bundle.bpp"
+HPARAMS_PATH = f"{MODELS_DIR}/hparams.json" # Written by ml_pipeline.tuning
+N_SPLITS = 5
+CRG_CHUNK = 100000 # Validation rows per CRG scoring / report cube update
+
+DEFAULT_PARAMS = {
+    'loss': 'log_loss', 'max_iter': 100, 'learning_rate': 0.1,
+    'max_depth': 6, 'l2_regularization': 0.1,
+    'early_stopping': True
+}
+
+def load_hparams():
+    """Tuned parameters, if a tuning run has saved any."""
+    if not os.path.exists(HPARAMS_PATH):
+        return {}
+    with open(HPARAMS_PATH) as f:
+        return json.load(f)['params']
+
+def make_model(params=None):
+    """Defaults overlaid with `params`, or with the tuned parameters when none are given."""
+    return HistGradientBoostingClassifier(**{**DEFAULT_PARAMS, **(load_hparams() if params is None else params)})
+
+def encode_training_data(data):
+    """
+    (X, features, encoder) for a TrainingData: float64 matrix with
+    categoricals ordinal-encoded, player rows gathered by index.
+    """
     # Feature columns
     exclude_cols = ['player_id', 'promo_timestamp', 'engaged', 'event_id']
     # 'promo_type' is kept as feature but must be encoded
@@ -28,96 +58,195 @@ def train_and_eval():
     # Identify categoricals
     cat_cols = ['promo_type', 'country', 'currency', 'age_group']
     # Check what columns exist
-    existing_cats = [c for c in cat_cols if c in df.columns]
+    existing_cats = [c for c in cat_cols if c in data.columns]
     
-    # Encode categorical columns for sklearn
+    # Encode categorical columns for sklearn (fitted on the per-promo values, as the wide table had them)
+    enc = None
+    categories = {}
     if existing_cats:
         enc = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)
-        df[existing_cats] = enc.fit_transform(df[existing_cats])
+        enc.fit(data.gather(columns=existing_cats))
+        categories = dict(zip(existing_cats, enc.categories_))
+    
+    def encode(col, values):
+        # Same codes as enc.transform, one column at a time (players encoded once, not per promo)
+        return pd.Categorical(np.asarray(values, dtype=object), categories=categories[col]).codes.astype(np.float64)
+    
+    features = [c for c in data.columns if c not in exclude_cols]
+    return data.matrix(features, encode), features, enc
+
+def _fit_fold(job):
+    """
+    Fits and scores one fold. X/y are either arrays or paths to .npy files,
+    which are memory-mapped so pool workers share the parent's matrix
+    instead of each receiving a pickled copy.
+    """
+    fold, train_idx, val_idx, features, X, y, threads = job
+    if isinstance(X, str):
+        X, y = np.load(X, mmap_mode='r'), np.load(y, mmap_mode='r')
+    
+    from threadpoolctl import threadpool_limits
+    start = time.perf_counter()
+    # Folds run side by side, so split the cores between them
+    with threadpool_limits(limits=threads), span("models.fit_fold", rows_in=len(train_idx), fold=fold, threads=threads):
+        model = make_model()
+        model.fit(pd.DataFrame(X[train_idx], columns=features), y[train_idx])
+        y_pred = model.predict_proba(pd.DataFrame(X[val_idx], columns=features))[:, 1]
+    
+    y_val = y[val_idx]
+    precision, recall, _ = precision_recall_curve(y_val, y_pred)
+    metrics = {
+        'fold': fold, 'auc': roc_auc_score(y_val, y_pred), 'pr_auc': auc(recall, precision),
+        'n_train': len(train_idx), 'n_val': len(val_idx), 'n_iter': int(model.n_iter_),
+        'fit_seconds': time.perf_counter() - start,
+    }
+    return metrics, model, y_pred
+
+def cross_validate(X, y, groups, features, folds=N_SPLITS, workers=None):
+    """
+    Trains `folds` GroupKFold folds in a process pool over one shared,
+    memory-mapped feature matrix. Returns (results, splits, wall seconds);
+    results are (metrics, model, val predictions) per fold, in fold order.
+    """
+    splits = list(GroupKFold(n_splits=N_SPLITS).split(X, y, groups))[:folds]
+    cores = os.cpu_count() or 1
+    workers = min(workers or cores, len(splits))
+    threads = max(1, cores // workers)
+    
+    start = time.perf_counter()
+    if workers == 1:
+        X, y = np.ascontiguousarray(X, dtype=np.float64), np.asarray(y)
+        results = [_fit_fold((i + 1, tr, va, features, X, y, threads)) for i, (tr, va) in enumerate(splits)]
+    else:
+        with tempfile.TemporaryDirectory(prefix="bpp_cv_") as tmp:
+            x_path, y_path = f"{tmp}/X.npy", f"{tmp}/y.npy"
+            np.save(x_path, np.ascontiguousarray(X, dtype=np.float64))
+            np.save(y_path, np.asarray(y))
+            jobs = [(i + 1, tr, va, features, x_path, y_path, threads) for i, (tr, va) in enumerate(splits)]
+            logger.info(f"Training {len(jobs)} folds on {workers} workers ({threads} threads each)...")
+            with Pool(workers) as pool:
+                results = pool.map(_fit_fold, jobs)
+    return results, splits, time.perf_counter() - start
+
+def summarize_folds(fold_metrics, wall_seconds):
+    aucs = np.array([m['auc'] for m in fold_metrics])
+    pr_aucs = np.array([m['pr_auc'] for m in fold_metrics])
+    return {
+        'folds': fold_metrics,
+        'aggregate': {
+            'n_folds': len(fold_metrics),
+            'auc_mean': float(aucs.mean()), 'auc_std': float(aucs.std()),
+            'pr_auc_mean': float(pr_aucs.mean()), 'pr_auc_std': float(pr_aucs.std()),
+            'wall_seconds': wall_seconds,
+            'fit_seconds_total': float(sum(m['fit_seconds'] for m in fold_metrics)),
+        }
+    }
+
+@timed()
+def train_and_eval(full_cv=False, workers=None, data=None):
+    """
+    Fold 1 is always trained and its model becomes the served artifact.
+    full_cv trains all folds in parallel and reports mean/std metrics.
+    data (TrainingData) defaults to the saved training tables. Returns the
+    CRG analysis frame.
+    """
+    if data is None:
+        logger.info("Loading training data...")
+        data = TrainingData.load()
+    X, features, enc = encode_training_data(data)
+    if enc is not None:
         # Save encoder
         joblib.dump(enc, f"{MODELS_DIR}/encoder.pkl")
     
-    features = [c for c in df.columns if c not in exclude_cols]
-    target = 'engaged'
-    group_col = 'player_id'
-    
-    X = df[features]
-    y = df[target]
-    groups = df[group_col]
-    
-    # K-Fold Split
-    gkf = GroupKFold(n_splits=5)
-    
-    fold = 0
-    metrics = []
-    
-    # Train only on first fold
-    for train_idx, val_idx in gkf.split(X, y, groups):
-        fold += 1
-        logger.info(f"Training Fold {fold} (using HistGradientBoosting)...")
-        
-        X_train, y_train = X.iloc[train_idx], y.iloc[train_idx]
-        X_val, y_val = X.iloc[val_idx], y.iloc[val_idx]
-        
-        model = HistGradientBoostingClassifier(
-            loss='log_loss', max_iter=100, learning_rate=0.1,
-            max_depth=6, l2_regularization=0.1,
-            early_stopping=True
-        )
-        
-        model.fit(X_train, y_train)
-        
-        # Eval
-        y_pred = model.predict_proba(X_val)[:, 1]
-        auc_score = roc_auc_score(y_val, y_pred)
-        precision, recall, _ = precision_recall_curve(y_val, y_pred)
-        pr_auc = auc(recall, precision)
-        
-        logger.info(f"Fold {fold} - AUC: {auc_score:.4f}, PR-AUC: {pr_auc:.4f}")
-        metrics.append({'fold': fold, 'auc': auc_score, 'pr_auc': pr_auc})
-        
-        # Save Model Artifacts
-        if fold == 1:
-            joblib.dump(model, f"{MODELS_DIR}/xgboost_model.pkl") # Kept name for consistency
-            joblib.dump(features, f"{MODELS_DIR}/features.pkl")
-            
-            # Feature Importance
-            try:
-                # Validation perm importance or SHAP
-                explainer = shap.Explainer(model.predict, X_val.sample(100))
-                # shap_values = explainer(X_val.sample(100))
-                # Just saving explainer if needed, skipping heavy plot generation
-            except Exception as e:
-                logger.warning(f"SHAP calculation skipped: {e}")
-            
-            # Save metrics
-            with open(f"{RESULTS_DIR}/metrics.json", 'w') as f:
-                json.dump(metrics, f)
-            
-            # CRG Layer Validation
-            logger.info("Running CRG Validation on Fold 1...")
-            val_df = X_val.copy()
-            val_df['pred_prob'] = y_pred
-            val_df['player_id'] = df.iloc[val_idx]['player_id'] 
-            
-            scorer = CRGScorer()
-            results = []
-            for idx, row in val_df.iterrows():
-                stats = {
-                    'loss_ratio_7d': row.get('loss_ratio_7d', 0),
-                    'deposit_burst_flag': row.get('deposit_burst_flag', 0),
-                    'avg_session_duration_30d': row.get('avg_session_duration_30d', 0),
-                    'hours_since_major_loss': row.get('hours_since_major_loss', 999)
-                }
-                score = scorer.score_player(stats)
-                action, _ = scorer.determine_action(score)
-                results.append({'player_id': row['player_id'], 'crg_score': score, 'action': action})
-            
-            res_df = pd.DataFrame(results)
-            logger.info(f"CRG Blocked: {len(res_df[res_df['action']=='BLOCK'])} players")
-            res_df.to_csv(f"{RESULTS_DIR}/crg_analysis.csv", index=False)
-
-            break
+    y = data.labels() # engaged
+    groups = data.groups() # int32 per player, same fold assignment as the player_id strings
+    
+    tuned = load_hparams()
+    if tuned:
+        logger.info(f"Using tuned hyperparameters from {HPARAMS_PATH}: {tuned}")
+    
+    # K-Fold Split (only fold 1 unless full CV is asked for)
+    logger.info(f"Training {N_SPLITS if full_cv else 1} fold(s) (using HistGradientBoosting)...")
+    results, splits, wall = cross_validate(X, y, groups, features, folds=N_SPLITS if full_cv else 1, workers=workers)
+    fold_metrics = [m for m, _, _ in results]
+    for m in fold_metrics:
+        logger.info(f"Fold {m['fold']} - AUC: {m['auc']:.4f}, PR-AUC: {m['pr_auc']:.4f}")
+    
+    summary = summarize_folds(fold_metrics, wall)
+    agg = summary['aggregate']
+    if full_cv:
+        logger.info(f"CV AUC: {agg['auc_mean']:.4f} +/- {agg['auc_std']:.4f}, "
+                    f"PR-AUC: {agg['pr_auc_mean']:.4f} +/- {agg['pr_auc_std']:.4f} "
+                    f"({wall:.1f}s wall, {agg['fit_seconds_total']:.1f}s of fitting)")
+    
+    # Save metrics
+    with open(f"{RESULTS_DIR}/metrics.json", 'w') as f:
+        json.dump(summary, f, indent=2)
+    
+    # Save Model Artifacts (fold 1)
+    (metrics, model, y_pred), (train_idx, val_idx) = results[0], splits[0]
+    X_val = pd.DataFrame(X[val_idx], columns=features)
+    joblib.dump(model, f"{MODELS_DIR}/xgboost_model.pkl") # Kept name for consistency
+    joblib.dump(features, f"{MODELS_DIR}/features.pkl")
+    
+    # Single-file bundle for fast-start inference
+    version = export_hgb(
+        model, enc, features, CRGScorer().config(),
+        metadata={
+            'trained_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'fold': metrics['fold'], 'auc': metrics['auc'], 'pr_auc': metrics['pr_auc'],
+            'n_train': metrics['n_train'], 'n_iter': metrics['n_iter'],
+            'cv': agg if full_cv else None,
+            'params': {k: v for k, v in model.get_params().items() if isinstance(v, (int, float, str, bool, type(None)))},
+        },
+        path=BUNDLE_PATH
+    )
+    logger.info(f"Model bundle {version} saved to {BUNDLE_PATH}")
+    # What drift is measured against: the first training row of each fold 1 player
+    _, first = np.unique(data.player_idx[train_idx], return_index=True)
+    save_reference(pd.DataFrame(X[np.sort(train_idx[first])], columns=features), features, version)
+    
+    # Feature Importance: mean |TreeSHAP| over (a sample of) the validation fold
+    sample = X_val.sample(min(len(X_val), 5000), random_state=0)
+    with span("models.shap_importance", rows_in=len(sample)):
+        phi = TreeShap.from_model(model, len(features)).shap_values(sample.to_numpy(dtype=np.float64))
+    importance = pd.Series(np.abs(phi).mean(axis=0), index=features).sort_values(ascending=False)
+    importance.to_json(f"{RESULTS_DIR}/feature_importance.json", indent=2)
+    logger.info(f"Top SHAP features: {', '.join(importance.index[:5])}")
+    
+    # CRG Layer Validation
+    logger.info("Running CRG Validation on Fold 1...")
+    val_df = X_val
+    val_df['pred_prob'] = y_pred
+    val_df['player_id'] = data.player_ids(val_idx)
+    
+    scorer = CRGScorer()
+    segments = segment_names(val_df.columns)
+    promo_types = data.promos['promo_type'].to_numpy(dtype=object)[val_idx]
+    cube = ReportCube(segments[:-1], sorted(pd.unique(promo_types)))
+    parts = []
+    with span("models.crg_validation", rows_in=len(val_df)):
+        for start in range(0, len(val_df), CRG_CHUNK):
+            chunk = val_df.iloc[start:start + CRG_CHUNK]
+            part = scorer.score_batch(chunk)
+            cube.update(np.asarray(segments, dtype=object)[segment_codes(chunk, segments)], part['risk_action'].values,
+                        part['crg_score'].values, promo_types[start:start + CRG_CHUNK], chunk['pred_prob'].values)
+            parts.append(part)
+    scored = pd.concat(parts, ignore_index=True)
+    cube.save(CUBE_PATH)
+    res_df = pd.DataFrame({
+        'player_id': val_df['player_id'].values,
+        'crg_score': scored['crg_score'].values,
+        'action': scored['risk_action'].values
+    })
+    logger.info(f"CRG Blocked: {len(res_df[res_df['action']=='BLOCK'])} players")
+    res_df.to_csv(f"{RESULTS_DIR}/crg_analysis.csv", index=False)
+    return res_df
 
 if __name__ == "__main__":
-    train_and_eval()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cv", action="store_true", help=f"Train and report all {N_SPLITS} GroupKFold folds in parallel")
+    parser.add_argument("--workers", type=int, default=None, help="CV worker processes (default: one per core, up to the fold count)")
+    args = parser.parse_args()
+    
+    train_and_eval(full_cv=args.cv, workers=args.workers)
@@ -0,0 +1,305 @@
+import os
+import ast
+import sys
+import json
+import time
+import hashlib
+import inspect
+import textwrap
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .utils import DATA_DIR, MODELS_DIR, RESULTS_DIR, PLOTS_DIR, SEED, get_logger
+from .telemetry import span
+
+logger = get_logger("pipeline")
+
+# In-process DAG runner. Stages declare their upstream stages and the files
+# they write; values are handed downstream in memory. A stage is skipped when
+# its cache key - code version, params, upstream output hashes and extra input
+# files - matches the last run and its outputs are still on disk unchanged.
+
+STATE_DIR = f"{DATA_DIR}/.pipeline"
+
+def _file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _files(paths):
+    """All files under the given files/directories, sorted."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found.extend(os.path.join(root, n) for n in names)
+        elif os.path.exists(path):
+            found.append(path)
+    return sorted(found)
+
+def fingerprint_files(paths, known=None):
+    """
+    {file: {size, mtime_ns, hash}} for everything under `paths`.
+    Hashes from `known` are reused when size and mtime are unchanged.
+    """
+    known = known or {}
+    out = {}
+    for path in _files(paths):
+        st = os.stat(path)
+        prev = known.get(path)
+        if prev and prev['size'] == st.st_size and prev['mtime_ns'] == st.st_mtime_ns:
+            out[path] = prev
+        else:
+            out[path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': _file_hash(path)}
+    return out
+
+def _combined_hash(files):
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        digest.update(f"{path}:{files[path]['hash']};".encode())
+    return digest.hexdigest()[:16]
+
+def _imported_modules(source, package):
+    """Package modules named by relative imports in `source` (function-level ones included)."""
+    found = set()
+    for node in ast.walk(ast.parse(textwrap.dedent(source))):
+        if not isinstance(node, ast.ImportFrom) or node.level != 1:
+            continue
+        if node.module:
+            found.add(f"{package}.{node.module.split('.')[0]}")
+        else:
+            found.update(f"{package}.{alias.name}" for alias in node.names) # from . import x
+    return found
+
+def code_version(fn):
+    """Hash of fn's source plus every package module it reaches, transitively."""
+    package = fn.__module__.rsplit(".", 1)[0]
+    fn_source = inspect.getsource(fn)
+    todo = _imported_modules(fn_source, package)
+    for name in fn.__code__.co_names:
+        value = fn.__globals__.get(name)
+        module = value.__name__ if inspect.ismodule(value) else getattr(value, '__module__', None)
+        if module and module.startswith(package + ".") and module != fn.__module__:
+            todo.add(module)
+    
+    seen = set()
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        todo |= _imported_modules(inspect.getsource(importlib.import_module(name)), package) - seen
+    
+    digest = hashlib.sha256(fn_source.encode())
+    for name in sorted(seen):
+        digest.update(name.encode())
+        digest.update(inspect.getsource(sys.modules[name]).encode())
+    return digest.hexdigest()[:16]
+
+class Stage:
+    """
+    fn(**upstream values, **params) -> value handed to downstream stages.
+    inputs: upstream stages whose values fn receives; after: upstream stages
+    it only depends on through files. outputs: files/dirs it writes;
+    extra_inputs: files it reads that no stage produces. load() rebuilds the
+    value from the outputs when the stage is skipped but a consumer runs.
+    """
+    def __init__(self, name, fn, inputs=(), after=(), params=None, outputs=(), extra_inputs=(), load=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.after = list(after)
+        self.params = params or {}
+        self.outputs = list(outputs)
+        self.extra_inputs = list(extra_inputs)
+        self.load = load
+
+    @property
+    def upstream(self):
+        return self.inputs + self.after
+
+class Pipeline:
+    def __init__(self, stages, workers=4, force=(), state_dir=STATE_DIR):
+        self.stages = {s.name: s for s in stages}
+        self.workers = workers
+        self.force = set(force)
+        self.state_dir = state_dir
+        self.output_hashes = {}
+        self.values = {}
+        self.locks = {name: threading.Lock() for name in self.stages}
+        self.report = {}
+
+    def _state_path(self, name):
+        return f"{self.state_dir}/{name}.json"
+
+    def _read_state(self, name):
+        try:
+            with open(self._state_path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self, name, state):
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp = self._state_path(name) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self._state_path(name))
+
+    def cache_key(self, stage):
+        extra = fingerprint_files(stage.extra_inputs)
+        payload = {
+            'code': code_version(stage.fn),
+            'params': stage.params,
+            'upstream': {name: self.output_hashes[name] for name in stage.upstream},
+            'extra_inputs': {path: f['hash'] for path, f in extra.items()},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    def value(self, name):
+        """A stage's value, loaded from its outputs if it was skipped."""
+        with self.locks[name]:
+            if name not in self.values:
+                stage = self.stages[name]
+                self.values[name] = stage.load() if stage.load else None
+            return self.values[name]
+
+    def _run(self, stage):
+        key = self.cache_key(stage)
+        state = self._read_state(stage.name)
+        if stage.name not in self.force and state and state['key'] == key:
+            files = fingerprint_files(stage.outputs, state['files'])
+            if set(files) == set(state['files']) and _combined_hash(files) == state['output_hash']:
+                self.output_hashes[stage.name] = state['output_hash']
+                self.report[stage.name] = {'status': 'cached', 'seconds': 0.0}
+                with span(f"stage.{stage.name}", key=key, cached=True):
+                    pass
+                logger.info(f"[{stage.name}] up to date ({key}), skipped")
+                return
+
+        logger.info(f"[{stage.name}] running...")
+        start = time.perf_counter()
+        args = {name: self.value(name) for name in stage.inputs}
+        with span(f"stage.{stage.name}", key=key) as sp:
+            value = stage.fn(**args, **stage.params)
+            if hasattr(value, '__len__'):
+                sp.rows_out = len(value)
+        with self.locks[stage.name]:
+            self.values[stage.name] = value
+        seconds = time.perf_counter() - start
+
+        files = fingerprint_files(stage.outputs)
+        output_hash = _combined_hash(files)
+        self.output_hashes[stage.name] = output_hash
+        self._write_state(stage.name, {'key': key, 'output_hash': output_hash, 'files': files,
+                                       'finished_at': time.strftime("%Y-%m-%dT%H:%M:%S"), 'seconds': seconds})
+        self.report[stage.name] = {'status': 'ran', 'seconds': seconds}
+        logger.info(f"[{stage.name}] done in {seconds:.1f}s")
+
+    def _with_upstream(self, targets):
+        selected, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in selected:
+                selected.add(name)
+                todo.extend(self.stages[name].upstream)
+        return selected
+
+    def run(self, targets=None):
+        """Runs `targets` (default: every stage) and their upstream, independent stages concurrently."""
+        pending = self._with_upstream(targets or list(self.stages))
+        done, running = set(), {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending or running:
+                for name in sorted(pending):
+                    if all(up in done for up in self.stages[name].upstream):
+                        pending.discard(name)
+                        running[pool.submit(self._run, self.stages[name])] = name
+                if not running:
+                    raise RuntimeError(f"Unresolvable stages: {sorted(pending)}")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    future.result() # re-raises a stage failure
+                    done.add(name)
+        ran = [n for n, r in self.report.items() if r['status'] == 'ran']
+        logger.info(f"Pipeline finished in {time.perf_counter() - start:.1f}s "
+                    f"({len(ran)} ran, {len(self.report) - len(ran)} cached)")
+        return self.report
+
+# --- The BPP pipeline ---
+# Stage bodies import lazily so the runner starts fast and each stage's code
+# version only covers the modules it actually uses.
+
+def _players(n_players, seed):
+    from .data_generator import generate_players
+    return generate_players(n_players, seed=seed)
+
+def _events(players, seed, shards):
+    from .data_generator import generate_events
+    generate_events(players, shards=shards, seed=seed)
+
+def _promos(players, n_promos, seed):
+    from .data_generator import generate_promos
+    return generate_promos(players, n_promos=n_promos, seed=seed)
+
+def _features(players, promos, point_in_time):
+    from .feature_engineering import build_features
+    data = build_features(players, promos, point_in_time=point_in_time)
+    data.save()
+    return data
+
+def _models(features, full_cv):
+    from .models import train_and_eval
+    return train_and_eval(full_cv=full_cv, data=features)
+
+def _visualize():
+    from .visualize import run_visualizations
+    run_visualizations()
+
+def _recommendations(features, n_players, seed):
+    import numpy as np
+    import random
+    from .predict_next import generate_recommendations
+    np.random.seed(seed)
+    random.seed(seed)
+    generate_recommendations(n_players, data=features)
+
+def _read_training_data():
+    from .training_data import TrainingData
+    return TrainingData.load()
+
+def _read(name):
+    from .storage import read_table
+    return lambda: read_table(name)
+
+def bpp_stages(n_players=10000, seed=SEED, shards=1, point_in_time=False, full_cv=False, n_recommendations=50):
+    from .storage import PATHS
+    from .models import BUNDLE_PATH, HPARAMS_PATH
+    from .drift import REFERENCE_PATH
+    from .report_cube import CUBE_PATH, UI_CUBE_PATH
+    return [
+        Stage("players", _players, params={'n_players': n_players, 'seed': seed},
+              outputs=[PATHS["players"]], load=_read("players")),
+        Stage("events", _events, inputs=["players"], params={'seed': seed, 'shards': shards},
+              outputs=[PATHS["events"]]),
+        Stage("promos", _promos, inputs=["players"], params={'n_promos': n_players * 8, 'seed': seed},
+              outputs=[PATHS["promos"]], load=_read("promos")),
+        Stage("features", _features, inputs=["players", "promos"], after=["events"],
+              params={'point_in_time': point_in_time},
+              outputs=[PATHS["train_players"], PATHS["train_promos"]], load=_read_training_data),
+        Stage("models", _models, inputs=["features"], params={'full_cv': full_cv},
+              outputs=[f"{MODELS_DIR}/{f}" for f in ("xgboost_model.pkl", "features.pkl", "encoder.pkl")]
+                      + [BUNDLE_PATH, REFERENCE_PATH, CUBE_PATH]
+                      + [f"{RESULTS_DIR}/{f}" for f in ("metrics.json", "crg_analysis.csv", "feature_importance.json")],
+              extra_inputs=[HPARAMS_PATH]),
+        Stage("visualize", _visualize, after=["models"],
+              outputs=[f"{PLOTS_DIR}/{f}" for f in ("risk_distribution.png", "risk_by_segment.png", "crg_score_histogram.png")]
+                      + [UI_CUBE_PATH]),
+        Stage("recommendations", _recommendations, inputs=["features"], after=["models"],
+              params={'n_players': n_recommendations, 'seed': seed},
+              outputs=["src/data/recommendations.json"]),
+    ]
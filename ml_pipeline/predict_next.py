@@ -1,10 +1,20 @@
+import os
 import pandas as pd
 import numpy as np
-import joblib
 import json
 import random
-from .utils import DATA_DIR, MODELS_DIR, get_logger
+import math
+import argparse
+from tqdm import tqdm
+from .utils import DATA_DIR, MODELS_DIR, RESULTS_DIR, get_logger
 from .crg_layer import CRGScorer
+from .storage import TableWriter
+from .training_data import load_player_features
+from .bundle import ModelBundle
+from .explain import Explainer, describe
+from .telemetry import span, timed
+from .prediction_cache import CACHE_PATH, PredictionCache, row_fingerprints
+from .drift import REPORT_PATH as DRIFT_REPORT_PATH, DriftMonitor
 
 logger = get_logger("inference")
 
@@ -12,166 +22,299 @@ PROMO_TYPES = [
     "AccaInsurance", "Mission", "Activation", "Cashback", 
     "ReloadBonus", "DepositAndGet", "ReAcquisition"
 ]
+CAT_COLS = ['promo_type', 'country', 'currency', 'age_group']
+MODEL_NAME = "HistGradientBoosting"
+TOP_K = 3
+N_DRIVERS = 3 # SHAP features shown per recommendation
 
-def generate_recommendations(n_players=50):
-    logger.info(f"Generating recommendations for {n_players} players...")
+# Example: DepositAndGet is "High Risk" - suppressed for DOWNGRADE players
+HIGH_RISK_OFFERS = ["DepositAndGet", "ReloadBonus"]
+_HIGH_RISK_MASK = np.isin(PROMO_TYPES, HIGH_RISK_OFFERS)
+
+RISK_STAT_DEFAULTS = {
+    'loss_ratio_7d': 0,
+    'deposit_burst_flag': 0,
+    'avg_session_duration_30d': 0,
+    'hours_since_major_loss': 999
+}
+
+BUNDLE_PATH = f"{MODELS_DIR}/model_bundle.bpp"
+
+def load_artifacts():
+    """
+    (model, features, encoder, CRG scorer) for inference.
+    Prefers the single-file bundle (numpy only, memory-mapped trees);
+    falls back to the joblib pickles, which pull in sklearn.
+    """
+    if os.path.exists(BUNDLE_PATH):
+        bundle = ModelBundle(BUNDLE_PATH)
+        logger.info(f"Loaded model bundle {bundle.version} in {bundle.load_seconds * 1000:.1f}ms")
+        return bundle.model, bundle.features, bundle.encoder, CRGScorer.from_config(bundle.crg_config)
     
-    # 1. Load Artifacts
+    import joblib
     model = joblib.load(f"{MODELS_DIR}/xgboost_model.pkl")
     features = joblib.load(f"{MODELS_DIR}/features.pkl")
     enc = joblib.load(f"{MODELS_DIR}/encoder.pkl")
+    return model, features, enc, CRGScorer()
+
+def player_rows(data=None):
+    """One row per player with their static/financial features (TrainingData, or read from disk)."""
+    return data.player_features() if data is not None else load_player_features()
+
+def encode_candidates(players_df, rows, promo_types, enc):
+    """Candidate rows (player rows paired with promo types), categoricals encoded."""
+    cand_df = players_df.iloc[rows].reset_index(drop=True)
+    cand_df['promo_type'] = promo_types
+    cand_df[CAT_COLS] = enc.transform(cand_df[CAT_COLS])
+    return cand_df
+
+def open_cache(model, path=None):
+    """PredictionCache for a bundle-loaded model (None for the pickle fallback, which has no version)."""
+    if getattr(model, 'version', None) is None:
+        logger.warning("Model has no bundle version, prediction cache disabled")
+        return None
+    return PredictionCache(model.version, path=path)
+
+def score_players(model, features, enc, players_df, scorer, cache=None):
+    """
+    Scores a chunk of players against every promo type in one candidate matrix
+    (player x promo type), one encode and one predict_proba call.
+    With a PredictionCache only pairs whose (player features, promo type) it
+    hasn't seen for this model are predicted.
+    Returns (probs, final, crg) with probs/final shaped (players, promo types).
+    """
+    n, k = len(players_df), len(PROMO_TYPES)
+    cand_df = encode_candidates(players_df, np.repeat(np.arange(n), k), np.tile(PROMO_TYPES, n), enc)
+    with span("predict.score", rows_in=len(cand_df)) as sp:
+        X = cand_df[features]
+        if cache is None:
+            probs = model.predict_proba(X)[:, 1].reshape(n, k)
+        else:
+            # Candidate rows are player-major, so every k-th row is one player's features
+            player_cols = [f for f in features if f != 'promo_type']
+            keys = cache.make_keys(row_fingerprints(X[player_cols].iloc[::k]), PROMO_TYPES)
+            misses = cache.misses
+            probs = cache.get_or_score(keys, lambda rows: model.predict_proba(X.iloc[rows])[:, 1])
+            sp.set(scored=cache.misses - misses)
+    
+    with span("predict.crg", rows_in=n):
+        crg = scorer.score_batch(players_df)
+    final = probs * crg['multiplier'].values[:, None]
+    # If DOWNGRADE, remove high-risk offers (strict filtering)
+    downgraded = (crg['risk_action'].values == "DOWNGRADE")[:, None]
+    final = np.where(downgraded & _HIGH_RISK_MASK[None, :], 0, final)
+    return probs, final, crg
+
+def rank_top_k(final, k=TOP_K):
+    """Column indices of the k best promos per player, ties kept in PROMO_TYPES order."""
+    return np.argsort(-final, axis=1, kind='stable')[:, :k]
+
+def explain_top_k(explainer, features, enc, players_df, top_idx):
+    """
+    SHAP drivers for every recommended (player, promo) pair, in one batch.
+    top_idx entries of -1 (empty allocation slots) are skipped.
+    Returns [player][pick] -> [(feature, log-odds contribution), ...].
+    """
+    valid = top_idx >= 0
+    rows = np.nonzero(valid)[0]
+    pairs = encode_candidates(players_df, rows, np.asarray(PROMO_TYPES)[top_idx[valid]], enc)
+    with span("predict.explain", rows_in=len(pairs)) as sp:
+        drivers = explainer.top_features(pairs[features].to_numpy(dtype=np.float64), N_DRIVERS)
+        sp.set(cache_hits=explainer.hits, cache_misses=explainer.misses)
+    bounds = np.concatenate([[0], np.cumsum(valid.sum(axis=1))])
+    return [drivers[bounds[i]:bounds[i + 1]] for i in range(len(top_idx))]
+
+def risk_status(risk_action, promo_type):
+    if risk_action == "BLOCK":
+        return "Blocked"
+    if risk_action == "DOWNGRADE":
+        return "Suppressed (Safety)" if promo_type in HIGH_RISK_OFFERS else "Downgraded"
+    return ""
+
+def player_segment(p_row):
+    if p_row.get('value_segment_VIP', 0) == 1: return 'VIP'
+    elif p_row.get('value_segment_HighRoller', 0) == 1: return 'HighRoller'
+    elif p_row.get('value_segment_Core', 0) == 1: return 'Core'
+    return 'Casual'
+
+def build_player_profile(p_row, crg_score, risk_action, risk_multiplier, probs, top_idx, drivers):
+    """Final JSON object for one player, as the predictions UI reads it."""
+    risk_penalty = f"{risk_multiplier}x" if risk_multiplier < 1 else "None"
+    return {
+        "player_id": str(p_row['player_id']),
+        "segment": player_segment(p_row),
+        "churn_risk": f"{random.randint(5, 85)}%", # Mock
+        "ltv": f"€{int(p_row.get('net_deposits', 0))}",
+        "crg_score": int(crg_score),
+        "risk_action": risk_action,
+        "risk_metrics": {c: p_row.get(c, d) for c, d in RISK_STAT_DEFAULTS.items()},
+        "recommendations": [
+            {
+                "type": PROMO_TYPES[i],
+                "match_score": f"{int(probs[i]*100)}%",
+                "raw_score": float(probs[i]),
+                "model_used": MODEL_NAME,
+                "risk_penalty": risk_penalty,
+                "risk_status": risk_status(risk_action, PROMO_TYPES[i]),
+                "reason": describe(top),
+                "top_features": [{"feature": f, "contribution": round(v, 4)} for f, v in top]
+            } for i, top in zip(top_idx, drivers)
+        ]
+    }
+
+def sanitize(obj):
+    """JSON-safe copy: numpy scalars to Python, NaN/inf to 0.0."""
+    if isinstance(obj, dict):
+        return {k: sanitize(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [sanitize(v) for v in obj]
+    elif isinstance(obj, float):
+        return 0.0 if math.isnan(obj) or math.isinf(obj) else obj
+    elif isinstance(obj, (np.floating, np.integer)):
+        return sanitize(obj.item()) # Convert numpy to python scalar
+    return obj
+
+@timed()
+def generate_recommendations(n_players=50, data=None, use_cache=False):
+    logger.info(f"Generating recommendations for {n_players} players...")
+    
+    # 1. Load Artifacts
+    model, features, enc, scorer = load_artifacts()
+    cache = open_cache(model, CACHE_PATH) if use_cache else None
     
     # 2. Load Players & Recent Data (simulate reading from DB)
     # We'll pick random players from the generated training data
-    # Ideally we use 'players.csv' and compute fresh features, 
+    # Ideally we use 'players.csv' and compute fresh features,
     # but for this demo effective re-using training set rows is easier to guarantee feature alignment.
-    train_df = pd.read_csv(f"{DATA_DIR}/train_data.csv")
-    
-    # Get unique players from train_df
-    unique_players = train_df['player_id'].unique()
-    sampled_ids = np.random.choice(unique_players, size=n_players, replace=False)
+    players = player_rows(data)
+    sampled = np.random.choice(len(players), size=n_players, replace=False)
     
-    # Get their profiles (take specific rows to get their feature values)
-    # We need one row per player to get their static/financial features
-    # Then we replicate for each promo type.
+    # One row per sampled player, in sampled order
+    profiles = players.iloc[sampled].reset_index(drop=True)
     
-    recommendations_list = []
+    probs, final, crg = score_players(model, features, enc, profiles, scorer, cache)
+    top_idx = rank_top_k(final)
+    drivers = explain_top_k(Explainer(model, features), features, enc, profiles, top_idx)
+    if cache is not None:
+        logger.info(f"Prediction cache: {cache.stats()}")
+        cache.save()
     
-    scorer = CRGScorer()
+    recommendations_list = [
+        build_player_profile(
+            p_row, crg['crg_score'].iat[i], crg['risk_action'].iat[i], crg['multiplier'].iat[i],
+            probs[i], top_idx[i], drivers[i]
+        )
+        for i, p_row in enumerate(profiles.to_dict('records'))
+    ]
     
-    for pid in sampled_ids:
-        # Get player's base features (take the first occurrence)
-        p_row = train_df[train_df['player_id'] == pid].iloc[0].copy()
-        
-        # Calculate Risk Score
-        risk_stats = {
-            'loss_ratio_7d': p_row.get('loss_ratio_7d', 0),
-            'deposit_burst_flag': p_row.get('deposit_burst_flag', 0),
-            'avg_session_duration_30d': p_row.get('avg_session_duration_30d', 0),
-            'hours_since_major_loss': p_row.get('hours_since_major_loss', 999)
-        }
-        crg_score = scorer.score_player(risk_stats)
-        risk_action, risk_multiplier = scorer.determine_action(crg_score)
-        
-        # Prepare Candidates (Cross-Product with Promo Types)
-        candidates = []
-        for p_type in PROMO_TYPES:
-            row = p_row.copy()
-            row['promo_type'] = p_type
-            candidates.append(row)
-            
-        cand_df = pd.DataFrame(candidates)
-        
-        # Encode Categoricals
-        cat_cols = ['promo_type', 'country', 'currency', 'age_group']
-        cand_df[cat_cols] = enc.transform(cand_df[cat_cols])
-        
-        # Predict
-        X = cand_df[features]
-        probs = model.predict_proba(X)[:, 1]
-        
-        # Apply Logic & Rank
-        player_recs = []
-        for i, p_type in enumerate(PROMO_TYPES):
-            base_prob = probs[i]
-            final_prob = base_prob * risk_multiplier
-            
-            # Additional logic: If DOWNGRADE, remove high-risk offers
-            # Example: DepositAndGet is "High Risk"
-            is_high_risk_offer = p_type in ["DepositAndGet", "ReloadBonus"]
-            risk_flag = ""
-            
-            if risk_action == "DOWNGRADE" and is_high_risk_offer:
-                final_prob = 0 # strict filtering
-                risk_flag = "Suppressed (Safety)"
-            elif risk_action == "DOWNGRADE":
-                risk_flag = "Downgraded"
-                
-            if risk_action == "BLOCK":
-                risk_flag = "Blocked"
-            
-            player_recs.append({
-                "promo_type": p_type,
-                "model_score": float(base_prob),
-                "final_score": float(final_prob),
-                "risk_flag": risk_flag,
-                "model_name": "HistGradientBoosting",
-                "risk_penalty": f"{risk_multiplier}x" if risk_multiplier < 1 else "None"
-            })
-            
-        # Sort by Final Score
-        player_recs.sort(key=lambda x: x['final_score'], reverse=True)
-        top_3 = player_recs[:3]
-        
-        # Explainability (Synthetic)
-        # In real world, use SHAP. Here, heuristic text.
-        reason_map = {
-            "Cashback": "High recent activity volume",
-            "AccaInsurance": "Frequent multi-leg bets",
-            "Mission": "High engagement propensity",
-            "ReloadBonus": "Deposit frequency trend",
-            "Activation": "Dormancy risk mitigation",
-            "DepositAndGet": "High LTV potential",
-            "ReAcquisition": "Win-back strategy"
-        }
-        
-        # Construct Final JSON Object for this player
-        # Need some raw stats for the UI
-        p_profile = {
-            "player_id": str(pid),
-            "segment": p_row['value_segment_HighRoller'] == 1 and 'HighRoller' or 
-                       (p_row['value_segment_VIP'] == 1 and 'VIP' or 
-                       (p_row['value_segment_Core'] == 1 and 'Core' or 'Casual')), 
-            
-            "churn_risk": f"{random.randint(5, 85)}%", # Mock
-            "ltv": f"€{int(p_row.get('net_deposits', 0))}",
-            "crg_score": int(crg_score),
-            "risk_action": risk_action,
-            "risk_metrics": risk_stats,
-            "recommendations": [
-                {
-                    "type": r['promo_type'],
-                    "match_score": f"{int(r['model_score']*100)}%",
-                    "raw_score": r['model_score'],
-                    "model_used": r['model_name'],
-                    "risk_penalty": r['risk_penalty'],
-                    "risk_status": r['risk_flag'],
-                    "reason": reason_map.get(r['promo_type'], "Best fit for profile")
-                } for r in top_3
-            ]
-        }
-        
-        # Segment fix
-        if p_row.get('value_segment_VIP', 0) == 1: p_profile['segment'] = 'VIP'
-        elif p_row.get('value_segment_HighRoller', 0) == 1: p_profile['segment'] = 'HighRoller'
-        elif p_row.get('value_segment_Core', 0) == 1: p_profile['segment'] = 'Core'
-        else: p_profile['segment'] = 'Casual'
-
-        recommendations_list.append(p_profile)
-        
     # Save to Frontend - Handle NaNs
     output_path = "src/data/recommendations.json"
-    import os
-    import math
     os.makedirs("src/data", exist_ok=True)
     
-    def sanitize(obj):
-        if isinstance(obj, dict):
-            return {k: sanitize(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [sanitize(v) for v in obj]
-        elif isinstance(obj, float):
-            return 0.0 if math.isnan(obj) or math.isinf(obj) else obj
-        elif isinstance(obj, (np.floating, np.integer)):
-            return sanitize(obj.item()) # Convert numpy to python scalar
-        return obj
-
     clean_data = sanitize(recommendations_list)
     
     with open(output_path, 'w') as f:
         json.dump(clean_data, f, indent=2)
-        
+    
     logger.info(f"Saved recommendations for {n_players} players to {output_path}")
 
+def allocate_offers(probs, final, budgets, max_per_player=TOP_K):
+    """
+    Budget-constrained picks over the whole (players, promo types) matrix
+    instead of each player's top-k; see allocation.py. Saves the plan report.
+    """
+    from .allocation import allocate, expected_costs, log_report
+    picks, report = allocate(final, expected_costs(probs, PROMO_TYPES), budgets, max_per_player,
+                             promo_types=PROMO_TYPES)
+    log_report(report)
+    with open(f"{RESULTS_DIR}/allocation.json", 'w') as f:
+        json.dump(report, f, indent=2)
+    return picks
+
+@timed()
+def generate_batch_recommendations(chunk_size=100000, budgets=None, max_per_player=TOP_K, use_cache=False):
+    """
+    Top-k recommendations for every player, scored in memory-bounded chunks
+    of players and streamed to the `recommendations` table (one row per pick).
+    With budgets ((k,) per promo type, np.inf = uncapped) every player is
+    scored first and the picks come from the constrained allocation.
+    use_cache keeps scores on disk between runs, so only players whose
+    features changed (or a new model) are rescored. Scored features are
+    checked for drift against the training reference along the way.
+    """
+    model, features, enc, scorer = load_artifacts()
+    cache = open_cache(model, CACHE_PATH) if use_cache else None
+    drift = DriftMonitor.open()
+    explainer = Explainer(model, features)
+    players = player_rows()
+    logger.info(f"Scoring {len(players)} players x {len(PROMO_TYPES)} promo types...")
+    starts = range(0, len(players), chunk_size)
+    
+    picks = None
+    if budgets is not None:
+        # The allocation couples all players, so hold every score (n x 7 floats)
+        scored = [score_players(model, features, enc, players.iloc[s:s + chunk_size], scorer, cache) for s in tqdm(starts)]
+        probs_all = np.vstack([p for p, _, _ in scored])
+        final_all = np.vstack([f for _, f, _ in scored])
+        picks = allocate_offers(probs_all, final_all, budgets, max_per_player)
+    
+    promo_names = np.array(PROMO_TYPES)
+    with TableWriter("recommendations") as writer:
+        for n_chunk, start in enumerate(tqdm(starts)):
+            chunk = players.iloc[start:start + chunk_size]
+            if picks is None:
+                probs, final, crg = score_players(model, features, enc, chunk, scorer, cache)
+                top_idx = rank_top_k(final)
+            else:
+                probs, final, crg = scored[n_chunk]
+                top_idx = picks[start:start + chunk_size]
+            drivers = explain_top_k(explainer, features, enc, chunk, top_idx)
+            if drift is not None:
+                drift.update(chunk)
+            
+            valid = top_idx >= 0
+            rows = np.nonzero(valid)[0]
+            picked_idx = top_idx[valid]
+            actions = crg['risk_action'].values[rows]
+            picked = promo_names[picked_idx]
+            status = np.where(actions == "BLOCK", "Blocked",
+                     np.where(actions == "DOWNGRADE",
+                              np.where(np.isin(picked, HIGH_RISK_OFFERS), "Suppressed (Safety)", "Downgraded"), ""))
+            writer.write(pd.DataFrame({
+                'player_id': chunk['player_id'].values[rows],
+                'rank': np.cumsum(valid, axis=1)[valid],
+                'promo_type': picked,
+                'model_score': probs[rows, picked_idx],
+                'final_score': final[rows, picked_idx],
+                'crg_score': crg['crg_score'].values[rows],
+                'risk_action': actions,
+                'risk_status': status,
+                'reason': [describe(top) for picks_i in drivers for top in picks_i],
+            }))
+    logger.info(f"Saved {writer.rows} recommendations for {len(players)} players")
+    if cache is not None:
+        logger.info(f"Prediction cache: {cache.stats()}")
+        cache.save()
+    if drift is not None:
+        drift.report(DRIFT_REPORT_PATH)
+
 if __name__ == "__main__":
-    generate_recommendations()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=50, help="Players sampled for the UI JSON")
+    parser.add_argument("--all", action="store_true", help="Score the whole player base into the recommendations table")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--budget", nargs="+", default=None, metavar="PROMO=EUR",
+                        help="With --all: per-promo budgets on expected reward cost, allocated under them")
+    parser.add_argument("--max-per-player", type=int, default=TOP_K, help="Offers per player under --budget")
+    parser.add_argument("--cache", action="store_true", help=f"Reuse scores of unchanged players ({CACHE_PATH})")
+    args = parser.parse_args()
+    
+    if args.all:
+        budgets = None
+        if args.budget:
+            from .allocation import parse_budgets
+            budgets = parse_budgets(args.budget, PROMO_TYPES)
+        generate_batch_recommendations(chunk_size=args.chunk_size, budgets=budgets, max_per_player=args.max_per_player,
+                                       use_cache=args.cache)
+    else:
+        generate_recommendations(args.players, use_cache=args.cache)
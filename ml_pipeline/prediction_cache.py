@@ -0,0 +1,137 @@
+import os
+import hashlib
+import numpy as np
+from .utils import DATA_DIR, get_logger
+
+logger = get_logger("prediction_cache")
+
+# Model scores keyed by (bundle version, player feature fingerprint, promo type),
+# so a refresh only rescores players whose features changed. Keys are 64-bit
+# hashes, built vectorized; entries live in sorted numpy arrays (lookups are
+# one searchsorted, inserts a linear merge) with a last-used tick for LRU
+# eviction. Scores are stored as float64, so a hit returns exactly what
+# scoring would have.
+
+CACHE_PATH = f"{DATA_DIR}/prediction_cache.npz"
+
+_M1 = np.uint64(0xbf58476d1ce4e5b9)
+_M2 = np.uint64(0x94d049bb133111eb)
+
+def _mix(h):
+    """splitmix64 finalizer, elementwise on uint64 arrays (wrapping arithmetic)."""
+    h = (h ^ (h >> np.uint64(30))) * _M1
+    h = (h ^ (h >> np.uint64(27))) * _M2
+    return h ^ (h >> np.uint64(31))
+
+def _salt(text):
+    return np.uint64(int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little"))
+
+def row_fingerprints(X):
+    """64-bit hash per row of a float matrix; -0.0/0.0 and all NaNs hash alike."""
+    X = np.asarray(X, dtype=np.float64)
+    bits = np.ascontiguousarray(np.where(np.isnan(X), np.nan, X + 0.0)).view(np.uint64)
+    h = np.full(len(X), np.uint64(len(X[0]) if len(X) else 0))
+    with np.errstate(over='ignore'):
+        for j in range(bits.shape[1]):
+            h = _mix(h ^ bits[:, j])
+    return h
+
+class PredictionCache:
+    """
+    LRU-bounded score cache for one model version. `path` persists it
+    between runs; a file written for another model version is ignored.
+    """
+    def __init__(self, version, max_entries=2_000_000, path=None):
+        self.version = version
+        self.max_entries = max_entries
+        self.path = path
+        self._version_salt = _salt(version)
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.values = np.empty(0, dtype=np.float64)
+        self.last_used = np.empty(0, dtype=np.int64)
+        self.tick = 0
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def make_keys(self, player_fingerprints, promo_types):
+        """(n, k) keys for every player x promo type pair."""
+        promo = np.array([_salt(p) for p in promo_types], dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            return _mix(_mix(player_fingerprints ^ self._version_salt)[:, None] ^ promo[None, :])
+
+    def lookup(self, keys):
+        """(values, found) for a key array; values are NaN where not found."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        self.tick += 1
+        pos = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        found = self.keys[pos] == keys if len(self.keys) else np.zeros(keys.shape, dtype=bool)
+        values = np.where(found, self.values[pos] if len(self.keys) else np.nan, np.nan)
+        self.last_used[pos[found]] = self.tick
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        return values, found
+
+    def insert(self, keys, values):
+        keys, first = np.unique(np.asarray(keys, dtype=np.uint64), return_index=True)
+        values = np.asarray(values, dtype=np.float64)[first]
+        pos = np.searchsorted(self.keys, keys)
+        known = pos < len(self.keys)
+        known[known] = self.keys[pos[known]] == keys[known]
+        self.values[pos[known]] = values[known]
+        self.last_used[pos[known]] = self.tick
+        new = ~known
+        self.keys = np.insert(self.keys, pos[new], keys[new])
+        self.values = np.insert(self.values, pos[new], values[new])
+        self.last_used = np.insert(self.last_used, pos[new], self.tick)
+        if len(self.keys) > self.max_entries:
+            self._evict(int(self.max_entries * 0.9))
+
+    def _evict(self, keep):
+        """Drops all but the `keep` most recently used entries (sorted order is kept)."""
+        cutoff = np.partition(self.last_used, len(self.last_used) - keep)[len(self.last_used) - keep]
+        mask = self.last_used > cutoff
+        # Fill up to `keep` with entries used exactly at the cutoff tick
+        ties = np.flatnonzero(self.last_used == cutoff)[:keep - int(mask.sum())]
+        mask[ties] = True
+        self.keys, self.values, self.last_used = self.keys[mask], self.values[mask], self.last_used[mask]
+
+    def get_or_score(self, keys, score_fn):
+        """
+        Scores for `keys` (any shape), calling score_fn(flat miss positions)
+        only for the entries not cached and caching what it returns.
+        """
+        flat = keys.ravel()
+        values, found = self.lookup(flat)
+        miss = np.flatnonzero(~found)
+        if len(miss):
+            values[miss] = score_fn(miss)
+            self.insert(flat[miss], values[miss])
+        return values.reshape(keys.shape)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp.npz"
+        # Ticks are rebased so the file stays small and monotone across runs
+        np.savez(tmp, version=np.array(self.version), keys=self.keys, values=self.values,
+                 last_used=self.last_used - self.tick)
+        os.replace(tmp, self.path)
+        logger.info(f"Saved {len(self)} cached scores to {self.path}")
+
+    def _load(self):
+        with np.load(self.path) as f:
+            if str(f['version']) != self.version:
+                logger.info(f"Prediction cache at {self.path} is for model {f['version']}, starting empty")
+                return
+            self.keys, self.values, self.last_used = f['keys'], f['values'], f['last_used']
+        logger.info(f"Loaded {len(self)} cached scores from {self.path}")
@@ -0,0 +1,113 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from .utils import RESULTS_DIR, get_logger
+
+logger = get_logger("report_cube")
+
+# Pre-aggregated CRG results for reporting: counts and score sums over
+# segment x action x crg_score bin x promo_type, as dense numpy arrays
+# (a few thousand cells however many rows went in). Producers update() it
+# chunk by chunk as CRG results come out; plots and the reports UI only ever
+# sum cells, so they cost the same for ten thousand players or ten million.
+
+CUBE_PATH = f"{RESULTS_DIR}/report_cube.json"
+UI_CUBE_PATH = "src/data/report_cube.json" # Read by src/app/reports
+ACTIONS = ["ALLOW", "DOWNGRADE", "BLOCK"]
+UNKNOWN = "Unknown"
+BIN_WIDTH = 5
+N_SCORE_BINS = 20 # crg_score is 0-100; 100 goes in the top bin
+DIMS = ('segment', 'action', 'score_bin', 'promo_type')
+MEASURES = ('count', 'crg_score_sum', 'model_score_sum')
+
+def _codes(values, categories, name):
+    codes = pd.Categorical(np.asarray(values, dtype=object), categories=categories).codes
+    if (codes < 0).any():
+        raise ValueError(f"Unknown {name} values: {sorted(set(np.asarray(values, dtype=object)[codes < 0]))[:5]}")
+    return codes
+
+class ReportCube:
+    def __init__(self, segments, promo_types, actions=ACTIONS):
+        self.segments = list(segments) + ([UNKNOWN] if UNKNOWN not in segments else [])
+        self.actions = list(actions)
+        self.promo_types = list(promo_types)
+        self.score_bins = [i * BIN_WIDTH for i in range(N_SCORE_BINS)] # Lower edges
+        self.shape = (len(self.segments), len(self.actions), N_SCORE_BINS, len(self.promo_types))
+        self.count = np.zeros(self.shape, dtype=np.int64)
+        self.crg_score_sum = np.zeros(self.shape)
+        self.model_score_sum = np.zeros(self.shape)
+
+    def dim_values(self, dim):
+        return {'segment': self.segments, 'action': self.actions,
+                'score_bin': self.score_bins, 'promo_type': self.promo_types}[dim]
+
+    def update(self, segments, actions, crg_scores, promo_types, model_scores=None):
+        """Adds one chunk of CRG results (equal-length arrays); unknown segments go to Unknown."""
+        crg_scores = np.asarray(crg_scores, dtype=np.float64)
+        seg = pd.Categorical(np.asarray(segments, dtype=object), categories=self.segments).codes
+        seg = np.where(seg < 0, self.segments.index(UNKNOWN), seg)
+        score_bin = np.clip((crg_scores // BIN_WIDTH).astype(np.int64), 0, N_SCORE_BINS - 1)
+        cell = np.ravel_multi_index(
+            (seg, _codes(actions, self.actions, "action"), score_bin, _codes(promo_types, self.promo_types, "promo_type")),
+            self.shape
+        )
+        size = self.count.size
+        self.count += np.bincount(cell, minlength=size).reshape(self.shape)
+        self.crg_score_sum += np.bincount(cell, weights=crg_scores, minlength=size).reshape(self.shape)
+        if model_scores is not None:
+            self.model_score_sum += np.bincount(cell, weights=np.asarray(model_scores, dtype=np.float64),
+                                                minlength=size).reshape(self.shape)
+        return self
+
+    @property
+    def rows(self):
+        return int(self.count.sum())
+
+    def totals(self, *dims):
+        """DataFrame of the measures summed over every dimension not in `dims` (plus mean crg_score)."""
+        axes = tuple(i for i, d in enumerate(DIMS) if d not in dims)
+        summed = {m: getattr(self, m).sum(axis=axes) for m in MEASURES}
+        index = pd.MultiIndex.from_product([self.dim_values(d) for d in DIMS if d in dims],
+                                           names=[d for d in DIMS if d in dims])
+        df = pd.DataFrame({m: v.ravel() for m, v in summed.items()}, index=index).reset_index()
+        df['mean_crg_score'] = df['crg_score_sum'] / df['count'].where(df['count'] > 0)
+        return df
+
+    def to_dict(self):
+        """Dimensions plus the non-empty cells, one record each (the format the UI reads)."""
+        nz = np.flatnonzero(self.count)
+        idx = np.unravel_index(nz, self.shape)
+        cells = {d: np.asarray(self.dim_values(d), dtype=object)[i].tolist() for d, i in zip(DIMS, idx)}
+        cells.update({m: getattr(self, m).ravel()[nz].tolist() for m in MEASURES})
+        return {
+            'dims': {d: self.dim_values(d) for d in DIMS},
+            'bin_width': BIN_WIDTH,
+            'rows': self.rows,
+            'cells': [dict(zip(cells, values)) for values in zip(*cells.values())],
+        }
+
+    def save(self, *paths):
+        data = self.to_dict()
+        for path in paths or (CUBE_PATH,):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(data, f)
+        logger.info(f"Report cube ({self.rows} rows, {len(data['cells'])} cells) saved to {', '.join(paths or (CUBE_PATH,))}")
+
+    @classmethod
+    def load(cls, path=CUBE_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        dims = data['dims']
+        cube = cls(dims['segment'], dims['promo_type'], dims['action'])
+        if data['cells']:
+            cells = pd.DataFrame(data['cells'])
+            cell = np.ravel_multi_index((
+                _codes(cells['segment'], cube.segments, "segment"), _codes(cells['action'], cube.actions, "action"),
+                (cells['score_bin'].to_numpy() // BIN_WIDTH).astype(np.int64),
+                _codes(cells['promo_type'], cube.promo_types, "promo_type"),
+            ), cube.shape)
+            for m in MEASURES:
+                getattr(cube, m).flat[cell] = cells[m].to_numpy()
+        return cube
@@ -0,0 +1,95 @@
+import numpy as np
+
+# Vectorized window kernels over event arrays sorted by (player code, timestamp).
+# Player codes are dense ints (e.g. from pd.factorize), timestamps int64 nanoseconds.
+
+NS_PER_MS = 1_000_000
+NS_PER_MIN = 60 * 1_000_000_000
+
+def sort_order(codes, ts):
+    """Permutation that sorts events by player then time."""
+    return np.lexsort((ts, codes))
+
+def key_space(ts_arrays, max_code, pad_ms=0):
+    """
+    (origin, bits) for composite keys shared by several arrays, e.g. events
+    and the promo timestamps they are looked up against.
+    """
+    non_empty = [t for t in ts_arrays if len(t)]
+    if not non_empty:
+        return 0, 1
+    origin = min(int(t.min()) for t in non_empty)
+    span_ms = (max(int(t.max()) for t in non_empty) - origin) // NS_PER_MS
+    bits = int(span_ms + pad_ms).bit_length() + 1
+    if max_code >= 2 ** (62 - bits):
+        raise ValueError("Too many players for the event time span")
+    return origin, bits
+
+def composite_key(codes, ts, pad_ms=0, space=None):
+    """
+    Single monotone int64 key (player, time) so one searchsorted can find
+    window bounds for all players at once. Time is kept at ms resolution,
+    which leaves room for ~2^28 players over a year of history.
+    pad_ms reserves room so key - pad_ms never reaches the previous player.
+    """
+    if space is None:
+        space = key_space([ts], int(codes.max()) if len(codes) else 0, pad_ms)
+    origin, bits = space
+    return (codes.astype(np.int64) << bits) + (ts - origin) // NS_PER_MS
+
+def trailing_window_counts(codes, ts, window_ns):
+    """For each event, number of same-player events in (t - window, t]."""
+    window_ms = window_ns // NS_PER_MS
+    key = composite_key(codes, ts, pad_ms=window_ms)
+    start = np.searchsorted(key, key - window_ms, side='right')
+    return np.arange(len(key)) - start + 1
+
+def group_max(codes, values, n_groups, fill=0):
+    out = np.full(n_groups, fill, dtype=np.result_type(values, type(fill)))
+    np.maximum.at(out, codes, values)
+    return out
+
+def group_sum(codes, values, n_groups):
+    return np.bincount(codes, weights=values, minlength=n_groups)
+
+def sessionize(codes, ts, gap_ns):
+    """
+    Splits each player's events into sessions at gaps longer than gap_ns.
+    Returns per-session (player code, start ts, end ts), ordered by player then time.
+    """
+    if len(ts) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+    new_session = np.empty(len(ts), dtype=bool)
+    new_session[0] = True
+    new_session[1:] = (codes[1:] != codes[:-1]) | (np.diff(ts) > gap_ns)
+    starts = np.flatnonzero(new_session)
+    ends = np.append(starts[1:], len(ts)) - 1
+    return codes[starts], ts[starts], ts[ends]
+
+def sparse_table(values):
+    """Levels of power-of-two running maxima for O(1) range-max queries."""
+    table = [np.asarray(values)]
+    width = 1
+    while 2 * width <= len(values):
+        prev = table[-1]
+        table.append(np.maximum(prev[:-width], prev[width:]))
+        width *= 2
+    return table
+
+def range_max(table, lo, hi, fill=0):
+    """Vectorized max of values[lo:hi] for arrays of bounds; `fill` where empty."""
+    length = hi - lo
+    out = np.full(len(lo), fill, dtype=table[0].dtype)
+    ok = length > 0
+    if not ok.any():
+        return out
+    level = np.floor(np.log2(length[ok])).astype(np.int64)
+    lo_ok, hi_ok = lo[ok], hi[ok]
+    res = np.empty(len(lo_ok), dtype=table[0].dtype)
+    for k in np.unique(level):
+        sel = level == k
+        row = table[k]
+        res[sel] = np.maximum(row[lo_ok[sel]], row[hi_ok[sel] - (1 << k)])
+    out[ok] = res
+    return out
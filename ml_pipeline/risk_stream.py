@@ -0,0 +1,556 @@
+import os
+import sys
+import json
+import time
+import io
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.json as pa_json
+from .utils import DATA_DIR, RESULTS_DIR, get_logger
+from .crg_layer import CRGScorer
+from .aggregates import MAJOR_LOSS
+from .compact import BET, DEPOSIT, EVENT_CODES, EVENT_TYPES, enum_codes
+from .feature_engineering import BURST_WINDOW, SESSION_GAP
+from . import risk_kernels as rk
+
+logger = get_logger("risk_stream")
+
+# Real-time CRG: consumes an event feed (JSON lines from a file, FIFO or
+# stdin - a stand-in for the production queue) and keeps each player's risk
+# state current, so BLOCK/DOWNGRADE takes effect on the event that causes it
+# rather than at the next batch run. The feed is read in blocks of whatever
+# lines are available (up to BLOCK_BYTES), parsed column-wise by pyarrow,
+# scored a whole block at a time by numpy kernels, and the block's
+# transitions are published together. Python only touches transitions.
+#
+# Per-player state is a set of fixed-width numpy arrays (one row per player,
+# grown by doubling), so memory is constant per player:
+#   - stakes, payouts and the peak 24h deposit count per UTC day, for the
+#     last 7 days (slots stamped with their day)
+#   - the last DEPOSIT_RING deposit times (24h burst counts)
+#   - last major loss time, current session start, newest event time
+#   - the last SESSION_RING closed sessions (start time, minutes)
+# Within a block each player's events are taken in time order: running
+# window sums are prefix sums over the block plus the state from before it,
+# window starts are found with searchsorted (as in asof_features), and the
+# result is the same as applying the events one at a time, whatever the
+# block boundaries. Time is event time, so a replay of history gives the
+# same answers as live.
+#
+# Every score is as of the newest event seen for the player. Exact
+# boundaries, and where they differ from the batch features
+# (compute_risk_features):
+#   - 7d loss ratio and deposit burst: whole UTC days, the newest event's
+#     day and the 6 before it (batch: a rolling 7 x 24h)
+#   - burst counts are exact up to DEPOSIT_RING + 1, which is past the
+#     highest threshold
+#   - 30d sessions: rolling, sessions that started in the 30 x 24h before
+#     the newest event, plus the open one (as the batch counts it as a
+#     session); only a player's last SESSION_RING closed sessions are kept,
+#     so a player closing more than that within 30 days is averaged over the
+#     most recent SESSION_RING
+#   - an event older than the player's 7d window still updates sessions and
+#     the last major loss, not the 7d sums
+# Players with no major loss score no cooling-off risk.
+
+FEED_PATH = f"{DATA_DIR}/event_feed.jsonl"
+TRANSITIONS_PATH = f"{RESULTS_DIR}/crg_transitions.jsonl"
+
+DAY_MS = 86_400_000
+WEEK_SLOTS = 7 # Day buckets: today and the previous 6
+SESSION_WINDOW_MS = 30 * DAY_MS
+SESSION_RING = 32 # Closed sessions kept per player
+DEPOSIT_RING = 8 # Deposit times kept; burst counts are exact up to this + 1
+BURST_MS = int(BURST_WINDOW.total_seconds() * 1000)
+GAP_MS = int(SESSION_GAP.total_seconds() * 1000)
+_NEVER = -(1 << 62)
+_NO_DAY = -(1 << 30)
+BLOCK_BYTES = 1 << 17 # Feed bytes parsed at a time (~900 events): throughput vs publish latency
+TARGET_EVENTS_PER_S = 100_000 # bench fails end to end below this
+_READ_OPTIONS = pa_json.ReadOptions(use_threads=False, block_size=1 << 20)
+# Types of the fields we read given up front (skips inference); the timestamp
+# is still inferred since feeds carry either epoch ms or ISO strings
+_PARSE_OPTIONS = pa_json.ParseOptions(
+    explicit_schema=pa.schema([("player_id", pa.string()), ("event_type", pa.string()),
+                               ("stake_amount", pa.float64()), ("payout_amount", pa.float64())]),
+    unexpected_field_behavior="infer")
+
+# Per-player state: name -> (dtype, shape per player, initial value)
+_STATE = {
+    'week_day': (np.int32, (WEEK_SLOTS,), _NO_DAY),
+    'week_amount': (np.float64, (2, WEEK_SLOTS), 0.0), # Stakes, payouts
+    'week_burst': (np.uint8, (WEEK_SLOTS,), 0),
+    'dep_ring': (np.int64, (DEPOSIT_RING,), _NEVER),
+    'dep_head': (np.uint8, (), 0),
+    'last_loss': (np.int64, (), _NEVER),
+    'last_event': (np.int64, (), _NEVER),
+    'session_start': (np.int64, (), _NEVER),
+    'sess_start': (np.int64, (SESSION_RING,), _NEVER),
+    'sess_minutes': (np.float32, (SESSION_RING,), 0.0),
+    'sess_head': (np.uint8, (), 0),
+    'action': (np.uint8, (), None), # The scorer's default action
+    'score': (np.float32, (), 0.0),
+}
+# _SESSION_AGE[head, slot]: how many sessions were closed after the one in slot (0 = newest)
+_SESSION_AGE = ((np.arange(SESSION_RING)[:, None] - 1 - np.arange(SESSION_RING)) % SESSION_RING).astype(np.uint8)
+
+def _after(key_grp, key_values, grp, bound):
+    """
+    For each query (grp, bound), the first key row of that group with a
+    value above bound, or the group's end. Keys are sorted by group, then value.
+    """
+    if len(key_values) == 0:
+        return np.zeros(len(bound), dtype=np.int64)
+    low = min(key_values.min(), bound.min())
+    stride = max(key_values.max(), bound.max()) - low + 1
+    return np.searchsorted(key_grp * stride + (key_values - low), grp * stride + (bound - low), side='right')
+
+def _range_sum(values, lo, hi):
+    """Sums of values[lo:hi] (along the first axis) for arrays of bounds (lo <= hi)."""
+    prefix = np.zeros((len(values) + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=prefix[1:])
+    return prefix[hi] - prefix[lo]
+
+def _changes(values):
+    """True where a row differs from the one before (and on the first)."""
+    out = np.empty(len(values), dtype=bool)
+    out[0] = True
+    np.not_equal(values[1:], values[:-1], out=out[1:])
+    return out
+
+def _shift(values, fill):
+    """Each row's predecessor, `fill` for the first."""
+    out = np.empty_like(values)
+    out[0] = fill
+    out[1:] = values[:-1]
+    return out
+
+def _row_count(mask):
+    """True values per row of a 2-d mask (a BLAS product: much faster than sum(axis=1) on narrow rows)."""
+    return mask.astype(np.float32) @ np.ones(mask.shape[1], dtype=np.float32)
+
+def _row_max(values):
+    """Max per row of a narrow 2-d array, a column at a time."""
+    out = values[:, 0].copy()
+    for k in range(1, values.shape[1]):
+        np.maximum(out, values[:, k], out=out)
+    return out
+
+def _ring_slots(head, owner, size):
+    """
+    Appending items (sorted by owner) to per-player rings of `size`: which
+    items survive (each owner's last `size`) and the slot each goes to.
+    Advances the heads.
+    """
+    start = np.searchsorted(owner, owner, side='left')
+    count = np.searchsorted(owner, owner, side='right') - start
+    rank = np.arange(len(owner)) - start
+    slots = (head[owner].astype(np.int64) + rank) % size
+    end = rank == count - 1
+    head[owner[end]] = (slots[end] + 1) % size
+    return rank >= count - size, slots
+
+class RiskEngine:
+    """
+    Streaming CRG state for any number of players. consume() takes blocks
+    of events as columns (player_ids, event_codes, ts_ms, stakes, payouts)
+    and calls on_transitions(player_ids, ts_ms, old_actions, new_actions,
+    crg_scores) with the block's action changes, as lists in feed order.
+    """
+    def __init__(self, scorer=None, on_transitions=None, capacity=1024):
+        self.scorer = scorer or CRGScorer()
+        self.on_transitions = on_transitions
+        actions = [a for _, a, _ in self.scorer.actions] + [self.scorer.default_action[0]]
+        self.action_names = list(dict.fromkeys(actions))
+        self.default_code = self.action_names.index(self.scorer.default_action[0])
+        self.cutoffs = [(cut, self.action_names.index(a)) for cut, a, _ in self.scorer.actions]
+        if DEPOSIT_RING < self.scorer.thresholds['deposit_burst']['moderate']:
+            raise ValueError("Deposit ring too small for the burst thresholds")
+        self.index = {}
+        self.ids = []
+        self.n = 0
+        self.capacity = 0
+        self.events = 0
+        self.transitions = 0
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        for name, (dtype, shape, fill) in _STATE.items():
+            grown = np.full((capacity,) + shape, self.default_code if fill is None else fill, dtype=dtype)
+            if self.capacity:
+                grown[:self.capacity] = getattr(self, name)
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def players(self, player_ids):
+        """Dense indices for an array of player ids, adding players on first sight."""
+        if not isinstance(player_ids, pa.Array):
+            player_ids = pa.array(player_ids, pa.string())
+        encoded = player_ids.dictionary_encode()
+        uniques = encoded.dictionary.to_pylist()
+        index = self.index
+        known = [index.get(pid, -1) for pid in uniques]
+        if -1 in known:
+            for k, pid in enumerate(uniques):
+                if known[k] < 0:
+                    known[k] = index[pid] = self.n
+                    self.ids.append(pid)
+                    self.n += 1
+            if self.n > self.capacity:
+                self._alloc(max(self.n, self.capacity * 2))
+        return np.array(known, dtype=np.int64)[encoded.indices.to_numpy()]
+
+    def consume(self, events):
+        """Applies a block of events; returns how many were applied."""
+        player_ids, codes, ts, stakes, payouts = events
+        n = len(ts)
+        if n == 0:
+            return 0
+        idx = self.players(player_ids)
+        # Each player's events together, in time order
+        order = np.lexsort((ts, idx))
+        p, code, t = idx[order], codes[order], ts[order]
+        pos = np.arange(n)
+        first = _changes(p)
+        last = np.empty(n, dtype=bool)
+        last[:-1] = first[1:]
+        last[-1] = True
+        grp = np.cumsum(first) - 1
+        gstart = pos[first][grp]
+        bet = code == BET
+        amount = np.zeros((n, 2))
+        amount[bet, 0] = stakes[order][bet]
+        amount[bet, 1] = payouts[order][bet]
+
+        # Newest event time before and including each event
+        seen = self.last_event[p]
+        prev = _shift(t, _NEVER)
+        prev[first] = _NEVER
+        np.maximum(prev, seen, out=prev)
+        ref = np.maximum(seen, t)
+        day = t // DAY_MS
+        lo_day = ref // DAY_MS - WEEK_SLOTS # 7d window: days after this
+
+        # Burst count of each deposit: ring times from before the block plus the block's own
+        dep = np.flatnonzero(code == DEPOSIT)
+        since = t[dep] - BURST_MS
+        in_ring = _row_count(self.dep_ring.take(p[dep], axis=0) > since[:, None])
+        in_block = np.arange(len(dep)) - _after(grp[dep], t[dep], grp[dep], since) + 1
+        burst = np.zeros(n, dtype=np.uint8)
+        burst[dep] = np.minimum(in_ring + in_block, DEPOSIT_RING + 1)
+
+        # 7d sums: day buckets still in the window, plus the block's events in it so far
+        live = self.week_day.take(p, axis=0) > lo_day[:, None]
+        lo = np.minimum(_after(grp, day, grp, lo_day), pos + 1)
+        week = (np.einsum('ikj,ij->ik', self.week_amount.take(p, axis=0), live.astype(np.float64)) +
+                _range_sum(amount, lo, pos + 1))
+        stake_7d, payout_7d = week[:, 0], week[:, 1]
+        if (lo == gstart).all():
+            # Whole block in the window (the usual case): a running max per player
+            offset = grp * (DEPOSIT_RING + 2)
+            in_block = np.maximum.accumulate(offset + burst) - offset
+        else:
+            in_block = rk.range_max(rk.sparse_table(burst), lo, pos + 1, fill=0)
+        burst_7d = np.maximum(_row_max(self.week_burst.take(p, axis=0) * live), in_block)
+
+        # Last major loss so far
+        major = np.maximum.accumulate(np.where(bet & (amount[:, 0] - amount[:, 1] > MAJOR_LOSS), pos, -1))
+        loss_t = np.maximum(self.last_loss[p], np.where(major >= gstart, t[major], _NEVER))
+
+        # Sessions: a gap over 30 min closes the open one
+        opened = np.maximum.accumulate(np.where(t - prev > GAP_MS, pos, -1))
+        open_before = self.session_start[p]
+        start = np.where(opened >= gstart, t[opened], open_before)
+        before = _shift(start, _NEVER)
+        before[first] = open_before[first]
+        closes = np.flatnonzero((opened == pos) & (before != _NEVER))
+        c_start = before[closes]
+        c_minutes = (prev[closes] - c_start) / 60000
+        # 30d average: the block's closed sessions so far, then the ring's newest ones up to SESSION_RING in all
+        month = ref - SESSION_WINDOW_MS
+        hi = np.searchsorted(closes, pos, side='right')
+        lo = np.maximum(_after(grp[closes], c_start, grp, month), hi - SESSION_RING)
+        lo = np.minimum(lo, hi)
+        newer = hi - np.searchsorted(closes, gstart)
+        ring = self.sess_start.take(p, axis=0) > month[:, None]
+        capped = np.flatnonzero(newer)
+        ring[capped] &= _SESSION_AGE[self.sess_head[p[capped]]] < (SESSION_RING - newer[capped])[:, None]
+        minutes = (np.einsum('ij,ij->i', self.sess_minutes.take(p, axis=0), ring, dtype=np.float64) +
+                   _range_sum(c_minutes, lo, hi))
+        sessions = _row_count(ring) + (hi - lo)
+        avg_session = (minutes + (ref - start) / 60000) / (sessions + 1)
+
+        # Score and action after each event
+        s, w = self.scorer, self.scorer.weights
+        hours = np.where(loss_t != _NEVER, (ref - loss_t) / 3_600_000, np.inf)
+        score = (s.s_scores((stake_7d - payout_7d) / (stake_7d + 1e-6), 'loss_ratio_7d') * w['loss_ratio_7d'] +
+                 s.s_scores(burst_7d, 'deposit_burst') * w['deposit_burst'] +
+                 s.s_scores(avg_session, 'session_duration') * w['session_duration'] +
+                 s.s_scores(hours, 'cooling_off') * w['cooling_off'])
+        action = np.full(n, self.default_code, dtype=np.uint8)
+        for cut, a in reversed(self.cutoffs): # The first cut-off met wins
+            action[score >= cut] = a
+        old = _shift(action, 0)
+        old[first] = self.action[p][first]
+        changed = np.flatnonzero(action != old)
+
+        # State as of each player's last event
+        players = p[last]
+        self.last_event[players] = ref[last]
+        self.session_start[players] = start[last]
+        self.last_loss[players] = loss_t[last]
+        self.action[players] = action[last]
+        self.score[players] = score[last]
+        # Day buckets: one per (player, day) still in the player's window
+        run = np.flatnonzero(first | _changes(day))
+        fresh = day[run] > lo_day[last][grp[run]]
+        run_p, run_day = p[run][fresh], day[run][fresh]
+        slot = run_day % WEEK_SLOTS
+        same = self.week_day[run_p, slot] == run_day
+        self.week_amount[run_p, :, slot] = (self.week_amount[run_p, :, slot] * same[:, None] +
+                                         np.add.reduceat(amount, run, axis=0)[fresh])
+        self.week_burst[run_p, slot] = np.maximum(np.where(same, self.week_burst[run_p, slot], 0),
+                                                  np.maximum.reduceat(burst, run)[fresh])
+        self.week_day[run_p, slot] = run_day
+        keep, slots = _ring_slots(self.dep_head, p[dep], DEPOSIT_RING)
+        self.dep_ring[p[dep][keep], slots[keep]] = t[dep][keep]
+        keep, slots = _ring_slots(self.sess_head, p[closes], SESSION_RING)
+        self.sess_start[p[closes][keep], slots[keep]] = c_start[keep]
+        self.sess_minutes[p[closes][keep], slots[keep]] = c_minutes[keep]
+
+        self.events += n
+        self.transitions += len(changed)
+        if self.on_transitions is not None and len(changed):
+            changed = changed[np.argsort(order[changed], kind='stable')] # Feed order
+            ids, names = self.ids, self.action_names
+            self.on_transitions([ids[i] for i in p[changed].tolist()], t[changed].tolist(),
+                                [names[a] for a in old[changed].tolist()], [names[a] for a in action[changed].tolist()],
+                                np.round(score[changed], 2).tolist())
+        return n
+
+    def state(self, player_id):
+        i = self.index.get(player_id)
+        if i is None:
+            return None
+        return {'player_id': player_id, 'crg_score': float(self.score[i]), 'risk_action': self.action_names[self.action[i]]}
+
+    def actions(self):
+        """{player_id: current action} for every player seen."""
+        return {pid: self.action_names[self.action[i]] for pid, i in self.index.items()}
+
+    def memory_mb(self):
+        return sum(getattr(self, name).nbytes for name in _STATE) / 1e6
+
+def parse_line(line):
+    """Event tuple (player_id, event_code, ts_ms, stake, payout) from one JSON line; timestamps as epoch ms or ISO strings."""
+    e = json.loads(line)
+    ts = e['event_timestamp']
+    if isinstance(ts, str):
+        ts = int(np.datetime64(ts, 'ms').astype(np.int64))
+    return (e['player_id'], EVENT_CODES[e['event_type']], ts, e.get('stake_amount') or 0.0, e.get('payout_amount') or 0.0)
+
+def read_blocks(path, follow=False, block_bytes=BLOCK_BYTES, poll=0.05):
+    """
+    Chunks of whole JSON lines (bytes) from a feed file ('-' for stdin), up
+    to about block_bytes each - whatever is available, so a trickling feed
+    yields small blocks straight away. follow keeps tailing it like a queue
+    consumer; a partly written last line waits for the rest.
+    """
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    rest = b""
+    try:
+        while True:
+            data = f.read1(block_bytes) if hasattr(f, "read1") else f.read(block_bytes)
+            if data:
+                data = rest + data
+                end = data.rfind(b"\n") + 1
+                data, rest = data[:end], data[end:]
+                if data.strip():
+                    yield data
+            elif follow:
+                time.sleep(poll)
+            else:
+                if rest.strip():
+                    yield rest + b"\n"
+                break
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+def parse_block(block):
+    """
+    Engine columns (player_ids, event_codes, ts_ms, stakes, payouts) from a
+    block of JSON lines, parsed column-wise by pyarrow (per line if that fails).
+    """
+    try:
+        table = pa_json.read_json(io.BytesIO(block), read_options=_READ_OPTIONS, parse_options=_PARSE_OPTIONS)
+    except pa.ArrowInvalid:
+        # e.g. a block mixing epoch-ms and ISO timestamps
+        rows = [parse_line(line) for line in block.splitlines() if line.strip()]
+        ids, codes, ts, stakes, payouts = zip(*rows)
+        return (pa.array(ids, pa.string()), np.array(codes, dtype=np.int8), np.array(ts, dtype=np.int64),
+                np.array(stakes, dtype=np.float64), np.array(payouts, dtype=np.float64))
+    codes = enum_codes(table['event_type'], EVENT_TYPES)
+    if (codes < 0).any():
+        raise ValueError(f"Unknown event types in feed: {set(table['event_type'].filter(pa.array(codes < 0)).to_pylist())}")
+    ts = table['event_timestamp']
+    if pa.types.is_integer(ts.type):
+        ts = ts.to_numpy().astype(np.int64)
+    elif pa.types.is_timestamp(ts.type):
+        ts = ts.cast(pa.timestamp("ms")).cast(pa.int64()).to_numpy()
+    else:
+        # ISO strings, parsed as parse_line does
+        ts = ts.to_numpy(zero_copy_only=False).astype('datetime64[ms]').astype(np.int64)
+    # Schema fields missing from a block come back as all-null columns
+    stakes, payouts = (table[name].fill_null(0.0).to_numpy() for name in ("stake_amount", "payout_amount"))
+    return table['player_id'].combine_chunks(), codes.astype(np.int8), ts, stakes, payouts
+
+class TransitionLog:
+    """
+    Publishes action changes as JSON lines. Lines are buffered while a block
+    is consumed and flushed once at its end (a batched publish, like a
+    producer's linger); latency is from reading the block to that flush.
+    """
+    def __init__(self, path=TRANSITIONS_PATH):
+        self.f = sys.stdout if path == "-" else open(path, "a")
+        self.received = None # perf_counter when the current block was read
+        self.pending = []
+        self.latencies = []
+        self._quoted = {} # player_id -> its JSON string
+
+    def __call__(self, player_ids, ts, old, new, scores):
+        quoted = self._quoted
+        for pid in player_ids:
+            if pid not in quoted:
+                quoted[pid] = json.dumps(pid)
+        # Same JSON as json.dumps of the dict; action names are plain identifiers
+        self.pending.extend([f'{{"player_id": {quoted[pid]}, "event_timestamp": {t}, '
+                             f'"from": "{a}", "to": "{b}", "crg_score": {sc}}}'
+                             for pid, t, a, b, sc in zip(player_ids, ts, old, new, scores)])
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.f.write("\n".join(self.pending) + "\n")
+        self.f.flush()
+        if self.received is not None:
+            self.latencies.extend([time.perf_counter() - self.received] * len(self.pending))
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        if self.f is not sys.stdout:
+            self.f.close()
+
+def run_feed(path, out=TRANSITIONS_PATH, follow=False, scorer=None, block_bytes=BLOCK_BYTES):
+    """
+    Consumes a feed block by block: each block is parsed and scored in one
+    go, and its transitions are published when it is done. Publish latency
+    is measured from when the event's block was read.
+    """
+    log = TransitionLog(out)
+    engine = RiskEngine(scorer, on_transitions=log)
+    start = time.perf_counter()
+    try:
+        for block in read_blocks(path, follow, block_bytes):
+            log.received = time.perf_counter()
+            engine.consume(parse_block(block))
+            log.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
+    elapsed = time.perf_counter() - start
+    lat = np.array(log.latencies) * 1000 if log.latencies else np.zeros(1)
+    report = {
+        'events': engine.events, 'players': engine.n, 'transitions': engine.transitions,
+        'seconds': elapsed, 'events_per_s': engine.events / elapsed if elapsed > 0 else None,
+        'publish_latency_ms': {'p50': float(np.percentile(lat, 50)), 'p99': float(np.percentile(lat, 99)),
+                               'max': float(lat.max())},
+        'state_mb': engine.memory_mb(),
+    }
+    logger.info(f"{report['events']} events from {report['players']} players, {report['transitions']} transitions, "
+                f"{report['events_per_s']:,.0f} events/s, publish p99 {report['publish_latency_ms']['p99']:.3f}ms")
+    return engine, report
+
+def load_events(limit=None):
+    """The events table in time order (what a replayed feed carries), event codes and epoch ms added."""
+    from .storage import dataset
+    cols = ['player_id', 'event_type', 'event_timestamp', 'deposit_amount', 'stake_amount', 'payout_amount']
+    table = dataset("events").to_table(columns=cols).sort_by('event_timestamp')
+    if limit:
+        table = table.slice(0, limit)
+    df = table.to_pandas()
+    df['event_code'] = df['event_type'].map(EVENT_CODES).astype(np.int8)
+    df['ts_ms'] = df['event_timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    for c in ('deposit_amount', 'stake_amount', 'payout_amount'):
+        df[c] = df[c].astype(np.float64).fillna(0.0)
+    return df
+
+def event_blocks(df, size):
+    """Engine columns for consecutive slices of load_events' frame."""
+    for s in range(0, len(df), size):
+        part = df.iloc[s:s + size]
+        yield (pa.array(part['player_id'].to_numpy(dtype=object), pa.string()), part['event_code'].to_numpy(),
+               part['ts_ms'].to_numpy(), part['stake_amount'].to_numpy(), part['payout_amount'].to_numpy())
+
+def write_feed(path=FEED_PATH, limit=None):
+    """Replays the events table into a JSON lines feed (the producer stand-in)."""
+    df = load_events(limit)
+    with open(path, "w") as f:
+        for pid, code, ts, dep, stake, payout in zip(df['player_id'], df['event_code'], df['ts_ms'], df['deposit_amount'],
+                                                     df['stake_amount'], df['payout_amount']):
+            f.write(json.dumps({'player_id': pid, 'event_type': EVENT_TYPES[code], 'event_timestamp': int(ts),
+                                'deposit_amount': float(dep), 'stake_amount': float(stake), 'payout_amount': float(payout)}) + "\n")
+    logger.info(f"Wrote event feed to {path}")
+
+def benchmark(limit=None, feed=FEED_PATH, block_events=900):
+    """
+    Throughput on one core: the engine alone on pre-parsed blocks of
+    block_events, then end to end (read, parse, score, publish) on the JSON
+    feed, written from the events table first if there is none. Returns
+    the end-to-end report.
+    """
+    blocks = list(event_blocks(load_events(limit), block_events))
+    engine = RiskEngine()
+    start = time.perf_counter()
+    for block in blocks:
+        engine.consume(block)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Engine only: {engine.events} events, {engine.n} players: {engine.events / elapsed:,.0f} events/s "
+                f"({elapsed / engine.events * 1e6:.2f}us/event), {engine.transitions} transitions, "
+                f"state {engine.memory_mb():.1f} MB")
+    if not os.path.exists(feed):
+        write_feed(feed, limit)
+    _, report = run_feed(feed, os.devnull)
+    logger.info(f"End to end from {feed}: {report['events_per_s']:,.0f} events/s, "
+                f"publish p50 {report['publish_latency_ms']['p50']:.2f}ms, p99 {report['publish_latency_ms']['p99']:.2f}ms")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming CRG risk engine over an event feed")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Consume a JSON lines feed and publish action transitions")
+    run.add_argument("--feed", default=FEED_PATH, help="File, FIFO or - for stdin")
+    run.add_argument("--out", default=TRANSITIONS_PATH, help="Transitions JSON lines (- for stdout)")
+    run.add_argument("--follow", action="store_true", help="Keep tailing the feed")
+    replay = sub.add_parser("replay", help="Write the events table as a feed, in time order")
+    replay.add_argument("--out", default=FEED_PATH)
+    replay.add_argument("--limit", type=int, default=None)
+    bench = sub.add_parser("bench", help="Engine throughput on the events table, and end to end on the feed; "
+                                         f"exits 1 below {TARGET_EVENTS_PER_S:,} events/s end to end")
+    bench.add_argument("--limit", type=int, default=None)
+    bench.add_argument("--feed", default=FEED_PATH)
+    bench.add_argument("--target", type=int, default=TARGET_EVENTS_PER_S, help="Events/s required end to end")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_feed(args.feed, args.out, args.follow)
+    elif args.command == "replay":
+        write_feed(args.out, args.limit)
+    else:
+        report = benchmark(args.limit, args.feed)
+        if report['events_per_s'] < args.target:
+            logger.error(f"End to end {report['events_per_s']:,.0f} events/s is below the {args.target:,} target")
+            sys.exit(1)
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import time
+import argparse
+from collections import deque
+from urllib.parse import urlsplit
+import numpy as np
+from .utils import get_logger
+from .predict_next import (
+    build_player_profile, explain_top_k, load_artifacts, open_cache, player_rows, rank_top_k, sanitize, score_players
+)
+from .explain import Explainer
+from .drift import DriftMonitor
+
+logger = get_logger("serve")
+
+class LatencyStats:
+    """Rolling request latencies (last `window` requests) with percentile readout."""
+    def __init__(self, window=10000):
+        self.samples = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.batched_requests = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.requests += 1
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batched_requests += size
+
+    def summary(self):
+        lat = np.array(self.samples) * 1000 if self.samples else np.zeros(1)
+        return {
+            'requests': self.requests,
+            'p50_ms': float(np.percentile(lat, 50)),
+            'p99_ms': float(np.percentile(lat, 99)),
+            'max_ms': float(lat.max()),
+            'batches': self.batches,
+            'avg_batch_size': self.batched_requests / self.batches if self.batches else 0.0,
+        }
+
+class RecommendationService:
+    """
+    Model, encoder, feature list and a player feature index loaded once.
+    Concurrent lookups are queued and scored together in micro-batches:
+    one candidate matrix and one predict_proba call per batch.
+    """
+    def __init__(self, max_batch=64, max_wait_ms=2.0):
+        self.model, self.features, self.enc, self.scorer = load_artifacts()
+        self.explainer = Explainer(self.model, self.features)
+        self.cache = open_cache(self.model) # In memory: repeat lookups skip the model
+        self.drift = DriftMonitor.open() # Over the players requested since startup
+        self.players = player_rows()
+        self.index = {pid: i for i, pid in enumerate(self.players['player_id'])}
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.stats = LatencyStats()
+        logger.info(f"Loaded model and {len(self.index)} players")
+
+    async def recommend(self, player_id):
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((self.index[player_id], fut))
+        return await fut
+
+    def _score(self, rows):
+        chunk = self.players.iloc[rows]
+        probs, final, crg = score_players(self.model, self.features, self.enc, chunk, self.scorer, self.cache)
+        top_idx = rank_top_k(final)
+        drivers = explain_top_k(self.explainer, self.features, self.enc, chunk, top_idx)
+        if self.drift is not None:
+            self.drift.update(chunk)
+        return [
+            sanitize(build_player_profile(
+                p_row, crg['crg_score'].iat[i], crg['risk_action'].iat[i], crg['multiplier'].iat[i],
+                probs[i], top_idx[i], drivers[i]
+            ))
+            for i, p_row in enumerate(chunk.to_dict('records'))
+        ]
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            rows = [row for row, _ in batch]
+            try:
+                # Scoring runs off the event loop so new requests keep queueing
+                profiles = await loop.run_in_executor(None, self._score, rows)
+                for (_, fut), profile in zip(batch, profiles):
+                    if not fut.done():
+                        fut.set_result(profile)
+            except Exception as e:
+                logger.exception("Batch scoring failed")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            self.stats.record_batch(len(batch))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                # Drain any request body so the next request line on a keep-alive connection lines up
+                await reader.readexactly(int(headers.get("content-length") or 0))
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                status, body = await self.route(method, urlsplit(target).path)
+
+                payload = json.dumps(body).encode()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path):
+        if method != "GET":
+            return "405 Method Not Allowed", {"error": "GET only"}
+        if path.startswith("/recommendations/"):
+            player_id = path.rsplit("/", 1)[-1]
+            if player_id not in self.index:
+                return "404 Not Found", {"error": f"unknown player {player_id}"}
+            # Only scored requests count towards the latency stats, not instant 404s
+            start = time.perf_counter()
+            profile = await self.recommend(player_id)
+            self.stats.record(time.perf_counter() - start)
+            return "200 OK", profile
+        if path == "/metrics":
+            lookups = self.explainer.hits + self.explainer.misses
+            metrics = dict(self.stats.summary(), explain_cache_hit_rate=self.explainer.hits / lookups if lookups else 0.0)
+            if self.cache is not None:
+                metrics['prediction_cache_hit_rate'] = self.cache.stats()['hit_rate']
+            return "200 OK", metrics
+        if path == "/drift":
+            if self.drift is None:
+                return "404 Not Found", {"error": "no drift reference"}
+            return "200 OK", self.drift.report()
+        if path == "/health":
+            return "200 OK", {"status": "ok", "players": len(self.index)}
+        return "404 Not Found", {"error": "not found"}
+
+    async def serve(self, host, port):
+        self.queue = asyncio.Queue()
+        batcher = asyncio.create_task(self.batch_loop())
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Serving on http://{host}:{port} (max batch {self.max_batch}, max wait {self.max_wait * 1000:.1f}ms)")
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                batcher.cancel()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    service = RecommendationService(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    asyncio.run(service.serve(args.host, args.port))
@@ -0,0 +1,246 @@
+import os
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from .utils import DATA_DIR, EVENTS_DIR, FEATURE_STORE_DIR, RESULTS_DIR, get_logger
+
+logger = get_logger("storage")
+
+# --- Declared Schemas ---
+# Low-cardinality strings are dictionary encoded and come back as pandas Categoricals.
+CATEGORY = pa.dictionary(pa.int8(), pa.string())
+TIMESTAMP = pa.timestamp("ns")
+
+SCHEMAS = {
+    "players": pa.schema([
+        ("player_id", pa.string()),
+        ("country", CATEGORY),
+        ("currency", CATEGORY),
+        ("value_segment", CATEGORY),
+        ("age_group", CATEGORY),
+        ("gender", CATEGORY),
+        ("region", CATEGORY),
+        ("latent_propensity", pa.float64()),
+    ]),
+    "events": pa.schema([
+        ("player_id", pa.string()),
+        ("event_type", CATEGORY),
+        ("deposit_amount", pa.float64()),
+        ("event_timestamp", TIMESTAMP),
+        ("withdrawal_amount", pa.float64()),
+        ("stake_amount", pa.float64()),
+        ("payout_amount", pa.float64()),
+        ("event_id", pa.string()),
+    ]),
+    "promos": pa.schema([
+        ("player_id", pa.string()),
+        ("promo_type", CATEGORY),
+        ("promo_timestamp", TIMESTAMP),
+        ("engaged", pa.int8()),
+    ]),
+    # Normalized training data (see training_data.py): one-hot player feature
+    # matrix and the promo fact table; columns depend on the data - schema is inferred
+    "train_players": None,
+    "train_promos": None,
+}
+# Feature store state: lifetime partial aggregates + recent event tail
+SCHEMAS["store_aggregates"] = None
+SCHEMAS["store_tail"] = SCHEMAS["events"]
+# Batch inference output, one row per (player, rank)
+SCHEMAS["recommendations"] = pa.schema([
+    ("player_id", pa.string()),
+    ("rank", pa.int8()),
+    ("promo_type", CATEGORY),
+    ("model_score", pa.float64()),
+    ("final_score", pa.float64()),
+    ("crg_score", pa.float64()),
+    ("risk_action", CATEGORY),
+    ("risk_status", CATEGORY),
+    ("reason", pa.string()),
+])
+
+PATHS = {
+    "players": f"{DATA_DIR}/players.parquet",
+    "events": EVENTS_DIR,
+    "promos": f"{DATA_DIR}/promo_events.parquet",
+    "train_players": f"{DATA_DIR}/train_players.parquet",
+    "train_promos": f"{DATA_DIR}/train_promos.parquet",
+    "store_aggregates": f"{FEATURE_STORE_DIR}/aggregates.parquet",
+    "store_tail": f"{FEATURE_STORE_DIR}/tail.parquet",
+    "recommendations": f"{RESULTS_DIR}/recommendations.parquet",
+}
+
+TIMESTAMP_COLUMNS = {
+    "events": "event_timestamp",
+    "promos": "promo_timestamp",
+}
+
+# Hive partitioning by month of the table's timestamp column
+PARTITIONS = {
+    "events": "event_month",
+}
+
+def _partition_value(ts):
+    """(per-row month codes, "YYYY-MM" label per code); only the months in range are formatted."""
+    months = ts.values.astype('datetime64[M]').astype(np.int64)
+    first = months.min() if len(months) else 0
+    labels = [str(np.datetime64(m, 'M')) for m in range(first, (months.max() if len(months) else -1) + 1)]
+    return months - first, labels
+
+def _to_arrow(df, name):
+    schema = SCHEMAS[name]
+    if schema is None:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+def write_table(df, name):
+    """Writes a whole (unpartitioned) table as a single Parquet file."""
+    path = PATHS[name]
+    pq.write_table(_to_arrow(df, name), path)
+    logger.info(f"Wrote {len(df)} rows to {path}")
+
+def reset_table(name):
+    """Removes a dataset before it is rewritten, so stale parts never mix in."""
+    path = PATHS[name]
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+class TableWriter:
+    """Streams DataFrame chunks into a single Parquet file, one row group per chunk."""
+    def __init__(self, name):
+        self.name = name
+        self.writer = pq.ParquetWriter(PATHS[name], SCHEMAS[name])
+        self.rows = 0
+
+    def write(self, df):
+        self.writer.write_table(_to_arrow(df, self.name))
+        self.rows += len(df)
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class PartitionedWriter:
+    """
+    Streams DataFrame chunks into a hive-partitioned dataset.
+    Keeps one Parquet file open per partition, each chunk becomes a row group.
+    `part` names the files, so concurrent writers (e.g. shards) never collide.
+    """
+    def __init__(self, name, part=0):
+        self.name = name
+        self.part = part
+        self.schema = SCHEMAS[name]
+        self.partition_col = PARTITIONS[name]
+        self.ts_col = TIMESTAMP_COLUMNS[name]
+        self.writers = {}
+        self.rows = 0
+
+    def write(self, df):
+        codes, labels = _partition_value(df[self.ts_col])
+        for code, chunk in df.groupby(codes, sort=False):
+            key = labels[code]
+            writer = self.writers.get(key)
+            if writer is None:
+                part_dir = f"{PATHS[self.name]}/{self.partition_col}={key}"
+                os.makedirs(part_dir, exist_ok=True)
+                writer = pq.ParquetWriter(f"{part_dir}/part-{self.part:05d}.parquet", self.schema)
+                self.writers[key] = writer
+            writer.write_table(_to_arrow(chunk, self.name))
+        self.rows += len(df)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def dataset(name):
+    path = PATHS[name]
+    if name in PARTITIONS:
+        part_schema = pa.schema([(PARTITIONS[name], pa.string())])
+        return ds.dataset(path, format="parquet", partitioning=ds.partitioning(part_schema, flavor="hive"))
+    return ds.dataset(path, format="parquet")
+
+def time_filter(name, start=None, end=None):
+    """
+    Row filter on the table's timestamp column for (start, end].
+    For partitioned tables it also prunes whole month partitions.
+    """
+    ts = ds.field(TIMESTAMP_COLUMNS[name])
+    month = ds.field(PARTITIONS[name]) if name in PARTITIONS else None
+    conds = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        conds.append(ts > pa.scalar(start.as_unit("ns").to_datetime64(), TIMESTAMP))
+        if month is not None:
+            conds.append(month >= start.strftime("%Y-%m"))
+    if end is not None:
+        end = pd.Timestamp(end)
+        conds.append(ts <= pa.scalar(end.as_unit("ns").to_datetime64(), TIMESTAMP))
+        if month is not None:
+            conds.append(month <= end.strftime("%Y-%m"))
+    expr = None
+    for cond in conds:
+        expr = cond if expr is None else expr & cond
+    return expr
+
+def read_table(name, columns=None, filter=None):
+    """
+    Reads a table with column projection and an optional pyarrow row filter
+    (see time_filter), both pushed down to the Parquet reader.
+    """
+    if columns is None and SCHEMAS[name] is not None:
+        columns = SCHEMAS[name].names
+    table = dataset(name).to_table(columns=columns, filter=filter)
+    return table.to_pandas()
+
+def iter_batches(name, columns=None, filter=None, batch_size=1000000):
+    """
+    Yields the table as DataFrames of at most batch_size rows.
+    Readahead is kept minimal so memory stays bounded by the batch size.
+    """
+    if columns is None and SCHEMAS[name] is not None:
+        columns = SCHEMAS[name].names
+    batches = dataset(name).to_batches(
+        columns=columns, filter=filter, batch_size=batch_size,
+        batch_readahead=1, fragment_readahead=1
+    )
+    for batch in batches:
+        yield batch.to_pandas()
+
+def export_csv(name, out_path=None, batch_size=500000):
+    """CSV export, streamed batch by batch."""
+    out_path = out_path or f"{DATA_DIR}/{name}.csv"
+    first = True
+    for batch in iter_batches(name, batch_size=batch_size):
+        batch.to_csv(out_path, mode="w" if first else "a", header=first, index=False)
+        first = False
+    logger.info(f"Exported {name} to {out_path}")
+    return out_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export a table to CSV")
+    export.add_argument("table", choices=sorted(PATHS))
+    export.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_csv(args.table, args.out)
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import resource
+import functools
+import threading
+from .utils import LOGS_DIR, get_logger
+
+logger = get_logger("telemetry")
+
+# Structured stage telemetry next to the text logs: every span writes one JSON
+# line (wall and CPU seconds, RSS, rows in/out, throughput) to
+# logs/telemetry.jsonl, and a per-span-name summary of the run is written at
+# exit by the process that started the run.
+# Off unless BPP_TELEMETRY=1 (or enable() is called); when off, span() hands
+# back one shared no-op object, so instrumented code pays a dict lookup
+# (benchmark.telemetry_overhead measures it: a few hundred ns per call).
+# Stage entry points carry @timed, so they get a span run standalone too.
+#
+# cpu_s is process CPU time (all threads, BLAS/OpenMP included), so spans
+# that overlap in time - concurrent pipeline stages - share it.
+
+TELEMETRY_PATH = f"{LOGS_DIR}/telemetry.jsonl"
+SUMMARY_PATH = f"{LOGS_DIR}/telemetry_summary.json"
+
+_state = {'enabled': False, 'path': None, 'run_id': None}
+_lock = threading.Lock()
+_local = threading.local()
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return None
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux (bytes on macOS); process high-water mark so far
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / 1e6
+
+def enable(path=TELEMETRY_PATH, run_id=None):
+    """
+    Turns telemetry on for this process. The run id goes through the
+    environment, so worker processes started afterwards log under it too.
+    """
+    run_id = run_id or os.environ.get("BPP_RUN_ID") or time.strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:6]
+    os.environ["BPP_TELEMETRY"] = "1"
+    os.environ["BPP_RUN_ID"] = run_id
+    # The process that started the run writes its summary; workers only log spans
+    owner = os.environ.setdefault("BPP_RUN_OWNER", str(os.getpid())) == str(os.getpid())
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if owner and not _state['enabled']:
+        atexit.register(write_summary)
+    _state.update(enabled=True, path=path, run_id=run_id)
+    return run_id
+
+def enabled():
+    return _state['enabled']
+
+class _NoSpan:
+    rows_in = rows_out = None
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def set(self, **attrs):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+class Span:
+    """One timed block. Set .rows_out (or .set(key=value)) inside it."""
+    def __init__(self, name, rows_in=None, **attrs):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _local.__dict__.setdefault('stack', [])
+        self.parent = stack[-1] if stack else None
+        self.path = f"{self.parent.path}/{self.name}" if self.parent else self.name
+        stack.append(self)
+        self.start_rss = _rss_mb()
+        self.start_cpu = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.start_cpu
+        _local.stack.pop()
+        rss = _rss_mb()
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        record = {
+            'run_id': _state['run_id'], 'span': self.path, 'name': self.name,
+            'ts': time.time() - wall, 'wall_s': wall, 'cpu_s': cpu,
+            'rss_mb': rss, 'rss_delta_mb': rss - self.start_rss if rss is not None and self.start_rss is not None else None,
+            'peak_rss_mb': _peak_rss_mb(),
+            'rows_in': self.rows_in, 'rows_out': self.rows_out,
+            'rows_per_s': rows / wall if rows is not None and wall > 0 else None,
+            'pid': os.getpid(), 'thread': threading.current_thread().name,
+            'status': 'error' if exc_type else 'ok',
+        }
+        if self.attrs:
+            record['attrs'] = self.attrs
+        _emit(record)
+        return False
+
+def _emit(record):
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        # One append per line: lines from worker processes don't interleave
+        with open(_state['path'], "a") as f:
+            f.write(line)
+
+def span(name, rows_in=None, **attrs):
+    """Context manager timing a stage or sub-step; a shared no-op when telemetry is off."""
+    if not _state['enabled']:
+        return _NO_SPAN
+    return Span(name, rows_in, **attrs)
+
+def timed(name=None):
+    """Decorator form of span(); the name defaults to module.function."""
+    def decorate(fn):
+        label = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _state['enabled']:
+                return fn(*args, **kwargs)
+            with Span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def read_spans(run_id=None, path=None):
+    """Span records of one run (default: the current one) from the JSON lines file."""
+    run_id = run_id or _state['run_id']
+    with open(path or _state['path'] or TELEMETRY_PATH) as f:
+        return [r for r in map(json.loads, f) if r['run_id'] == run_id]
+
+def summary(run_id=None, path=None):
+    """
+    Per span: calls, total wall/CPU, rows, throughput and peak RSS, slowest
+    first. Read back from the file, so spans from worker processes count.
+    """
+    totals = {}
+    for r in read_spans(run_id, path):
+        t = totals.setdefault(r['span'], {
+            'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows_in': 0, 'rows_out': 0, 'peak_rss_mb': 0.0, 'errors': 0
+        })
+        t['calls'] += 1
+        t['wall_s'] += r['wall_s']
+        t['cpu_s'] += r['cpu_s']
+        t['rows_in'] += r['rows_in'] or 0
+        t['rows_out'] += r['rows_out'] or 0
+        t['peak_rss_mb'] = max(t['peak_rss_mb'], r['peak_rss_mb'])
+        t['errors'] += r['status'] == 'error'
+    for t in totals.values():
+        rows = t['rows_out'] or t['rows_in']
+        t['rows_per_s'] = rows / t['wall_s'] if rows and t['wall_s'] > 0 else None
+    spans = dict(sorted(totals.items(), key=lambda kv: -kv[1]['wall_s']))
+    peak = max((t['peak_rss_mb'] for t in spans.values()), default=_peak_rss_mb())
+    return {'run_id': run_id or _state['run_id'], 'peak_rss_mb': peak, 'spans': spans}
+
+def write_summary(path=SUMMARY_PATH):
+    """Writes and logs the run summary (registered at exit by enable(), runs once)."""
+    atexit.unregister(write_summary)
+    if not _state['enabled'] or not os.path.exists(_state['path']):
+        return None
+    report = summary()
+    if not report['spans']:
+        return None
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Telemetry summary for run {report['run_id']} (peak RSS {report['peak_rss_mb']:.0f} MB):")
+    for name, t in report['spans'].items():
+        rate = f", {t['rows_per_s']:,.0f} rows/s" if t['rows_per_s'] else ""
+        logger.info(f"  {name:<48} {t['calls']:>4}x {t['wall_s']:8.2f}s wall {t['cpu_s']:8.2f}s cpu{rate}")
+    return report
+
+if os.environ.get("BPP_TELEMETRY", "") not in ("", "0"):
+    enable()
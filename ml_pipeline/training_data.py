@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+from .storage import dataset, read_table, write_table
+from .compact import PlayerIndex, group_codes
+from .utils import get_logger
+
+logger = get_logger("training_data")
+
+# Normalized training set instead of one wide promo x player-features table:
+#   train_players - one row per player: player_id, static attributes,
+#                   financial/risk features, one-hot columns
+#   train_promos  - one row per promo: player_idx (row in train_players),
+#                   promo_type (int8 dictionary codes), promo_timestamp,
+#                   engaged, plus any per-promo features (point-in-time mode)
+# Player features are stored once rather than once per promo; training
+# matrices gather player rows by player_idx, and inference reads
+# train_players directly.
+
+PROMO_KEYS = ['promo_type', 'promo_timestamp', 'engaged']
+
+class TrainingData:
+    def __init__(self, players, promos):
+        self.players = players.reset_index(drop=True)
+        self.promos = promos.reset_index(drop=True)
+        self.player_idx = self.promos['player_idx'].to_numpy(dtype=np.int32)
+
+    @classmethod
+    def from_frames(cls, players, promos, promo_features=None):
+        """
+        players: one row per player (with player_id); promos: player_id plus
+        PROMO_KEYS; promo_features: per-promo feature columns aligned with promos.
+        """
+        index = PlayerIndex.from_players(players)
+        facts = pd.DataFrame({'player_idx': index.encode(promos['player_id'])})
+        if (facts['player_idx'] < 0).any():
+            raise ValueError("Promos reference players missing from the player table")
+        for c in PROMO_KEYS:
+            facts[c] = promos[c].to_numpy()
+        facts['promo_type'] = facts['promo_type'].astype('category')
+        if promo_features is not None:
+            facts = pd.concat([facts, promo_features.reset_index(drop=True)], axis=1)
+        return cls(players, facts)
+
+    @classmethod
+    def load(cls):
+        return cls(read_table("train_players"), read_table("train_promos"))
+
+    def save(self):
+        write_table(self.players, "train_players")
+        write_table(self.promos, "train_promos")
+
+    def __len__(self):
+        return len(self.promos)
+
+    @property
+    def player_columns(self):
+        return [c for c in self.players.columns if c != 'player_id']
+
+    @property
+    def promo_feature_columns(self):
+        return [c for c in self.promos.columns if c not in PROMO_KEYS and c != 'player_idx']
+
+    @property
+    def columns(self):
+        """Columns of the equivalent wide table (the old train_data layout)."""
+        return ['player_id', *PROMO_KEYS, *self.player_columns, *self.promo_feature_columns]
+
+    def player_ids(self, rows=None):
+        idx = self.player_idx if rows is None else self.player_idx[rows]
+        return self.players['player_id'].to_numpy(dtype=object)[idx]
+
+    def groups(self):
+        """Per-promo player group labels, numbered in sorted player_id order (as group_codes)."""
+        return group_codes(self.players['player_id'])[self.player_idx]
+
+    def labels(self):
+        return self.promos['engaged'].to_numpy()
+
+    def gather(self, rows=None, columns=None):
+        """Wide frame for the given promo rows (default all), player columns gathered by index."""
+        columns = columns or self.columns
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        idx = self.player_idx[rows]
+        out = {}
+        for c in columns:
+            if c == 'player_id':
+                out[c] = self.player_ids(rows)
+            elif c in self.players.columns:
+                out[c] = self.players[c].take(idx).to_numpy()
+            else:
+                out[c] = self.promos[c].take(rows).to_numpy()
+        return pd.DataFrame(out)
+
+    def matrix(self, features, encode=None):
+        """
+        float64 (promos x features) training matrix. Player columns are
+        converted once per player and gathered by index, so no wide frame is
+        ever built; encode(column name, values) -> numbers for categoricals.
+        """
+        def numeric(col):
+            if encode is not None and col.dtype.name in ('category', 'object', 'str', 'string'):
+                return encode(col.name, col)
+            return col.to_numpy(dtype=np.float64)
+        
+        X = np.empty((len(self), len(features)), dtype=np.float64)
+        for j, f in enumerate(features):
+            if f in self.players.columns:
+                X[:, j] = numeric(self.players[f])[self.player_idx]
+            else:
+                X[:, j] = numeric(self.promos[f])
+        return X
+
+    def player_features(self):
+        """
+        One row per player for inference. Per-promo features (point-in-time
+        data) are taken from the player's first promo; NaN if they have none.
+        """
+        cols = self.promo_feature_columns
+        if not cols:
+            return self.players
+        first = self.promos.drop_duplicates('player_idx', keep='first')
+        extra = pd.DataFrame(np.nan, index=self.players.index, columns=cols)
+        extra.iloc[first['player_idx'].to_numpy()] = first[cols].to_numpy()
+        return pd.concat([self.players, extra], axis=1)
+
+    def memory_mb(self):
+        return (self.players.memory_usage(deep=True).sum() + self.promos.memory_usage(deep=True).sum()) / 1e6
+
+def load_player_features():
+    """TrainingData.player_features() from disk; the promo table is only read if it has per-promo features."""
+    if all(c in PROMO_KEYS or c == 'player_idx' for c in dataset("train_promos").schema.names):
+        return read_table("train_players")
+    return TrainingData.load().player_features()
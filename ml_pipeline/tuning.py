@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import tempfile
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from sklearn.model_selection import GroupKFold
+from sklearn.metrics import roc_auc_score
+from .utils import SEED, get_logger
+from .training_data import TrainingData
+from .models import HPARAMS_PATH, encode_training_data, make_model
+
+logger = get_logger("tuning")
+
+MAX_BINS = 255
+MISSING_BIN = 255 # uint8 code for NaN; value bins are 0..254
+
+# name -> ('log', low, high) or ('choice', options)
+SEARCH_SPACE = {
+    'learning_rate': ('log', 0.02, 0.3),
+    'l2_regularization': ('log', 1e-3, 10.0),
+    'max_depth': ('choice', [3, 4, 6, 8, None]),
+    'max_leaf_nodes': ('choice', [15, 31, 63]),
+    'min_samples_leaf': ('choice', [20, 50, 100, 200]),
+}
+
+def sample_candidates(n, rng):
+    candidates = []
+    for _ in range(n):
+        params = {}
+        for name, spec in SEARCH_SPACE.items():
+            if spec[0] == 'log':
+                params[name] = float(np.exp(rng.uniform(np.log(spec[1]), np.log(spec[2]))))
+            else:
+                params[name] = spec[1][int(rng.integers(len(spec[1])))]
+        candidates.append(params)
+    return candidates
+
+def bin_features(X, max_bins=MAX_BINS, sample=200000, seed=SEED):
+    """
+    Quantile-bins every column to uint8 codes once, up front.
+    HistGradientBoosting gives each distinct code its own bin, so candidates
+    fit on the codes see the same splits without re-binning raw floats,
+    and the shared matrix is 8x smaller than float64.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    rows = np.random.default_rng(seed).choice(len(X), min(len(X), sample), replace=False)
+    codes = np.empty(X.shape, dtype=np.uint8)
+    for j in range(X.shape[1]):
+        col = X[:, j]
+        sub = col[rows]
+        values = np.unique(sub[~np.isnan(sub)])
+        if len(values) <= max_bins:
+            edges = (values[:-1] + values[1:]) / 2
+        else:
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, max_bins + 1)[1:-1]))
+        codes[:, j] = np.searchsorted(edges, col, side='left')
+        codes[np.isnan(col), j] = MISSING_BIN
+    return codes
+
+def _decode(codes):
+    out = codes.astype(np.float64)
+    out[codes == MISSING_BIN] = np.nan
+    return out
+
+_SHARED = {}
+
+def _attach(x_path, y_path, splits, threads):
+    """Pool initializer: memory-maps the binned matrix once per worker."""
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=threads)
+    _SHARED.update(X=np.load(x_path, mmap_mode='r'), y=np.load(y_path, mmap_mode='r'), splits=splits)
+
+def _evaluate(job):
+    cand, params, n_iter, fold = job
+    X, y = _SHARED['X'], _SHARED['y']
+    train_idx, val_idx = _SHARED['splits'][fold]
+    # Fixed iteration count: boosting rounds are the budget being halved
+    model = make_model({**params, 'max_iter': n_iter, 'early_stopping': False})
+    model.fit(_decode(X[train_idx]), y[train_idx])
+    return cand, fold, roc_auc_score(y[val_idx], model.predict_proba(_decode(X[val_idx]))[:, 1])
+
+def successive_halving(X_binned, y, splits, candidates, min_iter=25, max_iter=300, eta=3,
+                       workers=None, budget=None):
+    """
+    Scores every surviving candidate on all player-grouped folds, keeps the
+    best 1/eta, multiplies their boosting rounds by eta and repeats.
+    Stops early when the wall-clock budget (seconds) runs out; the winner is
+    then taken from the highest rung any candidate completed.
+    """
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(candidates) * len(splits)))
+    threads = max(1, cores // workers)
+    deadline = time.perf_counter() + budget if budget else None
+
+    rungs, alive, n_iter = [], list(range(len(candidates))), min_iter
+    evaluations = 0
+    with tempfile.TemporaryDirectory(prefix="bpp_tune_") as tmp:
+        x_path, y_path = f"{tmp}/X.npy", f"{tmp}/y.npy"
+        np.save(x_path, X_binned)
+        np.save(y_path, np.asarray(y))
+        init = (x_path, y_path, splits, threads)
+
+        pool = Pool(workers, initializer=_attach, initargs=init) if workers > 1 else None
+        if pool is None:
+            _attach(*init)
+        try:
+            while True:
+                jobs = [(c, candidates[c], n_iter, f) for c in alive for f in range(len(splits))]
+                logger.info(f"Rung {len(rungs) + 1}: {len(alive)} candidates x {len(splits)} folds at {n_iter} iterations")
+
+                scores, out_of_time = {}, False
+                results = pool.imap_unordered(_evaluate, jobs) if pool else map(_evaluate, jobs)
+                for cand, fold, score in results:
+                    scores.setdefault(cand, []).append(score)
+                    evaluations += 1
+                    if deadline and time.perf_counter() > deadline:
+                        out_of_time = True
+                        break
+
+                done = {c: float(np.mean(s)) for c, s in scores.items() if len(s) == len(splits)}
+                if done:
+                    rungs.append({'n_iter': n_iter, 'scores': done})
+                if out_of_time:
+                    logger.warning(f"Budget of {budget}s exhausted during rung at {n_iter} iterations")
+                    break
+                if len(alive) <= 1 or n_iter >= max_iter:
+                    break
+                alive = sorted(done, key=done.get, reverse=True)[:max(1, len(alive) // eta)]
+                n_iter = min(n_iter * eta, max_iter)
+        finally:
+            if pool:
+                pool.terminate()
+
+    if not rungs:
+        raise RuntimeError("Tuning budget ran out before any candidate finished all folds")
+    return rungs, evaluations
+
+def tune(n_candidates=27, min_iter=25, max_iter=300, eta=3, folds=3, workers=None, budget=None, seed=SEED):
+    start = time.perf_counter()
+    data = TrainingData.load()
+    X, features, _ = encode_training_data(data)
+    y = data.labels()
+    splits = list(GroupKFold(n_splits=folds).split(X, y, data.groups()))
+
+    X_binned = bin_features(X, seed=seed)
+    del X
+    logger.info(f"Binned {X_binned.shape[0]} rows x {X_binned.shape[1]} features ({X_binned.nbytes / 1e6:.1f} MB)")
+
+    candidates = sample_candidates(n_candidates, np.random.default_rng(seed))
+    rungs, evaluations = successive_halving(
+        X_binned, y, splits, candidates, min_iter=min_iter, max_iter=max_iter, eta=eta,
+        workers=workers, budget=budget
+    )
+
+    top = rungs[-1]
+    best = max(top['scores'], key=top['scores'].get)
+    params = {**candidates[best], 'max_iter': top['n_iter'], 'early_stopping': False}
+    result = {
+        'params': params,
+        'cv_auc': top['scores'][best],
+        'folds': folds,
+        'tuned_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'search': {
+            'n_candidates': n_candidates, 'min_iter': min_iter, 'max_iter': max_iter, 'eta': eta,
+            'budget_seconds': budget, 'elapsed_seconds': time.perf_counter() - start,
+            'evaluations': evaluations,
+            'rungs': [{'n_iter': r['n_iter'], 'completed': len(r['scores']), 'best_auc': max(r['scores'].values())} for r in rungs],
+        },
+    }
+    with open(HPARAMS_PATH, 'w') as f:
+        json.dump(result, f, indent=2)
+    logger.info(f"Best CV AUC {result['cv_auc']:.4f} with {params}")
+    logger.info(f"Saved to {HPARAMS_PATH} ({evaluations} fold fits in {result['search']['elapsed_seconds']:.1f}s)")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive-halving search for the HistGradientBoosting settings")
+    parser.add_argument("--candidates", type=int, default=27)
+    parser.add_argument("--min-iter", type=int, default=25, help="Boosting rounds in the first rung")
+    parser.add_argument("--max-iter", type=int, default=300)
+    parser.add_argument("--eta", type=int, default=3, help="Keep 1/eta of candidates per rung")
+    parser.add_argument("--folds", type=int, default=3, help="Player-grouped folds per evaluation")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--budget", type=float, default=None, help="Wall-clock limit in seconds")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    tune(args.candidates, args.min_iter, args.max_iter, args.eta, args.folds, args.workers, args.budget, args.seed)
@@ -2,6 +2,8 @@ import os
 
 # --- Configuration ---
 DATA_DIR = "ml_pipeline/data"
+EVENTS_DIR = f"{DATA_DIR}/events" # Partitioned Parquet dataset
+FEATURE_STORE_DIR = f"{DATA_DIR}/feature_store"
 MODELS_DIR = "ml_pipeline/models"
 RESULTS_DIR = "ml_pipeline/results"
 PLOTS_DIR = "ml_pipeline/plots"
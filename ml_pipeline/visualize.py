@@ -1,39 +1,43 @@
-import pandas as pd
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import seaborn as sns
-from .utils import DATA_DIR, RESULTS_DIR, PLOTS_DIR, get_logger
+from .utils import PLOTS_DIR, get_logger
+from .report_cube import CUBE_PATH, UI_CUBE_PATH, BIN_WIDTH, ReportCube
+from .telemetry import timed
 
 logger = get_logger("visualize")
 
-def run_visualizations():
+@timed()
+def run_visualizations(cube=None):
     logger.info("Generating visualizations...")
     
-    # Load Data
-    crg_df = pd.read_csv(f"{RESULTS_DIR}/crg_analysis.csv")
-    players = pd.read_csv(f"{DATA_DIR}/players.csv")
-    
-    # Merge for segment info
-    merged = crg_df.merge(players[['player_id', 'value_segment']], on='player_id', how='left')
+    # Everything below is read off the pre-aggregated report cube (written by
+    # models during CRG validation), never the row-level results
+    if cube is None:
+        cube = ReportCube.load(CUBE_PATH)
     
     # 1. Risk Level Distribution
     plt.figure(figsize=(10, 6))
-    sns.countplot(data=merged, x='action', palette={'ALLOW': 'green', 'DOWNGRADE': 'orange', 'BLOCK': 'red'})
+    sns.barplot(data=cube.totals('action'), x='action', y='count', hue='action',
+                palette={'ALLOW': 'green', 'DOWNGRADE': 'orange', 'BLOCK': 'red'})
     plt.title("CRG Risk Action Distribution")
     plt.savefig(f"{PLOTS_DIR}/risk_distribution.png")
     plt.close()
     
     # 2. Risk by Segment
+    by_segment = cube.totals('segment', 'action')
+    by_segment = by_segment[by_segment.groupby('segment')['count'].transform('sum') > 0]
     plt.figure(figsize=(12, 6))
-    sns.countplot(data=merged, x='value_segment', hue='action', hue_order=['ALLOW', 'DOWNGRADE', 'BLOCK'])
+    sns.barplot(data=by_segment, x='segment', y='count', hue='action', hue_order=['ALLOW', 'DOWNGRADE', 'BLOCK'])
     plt.title("Risk Distribution by Segment")
     plt.savefig(f"{PLOTS_DIR}/risk_by_segment.png")
     plt.close()
     
     # 3. CRG Score Histogram
+    bins = cube.totals('score_bin')
     plt.figure(figsize=(10, 6))
-    sns.histplot(merged['crg_score'], bins=20, kde=True)
+    plt.bar(bins['score_bin'], bins['count'], width=BIN_WIDTH, align='edge', edgecolor='white')
     plt.axvline(x=40, color='orange', linestyle='--', label='Downgrade Threshold (40)')
     plt.axvline(x=60, color='red', linestyle='--', label='Block Threshold (60)')
     plt.legend()
@@ -41,6 +45,9 @@ def run_visualizations():
     plt.savefig(f"{PLOTS_DIR}/crg_score_histogram.png")
     plt.close()
     
+    # Same cube for the reports page
+    cube.save(UI_CUBE_PATH)
+    
     logger.info(f"Visualizations saved to {PLOTS_DIR}")
 
 if __name__ == "__main__":
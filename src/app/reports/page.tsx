@@ -3,12 +3,46 @@
 import { useState } from 'react';
 import {
     BarChart2, Download, Calendar, Filter, Users, DollarSign,
-    TrendingUp, Globe, FileText, ChevronDown
+    TrendingUp, Globe, FileText, ChevronDown, ShieldAlert
 } from 'lucide-react';
 import {
     BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer,
     LineChart, Line, PieChart, Pie, Cell
 } from 'recharts';
+import REPORT_CUBE from '@/data/report_cube.json';
+
+// --- CRG Report Cube ---
+// Pre-aggregated by the ML pipeline (segment x action x score bin x promo type),
+// so these rollups sum a few hundred cells however many players were scored.
+interface CubeCell {
+    segment: string;
+    action: string;
+    score_bin: number;
+    promo_type: string;
+    count: number;
+    crg_score_sum: number;
+    model_score_sum: number;
+}
+
+const CUBE_CELLS: CubeCell[] = REPORT_CUBE.cells;
+const RISK_ACTIONS = REPORT_CUBE.dims.action;
+const ACTION_COLORS: Record<string, string> = { ALLOW: '#4ade80', DOWNGRADE: '#F2D641', BLOCK: '#f87171' };
+
+// Counts per `key` value, one column per risk action
+const rollupByAction = (key: 'segment' | 'score_bin' | 'promo_type', values: (string | number)[]) =>
+    values.map(value => {
+        const row: Record<string, string | number> = { [key]: value };
+        RISK_ACTIONS.forEach(action => { row[action] = 0; });
+        CUBE_CELLS.filter(c => c[key] === value).forEach(c => { row[c.action] = (row[c.action] as number) + c.count; });
+        return row;
+    });
+
+const RISK_BY_SEGMENT = rollupByAction('segment', REPORT_CUBE.dims.segment)
+    .filter(row => RISK_ACTIONS.some(action => (row[action] as number) > 0));
+const CRG_SCORE_HISTOGRAM = rollupByAction('score_bin', REPORT_CUBE.dims.score_bin)
+    .map(row => ({ ...row, score_bin: `${row.score_bin}-${(row.score_bin as number) + REPORT_CUBE.bin_width}` }));
+const CRG_FLAGGED = CUBE_CELLS.filter(c => c.action !== 'ALLOW').reduce((n, c) => n + c.count, 0);
+const CRG_AVG_SCORE = REPORT_CUBE.rows ? CUBE_CELLS.reduce((n, c) => n + c.crg_score_sum, 0) / REPORT_CUBE.rows : 0;
 
 // --- Mock Data ---
 const MARKET_PERFORMANCE = [
@@ -146,6 +180,54 @@ export default function ReportsPage() {
                     </div>
                 </div>
 
+                {/* CRG Risk by Segment */}
+                <div className="glass-panel chart-card col-span-2">
+                    <div className="card-header">
+                        <h3>CRG Risk Actions by Segment</h3>
+                        <div className="card-meta">
+                            <ShieldAlert size={14} />
+                            <span>{CRG_FLAGGED.toLocaleString()} of {REPORT_CUBE.rows.toLocaleString()} offers flagged · avg CRG {CRG_AVG_SCORE.toFixed(1)}</span>
+                        </div>
+                    </div>
+                    <div className="chart-area">
+                        <ResponsiveContainer width="100%" height="100%">
+                            <BarChart data={RISK_BY_SEGMENT} margin={{ top: 20, right: 30, left: 20, bottom: 5 }}>
+                                <CartesianGrid strokeDasharray="3 3" stroke="rgba(255,255,255,0.05)" vertical={false} />
+                                <XAxis dataKey="segment" axisLine={false} tickLine={false} tick={{ fill: '#94a3b8', fontSize: 12 }} />
+                                <YAxis axisLine={false} tickLine={false} tick={{ fill: '#94a3b8', fontSize: 12 }} />
+                                <Tooltip
+                                    contentStyle={{ backgroundColor: '#0f172a', border: '1px solid rgba(255,255,255,0.1)', borderRadius: '8px' }}
+                                    cursor={{ fill: 'rgba(255,255,255,0.05)' }}
+                                />
+                                <Legend />
+                                {RISK_ACTIONS.map(action => (
+                                    <Bar key={action} dataKey={action} stackId="risk" fill={ACTION_COLORS[action]} barSize={40} />
+                                ))}
+                            </BarChart>
+                        </ResponsiveContainer>
+                    </div>
+                </div>
+
+                {/* CRG Score Distribution */}
+                <div className="glass-panel chart-card col-span-1">
+                    <div className="card-header">
+                        <h3>CRG Score Distribution</h3>
+                    </div>
+                    <div className="chart-area">
+                        <ResponsiveContainer width="100%" height="100%">
+                            <BarChart data={CRG_SCORE_HISTOGRAM} margin={{ top: 20, right: 10, left: 0, bottom: 5 }}>
+                                <CartesianGrid strokeDasharray="3 3" stroke="rgba(255,255,255,0.05)" vertical={false} />
+                                <XAxis dataKey="score_bin" axisLine={false} tickLine={false} tick={{ fill: '#94a3b8', fontSize: 10 }} />
+                                <YAxis axisLine={false} tickLine={false} tick={{ fill: '#94a3b8', fontSize: 12 }} />
+                                <Tooltip contentStyle={{ backgroundColor: '#0f172a', border: 'none', borderRadius: '8px' }} />
+                                {RISK_ACTIONS.map(action => (
+                                    <Bar key={action} dataKey={action} stackId="score" fill={ACTION_COLORS[action]} />
+                                ))}
+                            </BarChart>
+                        </ResponsiveContainer>
+                    </div>
+                </div>
+
                 {/* Daily Trends */}
                 <div className="glass-panel chart-card col-span-3">
                     <div className="card-header">
@@ -234,6 +316,7 @@ export default function ReportsPage() {
         .chart-card { padding: 24px; display: flex; flex-direction: column; }
         .card-header { display: flex; justify-content: space-between; margin-bottom: 24px; }
         .card-header h3 { margin: 0; font-size: 16px; font-weight: 600; }
+        .card-meta { display: flex; align-items: center; gap: 6px; font-size: 12px; color: var(--color-text-secondary); }
         
         .icon-btn { background: transparent; border: 1px solid rgba(255,255,255,0.1); color: var(--color-text-secondary); padding: 6px; border-radius: 6px; cursor: pointer; }
         